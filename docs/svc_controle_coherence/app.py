@@ -1,19 +1,21 @@
 from flask import Flask, current_app
-from flask import request, jsonify, send_file
+from flask import request, jsonify, send_file, Response, stream_with_context
 from flask_swagger_ui import get_swaggerui_blueprint
-from controle_coherence.validation import procedure_validation, procedure_validation_audit
+from controle_coherence.validation import load_xml_data, validation_xml_data
+from controle_coherence.worker_pool import ValidationWorkerPool, QueueFull
+from controle_coherence.report_cache import get_report_cache, report_cache_key
 from controle_coherence.controle_coherence import EngineDPE, EngineAudit
 from controle_coherence import __version_dpe__, __xsdversion__, __xsdversion_audit__, __version_audit__, __svc_version__,__version_global__
 from controle_coherence.utils import _set_version_audit_to_valid_dates,_set_version_dpe_to_valid_dates, traduction_xml_inplace as traduction_xml_func, traduction_xml_new_element
-from controle_coherence.utils_convert_excel import traduction_xml_excel, cleanup_excel_folder
+from controle_coherence.utils_convert_excel import traduction_xml_excel_buffer
+from controle_coherence.export_jobs import ExportJobStore, get_export_workers, get_export_queue_size, \
+    get_export_store_max_bytes
+from controle_coherence.batch import iter_batch_documents, run_batch, iter_ndjson
 from pathlib import Path
-import json
-import lxml
 from lxml import etree
 from waitress import serve
 import traceback as tb
 import logging
-import time
 import os
 import sys
 import io
@@ -47,112 +49,83 @@ if DISABLE_DATE_RESTRICTION == 1:
 if len(sys.argv) > 2:
     delat_t_delete = int(sys.argv[2])
 else:
-    delat_t_delete = int(os.environ.get("delat_t_delete", 3600))  # une heure par défaut
+    delat_t_delete = int(os.environ.get("delat_t_delete", 3600))  # durée de conservation des exports excel asynchrones, une heure par défaut
+
+# mode multi-process : nombre de workers (0 : contrôles exécutés dans les threads waitress) et taille de la file d'attente
+if len(sys.argv) > 3:
+    nb_workers = int(sys.argv[3])
+else:
+    nb_workers = int(os.environ.get("NB_WORKERS", 0))
+
+if len(sys.argv) > 4:
+    queue_size = int(sys.argv[4])
+else:
+    queue_size = int(os.environ.get("QUEUE_SIZE", 2 * nb_workers))
+
+retry_after = int(os.environ.get("RETRY_AFTER", 1))  # secondes, en-tête Retry-After des réponses 503
+
+# threads waitress : en mode multi-process, assez pour occuper tous les workers et remplir la file d'attente (au-delà
+# QueueFull et réponse 503) en gardant des threads libres pour les autres routes
+nb_threads = int(os.environ.get("NB_THREADS", nb_workers + queue_size + 4 if nb_workers > 0 else 4))
+
+# pool de workers créé au démarrage du service (before_serve)
+validation_pool = None
+
+# exports excel asynchrones créés au démarrage du service (before_serve)
+export_jobs = None
+
+# cache des rapports (variables d'environnement OBS_DPE_REPORT_CACHE_*)
+report_cache = get_report_cache()
 
 excel_folder = Path('excel_folder')
 excel_folder.mkdir(exist_ok=True, parents=True)
 
 
 def load_xml_object(request,recover_parse=False):
+    return load_xml_data(request.data, recover_parse=recover_parse)
 
 
-    error = None
-    xml_tree = None
-    if request.data:
-
-        try:
-            if recover_parse is False:
-                xml_tree = etree.ElementTree(etree.fromstring(request.data))
-            else:
-                parser = lxml.etree.XMLParser(recover=True)
-                xml_tree = etree.ElementTree(etree.fromstring(request.data,parser=parser))
-        except Exception:
-            error = f"""
-impossible de lire le fichier xml envoyé de taille : {len(request.data)}.' 
-Extrait du fichier :
-{request.data[0:100]}
-"""
-    else:
-        error = 'no data provided'
-    return xml_tree, error
+def run_validation(data, dispositif, route, debug=False, datetime_now=None, block=False):
+    """
+    contrôle de cohérence dans un worker du pool si le service tourne en mode multi-process, sinon dans le thread.
+    les rapports sont mis en cache par contenu du xml, route et jour de contrôle (un xml resoumis n'est pas recontrôlé).
+    """
+    def compute():
+        if validation_pool is None:
+            return validation_xml_data(data, dispositif, debug, datetime_now)
+        return validation_pool.run(validation_xml_data, data, dispositif, debug, datetime_now, block=block)
 
+    if report_cache is None or not data:
+        return compute()
+    key = report_cache_key(data, route, debug=debug, datetime_now=datetime_now)
+    # seuls les rapports sont mis en cache, pas les xml illisibles ni les erreurs internes
+    return report_cache.get_or_compute(key, compute, cacheable=lambda result: result[0] == 200)
 
-def run_procedure_validation(request, debug=False,datetime_now=None):
-    try:
-        # charger xml
-        logger.debug('requête reçue par le service controle_coherence : traitement du xml en cours')
-        tstart = time.time()
-        xml_tree, error = load_xml_object(request)
-        if error is not None:
-            logger.warning(error)
-            return error, 400
 
-        try:  # procedure de validation
-            resp = procedure_validation(xml_tree, debug=debug,datetime_now=datetime_now)
-            resp.update({"xsd_version": __xsdversion__,
-                         'moteur_coherence_version': __version_dpe__})
-        except Exception as e:
-            msg = f"""ERREUR INTERNE DU MOTEUR DE CONTROLE DE COHERENCE
-    {tb.format_exc()}
-            """
-            logger.error(msg)
-            return msg, 500
-
-        nb_errors = len(resp['erreur_logiciel']) + len(resp['erreur_saisie'])
-        if nb_errors > 0:
-            logger.debug(f"le fichier xml comporte {nb_errors} erreurs relevées par les controles de cohérences et n'est pas valide")
-        if resp['validation_xsd']['valid'] is False:
-            logger.debug(f"le fichier xml comporte des erreurs de validation xsd")
-        if resp['validation_xsd']['valid'] is True and nb_errors == 0:
-            logger.debug(f"le fichier xml a passé tous les contrôles avec succès et est valide pour dépot.")
-        logger.debug(f'traitement du xml terminé en {(time.time() - tstart) * 1000} ms')
+def run_procedure_validation_dispositif(request, dispositif, debug=False, datetime_now=None):
+    try:
+        status, resp = run_validation(request.data, dispositif, request.endpoint, debug=debug,
+                                      datetime_now=datetime_now)
+    except QueueFull:
+        logger.warning('file d\'attente des workers pleine : requête refusée')
+        return 'service surchargé, réessayer plus tard', 503, {'Retry-After': str(retry_after)}
     except Exception as e:
         msg = f"""ERREUR INTERNE DU MOTEUR DE CONTROLE DE COHERENCE
         {tb.format_exc()}
                 """
         logger.error(msg)
         return msg, 500
-
+    if status != 200:
+        return resp, status
     return jsonify(resp), 200
 
 
-def run_procedure_validation_audit(request, debug=False,datetime_now=None):
-    try:
-        # charger xml
-        logger.debug('requête reçue par le service controle_coherence : traitement du xml en cours')
-        tstart = time.time()
-        xml_tree, error = load_xml_object(request)
-        if error is not None:
-            logger.warning(error)
-            return error, 400
+def run_procedure_validation(request, debug=False,datetime_now=None):
+    return run_procedure_validation_dispositif(request, 'dpe', debug=debug, datetime_now=datetime_now)
 
-        try:  # procedure de validation
-            resp = procedure_validation_audit(xml_tree, debug=debug,datetime_now=datetime_now)
-            resp.update({"xsd_version_audit": __xsdversion_audit__,
-                         'controle_coherence_audit_version': __version_audit__})
-        except Exception as e:
-            msg = f"""ERREUR INTERNE DU MOTEUR DE CONTROLE DE COHERENCE
-    {tb.format_exc()}
-            """
-            logger.error(msg)
-            return msg, 500
-
-        nb_errors = len(resp['erreur_logiciel']) + len(resp['erreur_saisie'])
-        if nb_errors > 0:
-            logger.debug(f"le fichier xml comporte {nb_errors} erreurs relevées par les controles de cohérences et n'est pas valide")
-        if resp['validation_xsd']['valid'] is False:
-            logger.debug(f"le fichier xml comporte des erreurs de validation xsd")
-        if resp['validation_xsd']['valid'] is True and nb_errors == 0:
-            logger.debug(f"le fichier xml a passé tous les contrôles avec succès et est valide pour dépot.")
-        logger.debug(f'traitement du xml terminé en {(time.time() - tstart) * 1000} ms')
-    except Exception as e:
-        msg = f"""ERREUR INTERNE DU MOTEUR DE CONTROLE DE COHERENCE
-        {tb.format_exc()}
-                """
-        logger.error(msg)
-        return msg, 500
 
-    return jsonify(resp), 200
+def run_procedure_validation_audit(request, debug=False,datetime_now=None):
+    return run_procedure_validation_dispositif(request, 'audit', debug=debug, datetime_now=datetime_now)
 
 
 SWAGGER_URL = '/ui'
@@ -204,28 +177,30 @@ def traduction_xml_no_enum():
     return etree.tostring(dpe, pretty_print=True, encoding='utf-8').decode(), 200
 
 
+def get_numero_xml(xml):
+    numero_xml = xml.find('numero_dpe')
+    if numero_xml is None:
+        numero_xml = xml.find('numero_audit')
+    if numero_xml is None:
+        return None
+    return numero_xml.text
+
+
+NUMERO_XML_ERROR = "le xml fourni n'a pas de numéro de DPE ou de numéro d'audit. Ceci n'est pas un xml valide pour le traducteur xml"
+
+
 @app.route("/traduction_xml_to_excel_audit", methods=['POST'])
 @app.route("/traduction_xml_to_excel_dpe", methods=['POST'])
 def traduction_xml_to_excel_dpe():
     try:
         xml, error = load_xml_object(request,recover_parse=True)
-        numero_xml = xml.find('numero_dpe')
-        if numero_xml is None:
-            numero_xml = xml.find('numero_audit')
+        numero_xml = get_numero_xml(xml)
 
         if numero_xml is None:
-            error = "le xml fourni n'a pas de numéro de DPE ou de numéro d'audit. Ceci n'est pas un xml valide pour le traducteur xml"
-            logger.warning(error)
-            return error, 400
-        else:
-            numero_xml=numero_xml.text
-        file_path = traduction_xml_excel(xml, excel_folder)
-        return_data = io.BytesIO()
-        with open(file_path, 'rb') as fo:
-            return_data.write(fo.read())
-        # (after writing, cursor will be at last byte, so move it to start)
-        return_data.seek(0)
-        os.remove(file_path)
+            logger.warning(NUMERO_XML_ERROR)
+            return NUMERO_XML_ERROR, 400
+        # xlsx écrit dans un tampon propre à la requête, envoyé par morceaux puis fermé par send_file
+        return_data = traduction_xml_excel_buffer(xml)
 
         return send_file(return_data, mimetype='application/vnd.ms-excel',
                          download_name=f'{numero_xml}.xlsx', as_attachment=True)
@@ -235,8 +210,53 @@ def traduction_xml_to_excel_dpe():
                 """
         logger.error(msg)
         return msg, 500
-    finally:
-        cleanup_excel_folder(excel_folder, delat_t_delete=delat_t_delete)
+
+
+@app.route("/traduction_xml_to_excel_audit_async", methods=['POST'])
+@app.route("/traduction_xml_to_excel_dpe_async", methods=['POST'])
+def traduction_xml_to_excel_async():
+    # l'export est construit en arrière-plan, le résultat est récupéré sur /jobs/<job_id>
+    if export_jobs is None:
+        return 'exports excel asynchrones désactivés', 503
+    try:
+        xml, error = load_xml_object(request, recover_parse=True)
+        if error is not None:
+            return error, 400
+        numero_xml = get_numero_xml(xml)
+        if numero_xml is None:
+            logger.warning(NUMERO_XML_ERROR)
+            return NUMERO_XML_ERROR, 400
+        job = export_jobs.submit(request.data, numero_xml)
+    except QueueFull:
+        logger.warning('file d\'attente des exports excel pleine : requête refusée')
+        return 'service surchargé, réessayer plus tard', 503, {'Retry-After': str(retry_after)}
+    except Exception as e:
+        msg = f"""ERREUR INTERNE DU MOTEUR DE CONTROLE DE COHERENCE
+        {tb.format_exc()}
+                """
+        logger.error(msg)
+        return msg, 500
+    return jsonify(job.as_dict()), 202, {'Location': f'/jobs/{job.job_id}'}
+
+
+@app.route("/jobs/<job_id>", methods=['get'])
+def get_job(job_id):
+    job, file = export_jobs.open_export(job_id) if export_jobs is not None else (None, None)
+    if job is None:
+        return f'export {job_id} inconnu ou expiré', 404
+    if file is not None:
+        return send_file(file, mimetype='application/vnd.ms-excel',
+                         download_name=f'{job.numero_xml}.xlsx', as_attachment=True)
+    if job.status == 'erreur':
+        return jsonify(job.as_dict()), 500
+    return jsonify(job.as_dict()), 202
+
+
+@app.route("/jobs", methods=['get'])
+def jobs_stats():
+    if export_jobs is None:
+        return jsonify(msg={"enabled": False})
+    return jsonify(msg={"enabled": True, **export_jobs.stats()})
 
 
 @app.route("/controle_coherence", methods=['POST'])
@@ -257,6 +277,23 @@ def controle_coherence_audit():
 def controle_coherence_audit_test_1_janvier_2026():
     return run_procedure_validation_audit(request,datetime_now='2026-01-01')
 
+@app.route("/controle_coherence_batch", methods=['POST'])
+def controle_coherence_batch():
+    # fichiers xml (DPE ou audit) et/ou archives zip en multipart, ou une archive zip en corps de requête
+    if request.files:
+        files = [(file.filename, file.stream) for _, file in request.files.items(multi=True)]
+    elif request.data:
+        files = [('batch', io.BytesIO(request.data))]
+    else:
+        return 'no data provided', 400
+    logger.debug(f'requête batch reçue par le service controle_coherence : {len(files)} fichier(s)')
+    # en mode multi-process les documents du lot attendent une place dans la file des workers
+    lines = run_batch(iter_batch_documents(files),
+                      validation=lambda data, datetime_now: run_validation(data, None, 'controle_coherence_batch',
+                                                                           datetime_now=datetime_now, block=True))
+    return Response(stream_with_context(iter_ndjson(lines)), mimetype='application/x-ndjson')
+
+
 @app.route("/controle_coherence_debug", methods=['POST'])
 def controle_coherence_debug():
     return run_procedure_validation(request, debug=True)
@@ -267,13 +304,17 @@ def health():
     return jsonify(msg={"status": "up"})
 
 
+@app.route("/report_cache", methods=['get'])
+def report_cache_stats():
+    if report_cache is None:
+        return jsonify(msg={"enabled": False})
+    return jsonify(msg={"enabled": True, **report_cache.stats()})
+
+
 @app.route("/clean_house", methods=['get'])
 def clean_house():
-    count = 0
-    for a_file in Path('.').iterdir():
-        if a_file.name.endswith('.xlsx'):
-            a_file.unlink()
-            count += 1
+    # suppression des exports excel asynchrones expirés
+    count = export_jobs.evict_expired() if export_jobs is not None else 0
     return f"house cleaned {count} file removed", 200
 
 
@@ -288,7 +329,19 @@ def version():
                         'global_version': __version_global__})
 
 def before_serve(app):
+    global validation_pool, export_jobs
+
+    if nb_workers > 0:
+        validation_pool = ValidationWorkerPool(nb_workers, queue_size)
+        logger.info(f'mode multi-process : {nb_workers} workers, file d\'attente de {queue_size} requêtes, '
+                    f'{nb_threads} threads')
 
+    export_workers = get_export_workers()
+    if export_workers > 0:
+        # exports conservés dans excel_folder/jobs, vidé au démarrage
+        export_jobs = ExportJobStore(excel_folder / 'jobs', ValidationWorkerPool(export_workers, get_export_queue_size()),
+                                     max_bytes=get_export_store_max_bytes(), ttl=delat_t_delete)
+        logger.info(f'exports excel asynchrones : {export_workers} workers')
 
     logger.info(f"OS: {os_name} {os_version}")
     logger.info(f'version globale du dépôt observatoire dpe : {__version_global__}')
@@ -304,4 +357,4 @@ def before_serve(app):
 if __name__ == "__main__":
     from waitress import serve
 
-    serve(before_serve(app), host="0.0.0.0", port=5000)
+    serve(before_serve(app), host="0.0.0.0", port=5000, threads=nb_threads)
@@ -0,0 +1,80 @@
+from datetime import datetime
+from functools import lru_cache
+
+
+@lru_cache(maxsize=256)
+def parse_date(date_txt):
+    return datetime.fromisoformat(date_txt)
+
+
+class ArreteReseauChaleur:
+    """
+    arrêté réseau de chaleur de arrete_reseau_chaleur.json et identifiants des réseaux de sa table de valeur.
+
+    les dates sont lues dans l'entrée de l'arrêté et converties une seule fois par texte de date.
+    """
+    __slots__ = ('arrete', 'identifiants_reseaux')
+
+    def __init__(self, arrete, identifiants_reseaux):
+        """
+        :param arrete: entrée de arrete_reseau_chaleur.json
+        :param identifiants_reseaux: identifiants des réseaux de la table de valeur de l'arrêté (None si la table n'a
+        pas de colonne identifiant_reseau)
+        """
+        self.arrete = arrete
+        self.identifiants_reseaux = identifiants_reseaux
+
+    @property
+    def date_arrete_txt(self):
+        return self.arrete['date_arrete_reseau_chaleur']
+
+    @property
+    def date_arrete(self):
+        return parse_date(self.arrete['date_arrete_reseau_chaleur'])
+
+    @property
+    def date_fin_txt(self):
+        return self.arrete['date_fin']
+
+    @property
+    def date_fin(self):
+        return parse_date(self.arrete['date_fin'])
+
+    @property
+    def date_application(self):
+        return parse_date(self.arrete['date_application_arrete'])
+
+
+class ArreteReseauChaleurIndex:
+    """
+    arrêtés réseau de chaleur indexés par date d'arrêté, construits au chargement du moteur.
+
+    remplace dans controle_coherence_reseau_chaleur la recherche linéaire de l'arrêté, les conversions de dates et la
+    liste des identifiants réseaux recalculée depuis la table de valeur pour chaque réseau déclaré.
+    """
+
+    def __init__(self, arretes, valeur_table):
+        """
+        :param arretes: contenu de arrete_reseau_chaleur.json (liste ordonnée des arrêtés, le dernier est en vigueur)
+        :param valeur_table: dict nom de table -> DataFrame des tables de valeurs
+        """
+        self.arretes = list()
+        for arrete in arretes:
+            if arrete['nom_table_valeur'] not in valeur_table:
+                raise ValueError(f"table de valeur {arrete['nom_table_valeur']} de l'arrêté réseau de chaleur "
+                                 f"{arrete['date_arrete_reseau_chaleur']} absente des tables de valeurs")
+            tv_reseau = valeur_table[arrete['nom_table_valeur']]
+            identifiants_reseaux = None
+            if 'identifiant_reseau' in tv_reseau:
+                identifiants_reseaux = frozenset(tv_reseau.identifiant_reseau.unique().tolist())
+            self.arretes.append(ArreteReseauChaleur(arrete, identifiants_reseaux))
+        self.by_date = dict()
+        for arrete in self.arretes:
+            # en cas de doublon la première entrée est retenue, comme lors de la recherche linéaire
+            self.by_date.setdefault(arrete.date_arrete_txt, arrete)
+        self.all_dates_txt = [arrete.date_arrete_txt for arrete in self.arretes]
+        self.latest = self.arretes[-1]
+
+    def get(self, date_arrete_txt):
+        """arrêté de date date_arrete_txt (format iso), None si la date n'est pas une date d'arrêté."""
+        return self.by_date.get(date_arrete_txt)
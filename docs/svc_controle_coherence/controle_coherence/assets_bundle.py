@@ -0,0 +1,119 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+# bundle binaire précompilé des tables excel et json du modèle de données.
+# la lecture des xlsx par openpyxl domine le temps de démarrage du moteur : le bundle est construit une fois
+# (étape de build) puis chargé en quelques millisecondes au démarrage. Il porte une empreinte des fichiers sources
+# et n'est utilisé que s'il correspond exactement aux sources présentes dans modele_donnee.
+
+BUNDLE_FORMAT_VERSION = 1
+
+BUNDLE_FILE_NAME = 'controle_coherence_assets.pkl'
+
+# fichiers sources compilés dans le bundle : nom du fichier -> type de lecture
+BUNDLE_SOURCES = {'valeur_tables.xlsx': 'excel',
+                  'enum_tables.xlsx': 'excel',
+                  'enum_tables_audit.xlsx': 'excel',
+                  'seuils_petites_surfaces.json': 'json',
+                  'arrete_reseau_chaleur.json': 'json',
+                  }
+
+logger = logging.getLogger(__name__)
+
+
+def get_bundle_path(mdd_path):
+    """
+    chemin du bundle : variable d'environnement OBS_DPE_ASSETS_BUNDLE sinon à côté des sources dans modele_donnee.
+    """
+    bundle_path = os.getenv('OBS_DPE_ASSETS_BUNDLE')
+    if bundle_path is not None:
+        return Path(bundle_path)
+    return Path(mdd_path) / BUNDLE_FILE_NAME
+
+
+def compute_sources_checksum(mdd_path):
+    """
+    empreinte sha256 des fichiers sources du bundle (nom + contenu).
+    la version du format et la version de pandas sont incluses car le bundle contient des DataFrames picklés.
+    """
+    mdd_path = Path(mdd_path)
+    h = hashlib.sha256()
+    h.update(f'format={BUNDLE_FORMAT_VERSION};pandas={pd.__version__}'.encode())
+    for file_name in BUNDLE_SOURCES:
+        h.update(file_name.encode())
+        h.update((mdd_path / file_name).read_bytes())
+    return h.hexdigest()
+
+
+def read_source(mdd_path, file_name):
+    """
+    lecture d'un fichier source depuis modele_donnee (chemin lent utilisé pour construire le bundle ou en repli).
+    """
+    path = Path(mdd_path) / file_name
+    if BUNDLE_SOURCES[file_name] == 'excel':
+        return pd.read_excel(path, sheet_name=None)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def build_assets_bundle(mdd_path, bundle_path=None):
+    """
+    compile l'ensemble des sources dans un bundle binaire versionné.
+
+    :param mdd_path: dossier modele_donnee contenant les sources
+    :param bundle_path: chemin du bundle à écrire (par défaut get_bundle_path(mdd_path))
+    :return: chemin du bundle écrit
+    """
+    if bundle_path is None:
+        bundle_path = get_bundle_path(mdd_path)
+    bundle_path = Path(bundle_path)
+    bundle = {'format_version': BUNDLE_FORMAT_VERSION,
+              'checksum': compute_sources_checksum(mdd_path),
+              'sources': {file_name: read_source(mdd_path, file_name) for file_name in BUNDLE_SOURCES}}
+
+    # écriture atomique pour ne jamais exposer un bundle partiel à un worker qui démarre
+    tmp_path = bundle_path.with_name(bundle_path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(bundle, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, bundle_path)
+    return bundle_path
+
+
+def load_assets_bundle(mdd_path, bundle_path=None):
+    """
+    charge le bundle s'il existe et correspond aux sources actuelles.
+
+    :return: dict nom du fichier source -> contenu, ou None si le bundle est absent, illisible ou périmé.
+    """
+    if bundle_path is None:
+        bundle_path = get_bundle_path(mdd_path)
+    bundle_path = Path(bundle_path)
+    if not bundle_path.is_file():
+        return None
+    try:
+        checksum = compute_sources_checksum(mdd_path)
+        with open(bundle_path, 'rb') as f:
+            bundle = pickle.load(f)
+    except Exception as e:
+        logger.warning(f'bundle des tables {bundle_path} illisible, lecture des sources excel : {e}')
+        return None
+    if bundle.get('format_version') != BUNDLE_FORMAT_VERSION or bundle.get('checksum') != checksum:
+        logger.warning(f'bundle des tables {bundle_path} périmé, lecture des sources excel')
+        return None
+    return bundle['sources']
+
+
+if __name__ == '__main__':
+    # étape de build : python -m controle_coherence.assets_bundle [chemin modele_donnee] [chemin bundle]
+    from controle_coherence.controle_coherence import CoreEngine
+
+    mdd_path = Path(sys.argv[1]) if len(sys.argv) > 1 else CoreEngine.mdd_path
+    bundle_path = Path(sys.argv[2]) if len(sys.argv) > 2 else None
+    print(f'bundle des tables écrit : {build_assets_bundle(mdd_path, bundle_path)}')
@@ -0,0 +1,119 @@
+from controle_coherence.document_index import DocumentIndex
+
+_UNSET = object()
+
+
+class AuditEtape:
+    """
+    étape d'un scénario de l'audit (un logement de logement_collection et sa caracteristique_generale).
+
+    les identifiants sont lus dans le xml à la demande, les éléments et valeurs dérivés (classes, gains, sortie) sont
+    recherchés et convertis une seule fois puis partagés entre les contrôles de l'audit.
+    """
+    __slots__ = ('caracteristique_generale', 'logement', 'enum_scenario_id', 'enum_etape_id', '_etape_travaux', '_memo')
+
+    def __init__(self, caracteristique_generale):
+        self.caracteristique_generale = caracteristique_generale
+        self.logement = caracteristique_generale.getparent()
+        self.enum_scenario_id = caracteristique_generale.find('enum_scenario_id')
+        self.enum_etape_id = caracteristique_generale.find('enum_etape_id')
+        self._etape_travaux = _UNSET
+        self._memo = dict()
+
+    @property
+    def scenario_id(self):
+        return self.enum_scenario_id.text
+
+    @property
+    def etape_id(self):
+        return self.enum_etape_id.text
+
+    @property
+    def etape_travaux(self):
+        if self._etape_travaux is _UNSET:
+            self._etape_travaux = self.logement.find('etape_travaux')
+        return self._etape_travaux
+
+    def _get(self, key, compute):
+        try:
+            return self._memo[key]
+        except KeyError:
+            value = compute()
+            self._memo[key] = value
+            return value
+
+    @property
+    def classe_bilan_dpe(self):
+        """classe_bilan_dpe du logement (élément)."""
+        return self._get('classe_bilan_dpe', lambda: self.logement.find('.//classe_bilan_dpe'))
+
+    @property
+    def classe_bilan_dpe_etape_travaux(self):
+        """classe_bilan_dpe de etape_travaux (élément), etape_travaux doit exister."""
+        return self._get('classe_bilan_dpe_etape_travaux', lambda: self.etape_travaux.find('classe_bilan_dpe'))
+
+    @property
+    def lot_travaux(self):
+        """éléments enum_lot_travaux_audit_id de etape_travaux, etape_travaux doit exister."""
+        return self._get('lot_travaux', lambda: list(self.etape_travaux.iterfind('*//enum_lot_travaux_audit_id')))
+
+    @property
+    def emission_ges_5_usages_m2(self):
+        """emission_ges_5_usages_m2 de la sortie du logement."""
+        return self._get('emission_ges_5_usages_m2', lambda: float(
+            self.logement.find('sortie').find('emission_ges').find('emission_ges_5_usages_m2').text))
+
+    def etape_travaux_element(self, name):
+        """élément name de etape_travaux (gains, coûts...), etape_travaux doit exister."""
+        return self._get(('element', name), lambda: self.etape_travaux.find(name))
+
+    def etape_travaux_value(self, name):
+        """valeur numérique de l'élément name de etape_travaux, etape_travaux doit exister."""
+        return self._get(('value', name), lambda: float(self.etape_travaux_element(name).text))
+
+
+class AuditGraph:
+    """
+    scénarios et étapes d'un audit construits une fois par audit et partagés par les contrôles de niveau audit.
+
+    - etapes : étapes dans l'ordre du document
+    - etapes_by_scenario_etape() : (enum_scenario_id, enum_etape_id) -> étapes, dans l'ordre de première apparition
+    - etapes_by_scenario() : enum_scenario_id -> étapes du scénario dans l'ordre du document
+    """
+    __slots__ = ('etapes', '_etapes_by_scenario_etape', '_etapes_by_scenario')
+
+    def __init__(self, audit, index):
+        self.etapes = [AuditEtape(caracteristique_generale)
+                       for caracteristique_generale in index.iterfind(audit, '*//caracteristique_generale')]
+        self._etapes_by_scenario_etape = None
+        self._etapes_by_scenario = None
+
+    def etapes_by_scenario_etape(self):
+        if self._etapes_by_scenario_etape is None:
+            etapes_by_scenario_etape = dict()
+            for etape in self.etapes:
+                etapes_by_scenario_etape.setdefault((etape.scenario_id, etape.etape_id), list()).append(etape)
+            self._etapes_by_scenario_etape = etapes_by_scenario_etape
+        return self._etapes_by_scenario_etape
+
+    def etapes_by_scenario(self):
+        if self._etapes_by_scenario is None:
+            etapes_by_scenario = dict()
+            for etape in self.etapes:
+                etapes_by_scenario.setdefault(etape.scenario_id, list()).append(etape)
+            self._etapes_by_scenario = etapes_by_scenario
+        return self._etapes_by_scenario
+
+
+def get_audit_graph(audit, index):
+    """
+    graphe des scénarios de l'audit : construit une seule fois lorsque l'index du document est partagé par les
+    contrôles, reconstruit à chaque appel sinon (document éventuellement modifié entre deux appels directs).
+    """
+    if isinstance(index, DocumentIndex):
+        graph = index.cache.get(AuditGraph)
+        if graph is None:
+            graph = AuditGraph(audit, index)
+            index.cache[AuditGraph] = graph
+        return graph
+    return AuditGraph(audit, index)
@@ -0,0 +1,126 @@
+import json
+import logging
+import os
+import traceback as tb
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from controle_coherence.validation import validation_xml_data
+
+logger = logging.getLogger(__name__)
+
+
+def get_batch_workers():
+    """nombre de documents contrôlés en parallèle par requête batch : variable d'environnement OBS_DPE_BATCH_WORKERS."""
+    return int(os.getenv('OBS_DPE_BATCH_WORKERS', 4))
+
+
+def get_batch_max_in_flight():
+    """
+    nombre maximal de documents lus et en attente de contrôle par requête batch : variable d'environnement
+    OBS_DPE_BATCH_MAX_IN_FLIGHT (par défaut deux fois le nombre de workers).
+    """
+    return int(os.getenv('OBS_DPE_BATCH_MAX_IN_FLIGHT', 2 * get_batch_workers()))
+
+
+def is_zip(fileobj):
+    position = fileobj.tell()
+    is_zip_file = zipfile.is_zipfile(fileobj)
+    fileobj.seek(position)
+    return is_zip_file
+
+
+def iter_batch_documents(files):
+    """
+    documents d'une requête batch, lus au fur et à mesure : les archives zip sont parcourues membre par membre.
+
+    un document illisible (membre corrompu, fichier tronqué...) est renvoyé avec son erreur de lecture sans
+    interrompre le lot. Une archive qui ne peut pas être ouverte est renvoyée comme un seul document en erreur, les
+    fichiers suivants sont lus normalement.
+
+    :param files: liste de (nom du fichier, objet fichier binaire positionnable)
+    :return: générateur de (nom du document, contenu, erreur de lecture ou None)
+    """
+    for name, fileobj in files:
+        try:
+            if not is_zip(fileobj):
+                yield name, fileobj.read(), None
+                continue
+            archive = zipfile.ZipFile(fileobj)
+        except Exception as e:
+            yield name, None, f'impossible de lire le fichier : {e}'
+            continue
+        with archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                member_name = f'{name}/{info.filename}'
+                try:
+                    data = archive.read(info)
+                except Exception as e:
+                    yield member_name, None, f'impossible de lire le fichier : {e}'
+                else:
+                    yield member_name, data, None
+
+
+def _batch_line(index, name, data, validation, datetime_now):
+    try:
+        status, resp = validation(data, datetime_now=datetime_now)
+    except Exception:
+        msg = f"""ERREUR INTERNE DU MOTEUR DE CONTROLE DE COHERENCE
+    {tb.format_exc()}
+            """
+        logger.error(msg)
+        status, resp = 500, msg
+    line = {'index': index, 'nom_fichier': name, 'status': status}
+    if status == 200:
+        line['rapport'] = resp
+    else:
+        line['erreur'] = resp
+    return line
+
+
+def run_batch(documents, workers=None, max_in_flight=None, validation=validation_xml_data, datetime_now=None):
+    """
+    contrôle de cohérence d'un lot de documents sur un pool de threads.
+
+    les résultats sont renvoyés dans l'ordre de fin de traitement, chacun porte le rang (index) et le nom du document
+    dans le lot. Au plus max_in_flight documents sont lus et en attente de contrôle à un instant donné. Une erreur
+    sur un document (xml illisible, erreur interne) est renvoyée pour ce document sans interrompre le lot.
+
+    :param documents: itérable de (nom du document, contenu, erreur de lecture ou None), les documents illisibles
+    sont renvoyés en erreur 400 sans être contrôlés
+    :param validation: fonction (contenu, datetime_now) -> (code http, rapport ou message d'erreur), le moteur DPE ou
+    audit est choisi selon la balise racine du document
+    :return: générateur de dict {'index', 'nom_fichier', 'status', 'rapport' ou 'erreur'}
+    """
+    workers = workers or get_batch_workers()
+    max_in_flight = max(max_in_flight or get_batch_max_in_flight(), workers)
+    documents = enumerate(documents)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='controle_coherence_batch') as executor:
+        in_flight = set()
+        exhausted = False
+        while in_flight or not exhausted:
+            while not exhausted and len(in_flight) < max_in_flight:
+                try:
+                    index, (name, data, error) = next(documents)
+                except StopIteration:
+                    exhausted = True
+                except Exception as e:  # erreur du générateur de documents lui-même : il ne peut pas reprendre
+                    exhausted = True
+                    yield {'index': None, 'nom_fichier': None, 'status': 400,
+                           'erreur': f'impossible de lire les fichiers envoyés : {e}'}
+                else:
+                    if error is not None:
+                        yield {'index': index, 'nom_fichier': name, 'status': 400, 'erreur': error}
+                    else:
+                        in_flight.add(executor.submit(_batch_line, index, name, data, validation, datetime_now))
+            if in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+
+def iter_ndjson(lines):
+    for line in lines:
+        yield json.dumps(line) + '\n'
@@ -5,11 +5,15 @@ import copy
 import json
 import re
 import traceback as tb
+import os
+import threading
+from collections.abc import Mapping
 from pkg_resources import resource_filename
 import numpy as np
 from packaging.version import Version
 from datetime import datetime
-from controle_coherence.utils import convert_xml_text, element_to_value_dict, get_duplicates, get_uniques, calc_seuil_interpolate
+from controle_coherence.utils import convert_xml_text, element_to_value_dict, get_duplicates, get_uniques, \
+    excel_export_metadata
 from controle_coherence.enum_report import msg_themes, msg_importance
 from controle_coherence.assets_dpe import tv_table_to_value, complex_values_list, mutually_exclusive_elements, \
     elements_saisi, \
@@ -22,7 +26,20 @@ from controle_coherence.assets_dpe import tv_table_to_value, complex_values_list
 
 from controle_coherence.assets_audit import versions_audit_cfg, AUDIT_VERSION_ANTERIEUR, \
     get_current_valid_versions_audit
-
+from controle_coherence.assets_bundle import load_assets_bundle, read_source
+from controle_coherence.xsd_registry import xsd_registry
+from controle_coherence.document_index import DocumentIndex, lxml_lookup
+from controle_coherence.rule_dispatcher import RuleDispatcher, RULE_VARIABLES_INTERDITES, RULE_VARIABLES_REQUISES, \
+    RULE_HORS_METHODE, RULE_TABLE_VALEUR
+from controle_coherence.variables_expression import compile_variables_requises, compile_variables_interdites
+from controle_coherence.enum_lookup import compile_enum_tables, is_null
+from controle_coherence.seuils_petites_surfaces import compile_seuils_petites_surfaces
+from controle_coherence.arrete_reseau_chaleur import ArreteReseauChaleurIndex
+from controle_coherence.enum_registry import EnumRegistry
+from controle_coherence.audit_graph import get_audit_graph
+from controle_coherence.logement_pool import get_audit_processes, get_min_logements, run_logements_in_pool
+
+MAX_TV_SUGGESTIONS = 10  # nombre maximum de valeurs tv suggérées dans les messages de mauvaise correspondance tv/enum
 
 
 class Singleton(type):
@@ -34,6 +51,41 @@ class Singleton(type):
         return cls._instances[cls]
 
 
+class LazyVersionDict(Mapping):
+    """
+    dictionnaire version -> objet dont les valeurs sont construites au premier accès.
+    les clés sont celles de la configuration des versions (VERSION_CFG), la construction est protégée par un verrou
+    car les moteurs singleton sont partagés entre les threads du webservice.
+    """
+
+    def __init__(self, version_cfg, loader):
+        self.version_cfg = version_cfg
+        self.loader = loader
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def __getitem__(self, version_id_str):
+        try:
+            return self._values[version_id_str]
+        except KeyError:
+            pass
+        if version_id_str not in self.version_cfg:
+            raise KeyError(version_id_str)
+        with self._lock:
+            if version_id_str not in self._values:
+                self._values[version_id_str] = self.loader(version_id_str)
+        return self._values[version_id_str]
+
+    def __iter__(self):
+        return iter(self.version_cfg)
+
+    def __len__(self):
+        return len(self.version_cfg)
+
+    def is_loaded(self, version_id_str):
+        return version_id_str in self._values
+
+
 class CoreEngine(metaclass=Singleton):
     namespaces = {'xs': 'http://www.w3.org/2001/XMLSchema'}
     VERSION_CFG = None
@@ -53,37 +105,78 @@ class CoreEngine(metaclass=Singleton):
 
     def __init__(self):
 
+        self.assets_bundle = load_assets_bundle(self.mdd_path)  # tables précompilées, None si absent ou périmé
         self._instanciate_tv_table_dict()  # instanciate table valeur as dict
         self._instanciate_enums()  # instanciate enums as dict
         self._instanciate_reseau_chaleur()
         self._instanciate_seuils_petites_surfaces()
         self._instanciate_var_req_and_var_forbid_dict()  # instanciate var req and var forbid dicts
+        self._instanciate_rule_dispatcher()  # répartition par tag des règles enum / tv
         self._reindex_enum_tables()  # reindex with ids enum tables
-        parser = etree.XMLParser(remove_blank_text=True, resolve_entities=False, no_network=True) # Secure parser against XXE
+        self._instanciate_enum_lookup()  # tables compilées utilisées par les contrôles à la place de pandas
+        self.assets_bundle = None  # les tables ont été consommées, on libère le bundle
+
+        # schema is the pool of xml schema validators and xsd_metadata holds what is extracted from the xsd tree
+        # (models, ordered names, lexique). l'arbre xsd lui-même n'est pas conservé.
+        # les xsd sont compilés à la demande, la première fois qu'un xml déclare la version correspondante.
+        # les objets sont partagés via xsd_registry entre les versions et les moteurs qui utilisent un xsd identique.
+        self.schema_dict = LazyVersionDict(self.VERSION_CFG, self._load_schema)
+        self.xsd_metadata = LazyVersionDict(self.VERSION_CFG, self._load_xsd_metadata)
+        self.logement_models = LazyVersionDict(self.VERSION_CFG, self._load_models)
+        self._model_variables = dict()  # (version, objet) -> frozenset des variables du modèle
+        self.warmup_versions()
 
-        # schema is the xml schema object for validation and xsd is the xsd as an xml object to navigate.
-        self.schema_dict = dict()
-        self.xsd_dict = dict()
-        for version_id_str, cfg in self.VERSION_CFG.items():
-            self.schema_dict[version_id_str] = etree.XMLSchema(
-                file=str((self.mdd_path / cfg['xsd_file']).absolute()))  # instanciate xsd for validation.
-            self.xsd_dict[version_id_str] = etree.parse(str((self.mdd_path / cfg['xsd_file']).absolute()), parser)
+    def get_current_valid_versions(self,now):
+        raise NotImplementedError('not implemented')
 
-        self.logement_models = dict()
-        self._generate_models()
+    def _xsd_path(self, version_id_str):
+        return str((self.mdd_path / self.VERSION_CFG[version_id_str]['xsd_file']).absolute())
 
+    def _load_schema(self, version_id_str):
+        return xsd_registry.get_schema(self._xsd_path(version_id_str))  # instanciate xsd for validation.
 
-    def get_current_valid_versions(self,now):
-        raise NotImplementedError('not implemented')
+    def _load_xsd_metadata(self, version_id_str):
+        return xsd_registry.get_metadata(self._xsd_path(version_id_str), self._extract_xsd_metadata)
+
+    def _load_models(self, version_id_str):
+        return self.xsd_metadata[version_id_str]['logement_models']
+
+    def warmup_versions(self, warmup=None):
+        """
+        compilation anticipée des xsd et des modèles au démarrage.
+
+        :param warmup: 'current' (défaut) : uniquement les versions valides à la date du jour,
+        'all' : toutes les versions, 'none' : aucune (tout est compilé à la demande).
+        par défaut lu dans la variable d'environnement OBS_DPE_XSD_WARMUP.
+        """
+        if warmup is None:
+            warmup = os.getenv('OBS_DPE_XSD_WARMUP', 'current')
+        if warmup == 'all':
+            version_ids = list(self.VERSION_CFG)
+        elif warmup == 'current':
+            version_ids = self.get_current_valid_versions(get_datetime_now(None))
+        elif warmup == 'none':
+            version_ids = list()
+        else:
+            raise ValueError(f'OBS_DPE_XSD_WARMUP invalide : {warmup} (valeurs possibles : current, all, none)')
+        for version_id_str in version_ids:
+            self.schema_dict[version_id_str]
+            self.xsd_metadata[version_id_str]
+
+    def _read_asset(self, file_name):
+        # lecture depuis le bundle précompilé si disponible, sinon depuis les sources de modele_donnee
+        if self.assets_bundle is not None:
+            return self.assets_bundle[file_name]
+        return read_source(self.mdd_path, file_name)
 
     def _instanciate_reseau_chaleur(self):
 
-        with open(self.mdd_path / 'arrete_reseau_chaleur.json', 'r', encoding='utf-8') as f:
-            arrete_reseau_chaleur = json.load(f)
+        arrete_reseau_chaleur = self._read_asset('arrete_reseau_chaleur.json')
         self.arrete_reseau_chaleur = arrete_reseau_chaleur
+        self.arrete_reseau_chaleur_index = ArreteReseauChaleurIndex(arrete_reseau_chaleur, self.valeur_table)
 
     def _instanciate_tv_table_dict(self):
-        valeur_table = pd.read_excel(self.mdd_path / 'valeur_tables.xlsx', sheet_name=None)
+        valeur_table = self._read_asset('valeur_tables.xlsx')
         # GESTION DES TABLES DE VALEURS QUI NE CORRESPONDENT PAS EXACTEMENT A UN OBJET DU XSD
         valeur_table['coef_masque_lointain_non_homogene'] = valeur_table['coef_masque_lointain_non_homoge']
         del valeur_table['coef_masque_lointain_non_homoge']
@@ -115,24 +208,54 @@ class CoreEngine(metaclass=Singleton):
         self.valeur_table = valeur_table
         self.valeur_table_dict = valeur_table_dict
 
-    def _instanciate_seuils_petites_surfaces(self):
+        # copies des colonnes de valeurs des tables sous forme de tableaux numpy (contrôle vectorisé des valeurs tv)
+        tv_value_arrays = dict()
+        for name, vt in valeur_table_dict.items():
+            name_wo_id = '_'.join(name.split('_')[1:-1])
+            if name_wo_id not in tv_table_to_value:
+                continue
+            tv_ids = list(vt)
+            columns = dict()
+            for column in {tv_table_to_value[name_wo_id]['tv_value_name'], 'seer'}:
+                if len(tv_ids) > 0 and column in vt[tv_ids[0]]:
+                    column_values = np.array([vt[tv_id][column] for tv_id in tv_ids])
+                    if column_values.dtype.kind in 'biuf':
+                        column_values = column_values.astype(float)
+                    columns[column] = column_values
+            tv_value_arrays[name] = {'row': {tv_id: i for i, tv_id in enumerate(tv_ids)},
+                                     'columns': columns}
+        self.tv_value_arrays = tv_value_arrays
+
+        # index des énumérateurs admissibles par valeur tv : propriétés connexes nettoyées des nan et
+        # énumérateur -> frozenset des ids admissibles, ainsi que l'index inverse
+        # énumérateur -> id enum -> ids tv admissibles (suggestion de la bonne valeur tv dans les messages).
+        tv_related = dict()
+        tv_ids_by_enum = dict()
+        for name, vt in valeur_table_dict.items():
+            tv_related[name] = dict()
+            tv_ids_by_enum[name] = dict()
+            for tv_id, row in vt.items():
+                related_properties = {k: v for k, v in row.items() if v == v}
+                related_enums = {k: frozenset(v) for k, v in related_properties.items() if k.startswith('enum')}
+                tv_related[name][tv_id] = (related_properties, related_enums)
+                for enum_name, admissible_values in related_enums.items():
+                    for enum_id in admissible_values:
+                        tv_ids_by_enum[name].setdefault(enum_name, dict()).setdefault(enum_id, list()).append(tv_id)
+        self.tv_related = tv_related
+        self.tv_ids_by_enum = tv_ids_by_enum
 
-        with open(self.mdd_path / 'seuils_petites_surfaces.json', 'r') as f:
-            seuils_petites_surfaces = json.load(f)
+    def _instanciate_seuils_petites_surfaces(self):
 
-        for k, v in seuils_petites_surfaces.items():
-            for k1, v1 in v.items():
-                v1 = pd.DataFrame(v1)
-                v1.index = v1.index.astype(int)
-                seuils_petites_surfaces[k][k1] = v1
-        self.seuils_petites_surfaces = seuils_petites_surfaces
+        seuils_petites_surfaces = self._read_asset('seuils_petites_surfaces.json')
+        self.seuils_petites_surfaces = compile_seuils_petites_surfaces(seuils_petites_surfaces)
 
     def _instanciate_enums(self):
-        enum_table = pd.read_excel(self.mdd_path / 'enum_tables.xlsx', sheet_name=None)
+        enum_table = self._read_asset('enum_tables.xlsx')
         enum_dict = {f'enum_{k}_id': v.set_index('id').lib.to_dict() for k, v in enum_table.items() if
                      'lib' in v and 'id' in v}
 
         self.enum_dict = enum_dict
+        self.enum_registry = EnumRegistry(enum_dict)
         self.enum_table = enum_table
 
     def _instanciate_var_req_and_var_forbid_dict(self):
@@ -161,52 +284,141 @@ class CoreEngine(metaclass=Singleton):
         self.var_forbid_dict = var_forbid_dict
         self.enum_hors_methode_dict = hors_methode_dict
 
+        # expressions compilées une fois au chargement : une expression mal formée empêche le démarrage du moteur
+        self.var_req_expressions = self._compile_var_expressions(var_req_dict, 'variables_requises',
+                                                                 compile_variables_requises)
+        self.var_forbid_expressions = self._compile_var_expressions(var_forbid_dict, 'variables_interdites',
+                                                                    compile_variables_interdites)
+
+    def _instanciate_rule_dispatcher(self):
+        self.rule_dispatcher = RuleDispatcher({RULE_VARIABLES_INTERDITES: self.var_forbid_expressions,
+                                               RULE_VARIABLES_REQUISES: self.var_req_expressions,
+                                               RULE_HORS_METHODE: self.enum_hors_methode_dict,
+                                               RULE_TABLE_VALEUR: self.valeur_table_dict,
+                                               })
+
+    @staticmethod
+    def _compile_var_expressions(expressions_dict, column_name, compile_func):
+        compiled_dict = dict()
+        for control_varname, expressions in expressions_dict.items():
+            compiled_dict[control_varname] = dict()
+            for id_enum, expression in expressions.items():
+                try:
+                    compiled_dict[control_varname][id_enum] = compile_func(expression)
+                except ValueError as e:
+                    raise ValueError(f'expression {column_name} invalide pour {control_varname} = {id_enum} : '
+                                     f'{expression!r} : {e}') from e
+        return compiled_dict
+
     def _reindex_enum_tables(self):
         enum_table = self.enum_table
         for k, v in enum_table.items():
             if 'id' in v:
                 enum_table[k] = v.set_index('id')
 
-    def _generate_models(self):
-        for version_id_str, xsd in self.xsd_dict.items():
-            administratif_models = dict()
-            administratif = xsd.find('.//xs:element[@name="administratif"]', namespaces=self.namespaces)
-            for name in ['adresse_proprietaire', 'adresse_bien', 'adresse_proprietaire_installation_commune']:
-                model = administratif.find(f'*//xs:element[@name="{name}"]', namespaces=self.namespaces)
-                administratif_models[name] = list()
-                if model.attrib['type'] == 't_adresse':
-                    t_adresse = xsd.find('.//xs:complexType[@name="t_adresse"]', namespaces=self.namespaces)
-                    for el in list(t_adresse.iterfind('*//xs:element', namespaces=self.namespaces)):
-                        administratif_models[name].append(el.attrib['name'])
+    def _instanciate_enum_lookup(self):
+        # aucun objet pandas n'est manipulé par les contrôles après le chargement du moteur :
+        # les tables enum et les tables de valeurs sont compilées en dict python.
+        self.enum_lookup = compile_enum_tables(self.enum_table)
+        self.valeur_lookup = compile_enum_tables(self.valeur_table)
 
-                else:
-                    for el in list(model.iterfind('*//xs:element', namespaces=self.namespaces)):
-                        administratif_models[name].append(el.attrib['name'])
+        # générateurs admissibles par type d'émission/distribution
+        self.generateurs_by_type_emission_distribution = {
+            type_emission_distribution_id: [int(el) for el in str(generateurs).split('|')]
+            for type_emission_distribution_id, generateurs in
+            self.get_enum_column('type_emission_distribution', 'enum_type_generateur_ch_id', dropna=False).items()}
+
+        # générateurs avec veilleuse (id en texte pour comparaison directe avec le xml)
+        tv_generateur_combustion = self.valeur_table['generateur_combustion']
+        gen_veilleuse = tv_generateur_combustion.loc[tv_generateur_combustion.pveil > 0]
+        self.generateurs_avec_veilleuse = {
+            enum_name: frozenset(gen_veilleuse.explode(enum_name)[enum_name].dropna().astype(str))
+            for enum_name in ['enum_type_generateur_ch_id', 'enum_type_generateur_ecs_id']}
 
-            logement = xsd.find('.//xs:element[@name="logement"]', namespaces=self.namespaces)
-            logement_models = dict()
+        # adjacences pour lesquelles le calcul du ue est attendu pour les planchers bas
+        self.adjacence_id_avec_ue = frozenset(
+            str(el) for el in self.enum_lookup['type_adjacence'].ids_where('calcul_ue_plancher_bas', 1))
 
-            for name in ['caracteristique_generale', 'meteo', 'inertie']:
-                model = logement.find(f'*//xs:element[@name="{name}"]', namespaces=self.namespaces)
-                logement_models[name] = list()
+    def get_enum_row(self, table_name, enum_id):
+        """
+        ligne d'une table enum : dict colonne -> valeur, équivalent de enum_table[table_name].loc[enum_id].to_dict()
+        """
+        return self.enum_lookup[table_name].row(enum_id)
+
+    def get_enum_value(self, table_name, enum_id, column):
+        """
+        valeur d'une table enum, équivalent de enum_table[table_name].loc[enum_id][column]
+        """
+        return self.enum_lookup[table_name].value(enum_id, column)
+
+    def get_enum_column(self, table_name, column, dropna=True):
+        """
+        colonne d'une table enum : dict id -> valeur, équivalent de enum_table[table_name][column].dropna().to_dict()
+        """
+        return self.enum_lookup[table_name].column(column, dropna=dropna)
+
+    def _generate_models(self, xsd):
+        administratif_models = dict()
+        administratif = xsd.find('.//xs:element[@name="administratif"]', namespaces=self.namespaces)
+        for name in ['adresse_proprietaire', 'adresse_bien', 'adresse_proprietaire_installation_commune']:
+            model = administratif.find(f'*//xs:element[@name="{name}"]', namespaces=self.namespaces)
+            administratif_models[name] = list()
+            if model.attrib['type'] == 't_adresse':
+                t_adresse = xsd.find('.//xs:complexType[@name="t_adresse"]', namespaces=self.namespaces)
+                for el in list(t_adresse.iterfind('*//xs:element', namespaces=self.namespaces)):
+                    administratif_models[name].append(el.attrib['name'])
+
+            else:
                 for el in list(model.iterfind('*//xs:element', namespaces=self.namespaces)):
-                    logement_models[name].append(el.attrib['name'])
-            for donnee_entree in logement.iterfind('*//xs:element[@name="donnee_entree"]', namespaces=self.namespaces):
-                parent = donnee_entree.getparent().getparent().getparent()
-                name = parent.attrib['name']
-                logement_models[name] = list()
-                for el in list(donnee_entree.iterfind('*//xs:element', namespaces=self.namespaces)):
-                    logement_models[name].append(el.attrib['name'])
-                for el in list(parent.iterfind('*//xs:element[@name="donnee_intermediaire"]//xs:element',
-                                               namespaces=self.namespaces)):
-                    logement_models[name].append(el.attrib['name'])
-            logement_models.update(administratif_models)
-            self.logement_models[version_id_str] = logement_models
+                    administratif_models[name].append(el.attrib['name'])
+
+        logement = xsd.find('.//xs:element[@name="logement"]', namespaces=self.namespaces)
+        logement_models = dict()
+
+        for name in ['caracteristique_generale', 'meteo', 'inertie']:
+            model = logement.find(f'*//xs:element[@name="{name}"]', namespaces=self.namespaces)
+            logement_models[name] = list()
+            for el in list(model.iterfind('*//xs:element', namespaces=self.namespaces)):
+                logement_models[name].append(el.attrib['name'])
+        for donnee_entree in logement.iterfind('*//xs:element[@name="donnee_entree"]', namespaces=self.namespaces):
+            parent = donnee_entree.getparent().getparent().getparent()
+            name = parent.attrib['name']
+            logement_models[name] = list()
+            for el in list(donnee_entree.iterfind('*//xs:element', namespaces=self.namespaces)):
+                logement_models[name].append(el.attrib['name'])
+            for el in list(parent.iterfind('*//xs:element[@name="donnee_intermediaire"]//xs:element',
+                                           namespaces=self.namespaces)):
+                logement_models[name].append(el.attrib['name'])
+        logement_models.update(administratif_models)
+        return logement_models
+
+    def _extract_xsd_metadata(self, xsd):
+        # noms des éléments dans l'ordre du xsd et documentation (lexique) précalculés pour l'export excel
+        elements = list(xsd.iterfind('*//xs:element', namespaces=self.namespaces))
+        ordered_names = [el.attrib.get('name', el.attrib.get('ref')) for el in elements]
+        doc = {el.attrib.get('name', el.attrib.get('ref')): el for el in elements}
+        lexique = dict()
+        for k, v in doc.items():
+            documentation = v.find('xs:annotation/xs:documentation', namespaces=self.namespaces)
+            if documentation is not None and documentation.text is not None:
+                lexique[k] = documentation.text
+        return {'logement_models': self._generate_models(xsd),
+                'ordered_names': ordered_names,
+                'excel_export': excel_export_metadata(ordered_names, lexique)}
 
     def display_enum_traduction(self, enum_name, enum_values):
-        if isinstance(enum_values, int):
-            enum_values = [enum_values]
-        return {k: v for k, v in self.enum_dict[enum_name].items() if k in enum_values}
+        return self.enum_registry.display(enum_name, enum_values)
+
+    def get_document_index(self, element, report):
+        """
+        index du document auquel appartient element : celui construit une seule fois dans run_controle_coherence et
+        porté par le rapport, sinon (appel direct d'un contrôle) les recherches sont déléguées directement à lxml.
+        """
+        document_index = getattr(report, 'document_index', None)
+        root = element.getroot() if isinstance(element, etree._ElementTree) else element
+        if document_index is not None and root in document_index:
+            return document_index
+        return lxml_lookup
 
     def get_enum_version(self, xml_reg):
 
@@ -234,10 +446,11 @@ Nous vous invitons à vous rapprocher de votre éditeur de logiciel pour régler
 """]
             return {"valid": False,
                     "error_log": error_log}
-        resp = schema.validate(xml_reg)
+        # validateur emprunté au pool du xsd : validations simultanées possibles avec chacune son error_log
+        resp, error_log = schema.validate(xml_reg)
 
         return {"valid": resp,
-                "error_log": str(schema.error_log).split('\n')}
+                "error_log": error_log.split('\n')}
 
     def run_validation_xsd(self, xml_reg, report):
         report.xsd_validation.update(self.validate_by_xsd(xml_reg))
@@ -339,19 +552,17 @@ les versions suivantes sont acceptées pour dépôt. {self.get_current_valid_ver
     # ================== CONTROLE COHERENCE GLOBAUX COMMUNS ===================================
 
     def controle_coherence_variables_interdites(self, xml_reg, report):
+        index = self.get_document_index(xml_reg, report)
         version_id_str = self.get_enum_version(xml_reg).text
-        for control_varname in self.var_forbid_dict:
-            control_vars = list(xml_reg.iterfind(f'.//{control_varname}'))
-
+        for control_varname, control_vars in self.rule_dispatcher.iter_elements(index, xml_reg,
+                                                                                 RULE_VARIABLES_INTERDITES):
             for control_var in control_vars:
                 id_enum = convert_xml_text(control_var.text)
-                variables_forbid = self.var_forbid_dict.get(control_varname).get(id_enum, None)
+                variables_forbid = self.var_forbid_expressions[control_varname].get(id_enum, None)
                 if variables_forbid is not None:
                     element = control_var.getparent()
-                    found_var_forbid = list()
-                    for var in variables_forbid.split(','):
-                        if self.exist_var(element, var, version_id_str=version_id_str):
-                            found_var_forbid.append(var)
+                    exists = self.get_exist_var_func(element, version_id_str)
+                    found_var_forbid = [var for var in variables_forbid if exists(var)]
 
                     if len(found_var_forbid) > 0:
                         msg = f"""
@@ -367,116 +578,21 @@ lorsque la variable {control_varname} vaut :
                                             msg_importance='blocker')
 
     def controle_coherence_variables_requises(self, xml_reg, report):
-
-        def check_existence(engine, element, vargroup, version_id_str):
-            exist_list = list()
-            for var in re.split('[|,]', vargroup):
-                found = engine.exist_var(element, var, version_id_str=version_id_str)
-                if found is True:
-                    exist_list.append((True, var))
-                elif found is False:
-                    exist_list.append((False, var))
-                else:
-                    pass
-            return exist_list
-
-        def verify_condition(exist_list, operator):
-            if len(exist_list) == 0:
-                verif_condition = True
-                sep = ' et '
-            elif operator == '|':
-                sep = ' ou '
-                verif_condition = False
-                for exist in exist_list:
-                    verif_condition = verif_condition | exist[0]
-
-            elif operator == ',':
-                sep = ' et '
-                verif_condition = True
-                for exist in exist_list:
-                    verif_condition = verif_condition & exist[0]
-
-            else:
-                BaseException(f'invalid operator : {operator}')
-
-            if verif_condition is False:
-                missing_variables = [el[1] for el in exist_list if el[0] is False]
-                missing_variables = f'{sep}'.join(missing_variables)
-            else:
-                missing_variables = None
-            return missing_variables
-
-        def main_control_var_req(element, variables_requises, engine, version_id_str):
-            if '(' in variables_requises:
-                main_operator = variables_requises.split(')')
-                if len(main_operator) > 1:
-                    main_operator = main_operator[1]
-                    if len(main_operator) > 0:
-                        main_operator = main_operator[0]
-                    else:
-                        main_operator = variables_requises.split('(')[0][-1]
-                else:
-                    main_operator = variables_requises.split('(')[0][-1]
-                vargroups = variables_requises.replace('(', '').replace(')', '').split(main_operator)
-                exist_list = list()
-                for vargroup in vargroups:
-                    sub_exist_list = check_existence(engine, element, vargroup, version_id_str=version_id_str)
-                    if '|' in vargroup:
-                        operator = '|'
-                    elif ',' in vargroup:
-                        operator = ','
-                    else:
-                        operator = ','
-
-                    missing_variables = verify_condition(sub_exist_list, operator)
-                    if missing_variables is not None:
-                        exist_list.append((False, missing_variables))
-                    else:
-                        exist_list.append((True, vargroup))
-                missing_variables = verify_condition(exist_list, main_operator)
-                if missing_variables is not None:
-                    sep = ' et '
-                    if main_operator == '|':
-                        sep = ' ou '
-                    missing_variables = '(' + f'){sep}('.join(missing_variables.split(sep)) + ')'
-                    result = (False, missing_variables)
-                else:
-                    result = (True, None)
-
-            elif '|' in variables_requises:
-                exist_list = check_existence(engine, element, variables_requises, version_id_str=version_id_str)
-                main_operator = '|'
-                missing_variables = verify_condition(exist_list, main_operator)
-                if missing_variables is not None:
-                    result = (False, missing_variables)
-                else:
-                    result = (True, None)
-            else:
-                exist_list = check_existence(engine, element, variables_requises, version_id_str=version_id_str)
-                main_operator = ','
-                missing_variables = verify_condition(exist_list, main_operator)
-                if missing_variables is not None:
-                    result = (False, missing_variables)
-                else:
-                    result = (True, None)
-
-            return result
-
+        index = self.get_document_index(xml_reg, report)
         version_id_str = self.get_enum_version(xml_reg).text
 
-        for control_varname in self.var_req_dict:
-            control_vars = list(xml_reg.iterfind(f'.//{control_varname}'))
-
+        for control_varname, control_vars in self.rule_dispatcher.iter_elements(index, xml_reg,
+                                                                                 RULE_VARIABLES_REQUISES):
             for control_var in control_vars:
                 id_enum = convert_xml_text(control_var.text)
-                variables_requises = self.var_req_dict.get(control_varname).get(id_enum, None)
+                variables_requises = self.var_req_expressions[control_varname].get(id_enum, None)
                 if variables_requises is not None:
                     element = control_var.getparent()
-                    control = main_control_var_req(element, variables_requises, self, version_id_str=version_id_str)
-                    if control[0] is False:
+                    missing_variables = variables_requises.missing(self.get_exist_var_func(element, version_id_str))
+                    if missing_variables is not None:
                         msg = f"""
 les champs suivants doivent être renseignés :
-{control[1]}
+{missing_variables}
 lorsque la variable {control_varname} vaut : 
 {self.display_enum_traduction(control_varname, id_enum)}
 """
@@ -487,7 +603,8 @@ lorsque la variable {control_varname} vaut :
                                             msg_importance='blocker')
 
     def controle_coherence_administratif(self, xml_reg, report):
-        for el_adresse in xml_reg.find('*//adresses').getchildren():
+        index = self.get_document_index(xml_reg, report)
+        for el_adresse in index.find(xml_reg, '*//adresses').getchildren():
             el_statut_geocodage_ban = el_adresse.find('enum_statut_geocodage_ban_id')
             adresse_dict = element_to_value_dict(el_adresse)
             statut_geocodage_ban_id = int(el_statut_geocodage_ban.text)
@@ -526,7 +643,7 @@ si votre adresse existe bien dans la Base d'Adresse Nationale, tentez de relance
             el_ban_id = el_adresse.find("ban_id")
             # TODO : redondant avec la partie automatique réalisée sur le DPE existant (à optimiser sur future version)
             if adresse_dict['enum_statut_geocodage_ban_id'] == 1:
-                ban_var_req = self.var_req_dict['enum_statut_geocodage_ban_id'][1].split(',')
+                ban_var_req = self.var_req_expressions['enum_statut_geocodage_ban_id'][1].variables
                 missing_vars = set(ban_var_req) - set([el.tag for el in el_adresse.getchildren()])
                 if len(missing_vars) > 0:
                     msg = f"""
@@ -581,7 +698,7 @@ Est ce que l'adresse géocodée : {adresse_dict.get('ban_label', "AUCUNE ADRESSE
         el_methode_dpe = xml_reg.find('*//enum_methode_application_dpe_log_id')
         if el_methode_dpe is not None:
             methode_dpe_id = int(el_methode_dpe.text)
-            type_batiment = self.enum_table['methode_application_dpe_log'].loc[methode_dpe_id].type_batiment
+            type_batiment = self.get_enum_value('methode_application_dpe_log', methode_dpe_id, 'type_batiment')
             if type_batiment == 'appartement':
                 compl_etage_appartement = xml_reg.find('*//adresse_bien//compl_etage_appartement')
                 if compl_etage_appartement is None:
@@ -597,26 +714,27 @@ l'etage de l'appartement n'est pas précisé dans la section adresse du DPE
                                         msg_importance='blocker')
 
     def controle_coherence_administratif_consentement(self, xml_reg, report, is_blocker: bool):
+        index = self.get_document_index(xml_reg, report)
 
-        methode_dpe = xml_reg.find('.//enum_methode_application_dpe_log_id')
+        methode_dpe = index.find(xml_reg, './/enum_methode_application_dpe_log_id')
 
         # le contrôle de cohérence n'est pas applicable dans le cas d'un dpe appartement à partir de l'immeuble ou le consentement du propriétaire n'est pas olbigatoire.
-        non_applicable = str(self.enum_table['methode_application_dpe_log'].loc[int(methode_dpe.text)].methode_application_dpe)=='dpe appartement généré à partir des données DPE immeuble'
-        auditeur = xml_reg.find('*//auditeur')
+        non_applicable = str(self.get_enum_value('methode_application_dpe_log', int(methode_dpe.text), 'methode_application_dpe'))=='dpe appartement généré à partir des données DPE immeuble'
+        auditeur = index.find(xml_reg, '*//auditeur')
         if auditeur is not None:
             diagnostiqueur = auditeur.find('diagnostiqueur')
             if diagnostiqueur is None:
                 # Cas d'un BET ou architecte : consentement est non applicable
                 non_applicable = True
 
-        if xml_reg.find('*//enum_consentement_formulaire_id') is not None:
-            enum_consentement_formulaire_id = xml_reg.find('*//enum_consentement_formulaire_id')
+        if index.find(xml_reg, '*//enum_consentement_formulaire_id') is not None:
+            enum_consentement_formulaire_id = index.find(xml_reg, '*//enum_consentement_formulaire_id')
 
         else:
-            enum_consentement_formulaire_id = xml_reg.find('*//consentement_proprietaire')
+            enum_consentement_formulaire_id = index.find(xml_reg, '*//consentement_proprietaire')
 
         # on ne peut saisir les deux informations en //
-        if xml_reg.find('*//enum_consentement_formulaire_id') is not None and xml_reg.find('*//consentement_proprietaire') is not None:
+        if index.find(xml_reg, '*//enum_consentement_formulaire_id') is not None and index.find(xml_reg, '*//consentement_proprietaire') is not None:
             msg = f"""
 erreur logiciel :  enum_consentement_formulaire_id et consentement_proprietaire ne peuvent pas être déclarés en même temps -> utilisez le nouveau champs enum_consentement_formulaire_id 
 """
@@ -747,6 +865,7 @@ A partir du 1er juillet 2024, lors de toutes ses interventions, le diagnostiqueu
                                 msg_importance=msg_importance)
 
     def controle_coherence_declaration_numero_fiscal_local(self, xml_reg, report,is_blocker):
+        index = self.get_document_index(xml_reg, report)
         if is_blocker == True:
             msg_type = 'erreur_saisie'
             msg_importance = 'blocker'
@@ -756,11 +875,11 @@ A partir du 1er juillet 2024, lors de toutes ses interventions, le diagnostiqueu
             msg_importance = 'critical'
             msg_add = ' \nceci sera bloquant dans une future version du moteur de contrôle de cohérence'
 
-        methode_dpe_id = int(xml_reg.find('*//enum_methode_application_dpe_log_id').text)
-        obligation_numero_fiscal = int(self.enum_table['methode_application_dpe_log'].loc[methode_dpe_id].obligation_numero_fiscal)
-        if xml_reg.find('*//enum_commanditaire_id') is not None:
+        methode_dpe_id = int(index.find(xml_reg, '*//enum_methode_application_dpe_log_id').text)
+        obligation_numero_fiscal = int(self.get_enum_value('methode_application_dpe_log', methode_dpe_id, 'obligation_numero_fiscal'))
+        if index.find(xml_reg, '*//enum_commanditaire_id') is not None:
 
-            enum_commanditaire_id = int(xml_reg.find('*//enum_commanditaire_id').text)
+            enum_commanditaire_id = int(index.find(xml_reg, '*//enum_commanditaire_id').text)
         else:
             msg = f"""
 enum_commanditaire_id manquant dans le volet administratif {self.DENOMINATION_OBJET_XML_REG}. Ceci est un nouvel élément requis pour identifier le type de commanditaire du DPE.                              
@@ -785,10 +904,11 @@ enum_commanditaire_id manquant dans le volet administratif {self.DENOMINATION_OB
                                 msg_importance=msg_importance)
 
     def controle_coherence_logement_visite(self, xml_reg, report):
-        is_audit = xml_reg.find('*//enum_version_audit_id') is not None
+        index = self.get_document_index(xml_reg, report)
+        is_audit = index.find(xml_reg, '*//enum_version_audit_id') is not None
         if is_audit:
             # Cherche l'élément caracteristique_generale de l'étape initiale
-            all_caracteristique_generale = list(xml_reg.iterfind('*//caracteristique_generale'))
+            all_caracteristique_generale = list(index.iterfind(xml_reg, '*//caracteristique_generale'))
             for caracteristique_generale in all_caracteristique_generale:
                 enum_scenario_id = caracteristique_generale.find('enum_scenario_id').text
                 enum_etape_id = caracteristique_generale.find('enum_etape_id').text
@@ -799,11 +919,10 @@ enum_commanditaire_id manquant dans le volet administratif {self.DENOMINATION_OB
             if caracteristique_generale is None:
                 caracteristique_generale = xml_reg.find('caracteristique_generale')
         enum_methode_application_dpe_log_id = caracteristique_generale.find('enum_methode_application_dpe_log_id')
-        methode_application_dpe = self.enum_table['methode_application_dpe_log'].loc[
-            int(enum_methode_application_dpe_log_id.text)].methode_application_dpe
+        methode_application_dpe = self.get_enum_value('methode_application_dpe_log', int(enum_methode_application_dpe_log_id.text), 'methode_application_dpe')
 
         if methode_application_dpe == 'dpe immeuble collectif' and len(
-                list(xml_reg.iterfind('*//logement_visite'))) == 0:
+                list(index.iterfind(xml_reg, '*//logement_visite'))) == 0:
             msg = f"""
 aucun logement visité n'est déclaré pour le dpe immeuble collectif. les logements visités doivent être déclarés dans le xml.
 methode d'application : {self.display_enum_traduction('enum_methode_application_dpe_log_id', int(enum_methode_application_dpe_log_id.text))}                
@@ -818,17 +937,18 @@ methode d'application : {self.display_enum_traduction('enum_methode_application_
     # ================== CONTROLE COHERENCE LOGEMENT COMMUNS ===================================
 
     def controle_coherence_etiquette(self, logement, report, is_arrete_petite_surface=False):
+        index = self.get_document_index(logement, report)
 
-        classe_bilan_dpe = logement.find('*//classe_bilan_dpe').text
-        classe_emission_ges = logement.find('*//classe_emission_ges').text
+        classe_bilan_dpe = index.find(logement, '*//classe_bilan_dpe').text
+        classe_emission_ges = index.find(logement, '*//classe_emission_ges').text
 
         # récupération de la surface pour contrôler que l'on est dans le cas d'une petite surface
-        methode_dpe = logement.find('.//enum_methode_application_dpe_log_id')
-        surface_reference_name = str(self.enum_table['methode_application_dpe_log'].loc[int(methode_dpe.text)].surface_reference_calcul_etiquette)
+        methode_dpe = index.find(logement, './/enum_methode_application_dpe_log_id')
+        surface_reference_name = str(self.get_enum_value('methode_application_dpe_log', int(methode_dpe.text), 'surface_reference_calcul_etiquette'))
 
-        if logement.find(f'.//{surface_reference_name}') is None:
+        if index.find(logement, f'.//{surface_reference_name}') is None:
             report.generate_msg(f"""
-la surface {surface_reference_name} n'est pas renseignée pour la méthode DPE {self.enum_table['methode_application_dpe_log'].loc[int(methode_dpe.text)].lib}
+la surface {surface_reference_name} n'est pas renseignée pour la méthode DPE {self.get_enum_value('methode_application_dpe_log', int(methode_dpe.text), 'lib')}
 cette surface doit être obligatoirement renseignée. 
         """,
 
@@ -866,10 +986,8 @@ cette surface doit être obligatoirement renseignée.
 
                 petite_surface = False
                 if surface_reference < 40 and is_arrete_petite_surface:
-                    seuils_energie_table = self.seuils_petites_surfaces[altitude]['seuils_energie']
-                    seuils_ges_table = self.seuils_petites_surfaces[altitude]['seuils_ges']
-                    seuils_energie_final = calc_seuil_interpolate(surface_reference, seuils_energie_table)
-                    seuils_ges_final = calc_seuil_interpolate(surface_reference, seuils_ges_table)
+                    seuils_energie_final = self.seuils_petites_surfaces[altitude]['seuils_energie'].seuils(surface_reference)
+                    seuils_ges_final = self.seuils_petites_surfaces[altitude]['seuils_ges'].seuils(surface_reference)
                     petite_surface = True
 
                 for etiquette, (min_value_ges, max_value_ges) in seuils_ges_final.items():
@@ -1007,10 +1125,11 @@ cette surface doit être obligatoirement renseignée.
           - Vérifie cohérence conso_energie_primaire par consommation
           - Vérifie somme des conso_energie_primaire avec le total du bilan
         """
+        index = self.get_document_index(tertiaire, report)
 
         # Récupération des sections
-        bilan = tertiaire.find('.//bilan_consommation')
-        conso_collection = tertiaire.find('.//consommation_collection')
+        bilan = index.find(tertiaire, './/bilan_consommation')
+        conso_collection = index.find(tertiaire, './/consommation_collection')
 
         # Si conso_collection vides => pas de contrôle
         if conso_collection is None or len(conso_collection.findall('consommation')) == 0:
@@ -1102,11 +1221,12 @@ et la consommation primaire déclarée.
         avec une précision de ±1 unité pour tolérer les erreurs d'arrondi.
         Génère une erreur bloquante pour chaque incohérence détectée.
         """
+        index = self.get_document_index(logement, report)
         a_tol = 2 # tolérance numérique
         # Récupération de la surface de référence
-        methode_dpe = logement.find('.//enum_methode_application_dpe_log_id')
-        surface_reference_name = str(self.enum_table['methode_application_dpe_log'].loc[int(methode_dpe.text)].surface_reference_calcul_etiquette)
-        surface_reference_element = logement.find(f'.//{surface_reference_name}')
+        methode_dpe = index.find(logement, './/enum_methode_application_dpe_log_id')
+        surface_reference_name = str(self.get_enum_value('methode_application_dpe_log', int(methode_dpe.text), 'surface_reference_calcul_etiquette'))
+        surface_reference_element = index.find(logement, f'.//{surface_reference_name}')
 
         if surface_reference_element is not None:
             surface_reference = np.round(np.float64(surface_reference_element.text), 5)
@@ -1163,10 +1283,11 @@ et la consommation primaire déclarée.
                                     msg_importance='blocker')
 
     def controle_coherence_table_valeur_enum(self, logement, report):
+        index = self.get_document_index(logement, report)
 
         all_tv_found = list()
-        for tv in self.valeur_table_dict:
-            all_tv_found.extend(list(logement.iterfind(f'*//{tv}')))
+        for tv, tv_found in self.rule_dispatcher.iter_elements(index, logement, RULE_TABLE_VALEUR, min_depth=2):
+            all_tv_found.extend(tv_found)
 
         for tv in all_tv_found:
             parent = tv.getparent()
@@ -1175,9 +1296,9 @@ et la consommation primaire déclarée.
             name = tv.tag
             tv_value = convert_xml_text(tv.text)
             if tv_value is not None:
-                related_properties = {k: v for k, v in self.valeur_table_dict[name][tv_value].items() if v == v}
-                related_enums = {k: v for k, v in related_properties.items() if k.startswith('enum')}
-                for related_enum_name, admissible_values in related_enums.items():
+                related_properties, related_enums = self.tv_related[name][tv_value]
+                for table_enum_name, admissible_values in related_enums.items():
+                    related_enum_name = table_enum_name
                     current_parent = parent
                     current_parent_dict = parent_dict
                     # if enum methode application on va chercher dans caracteristique generale
@@ -1219,6 +1340,16 @@ et l'énumérateur {related_enum_name}:{self.display_enum_traduction(related_enu
                                                                    current_parent_dict[related_enum_name])}.
 La valeur attendue de l'énumérateur {related_enum_name} doit être une des suivantes:
 {self.display_enum_traduction(related_enum_name, admissible_values)}
+"""
+                            # suggestion des valeurs tv compatibles avec l'énumérateur déclaré (index inverse)
+                            tv_suggestions = self.tv_ids_by_enum[name].get(table_enum_name, dict()).get(
+                                current_parent_dict[related_enum_name])
+                            if tv_suggestions:
+                                tv_suggestions_str = ', '.join(str(el) for el in tv_suggestions[:MAX_TV_SUGGESTIONS])
+                                if len(tv_suggestions) > MAX_TV_SUGGESTIONS:
+                                    tv_suggestions_str += ', ...'
+                                msg += f"""
+pour {related_enum_name}:{current_parent_dict[related_enum_name]} les valeurs de {name} compatibles sont : {tv_suggestions_str}
 """
                             msg_type = 'erreur_logiciel'
                             msg_importance = 'blocker'
@@ -1241,47 +1372,78 @@ si la période d'isolation (enum_periode_isolation_id) n'a pas été déclarée.
                                                 msg_importance=msg_importance)
 
     def controle_coherence_tv_values_simple(self, logement, report):
+        index = self.get_document_index(logement, report)
 
         all_tv_found = list()
-        for tv in self.valeur_table_dict:
-            all_tv_found.extend(list(logement.iterfind(f'*//{tv}')))
+        for tv, tv_found in self.rule_dispatcher.iter_elements(index, logement, RULE_TABLE_VALEUR, min_depth=2):
+            all_tv_found.extend(tv_found)
+
+        # collecte des couples (valeur attendue, valeur déclarée) puis comparaison vectorisée en un seul np.isclose.
+        # une erreur de collecte (valeur tv absente de la table...) n'est relevée qu'après l'émission des messages
+        # des éléments qui la précèdent, comme lors d'un contrôle élément par élément.
+        checks = list()
+        expected_values = list()
+        values = list()
+        atols = list()
+        collect_error = None
+        try:
+            for tv in all_tv_found:
+                parent = tv.getparent()
+                parent_dict = None
+                name = tv.tag
+                name_wo_id = '_'.join(name.split('_')[1:-1])
+                tv_value = convert_xml_text(tv.text)
+                value_varname_list = tv_table_to_value[name_wo_id]['values']
+                double_fenetre = parent.find('double_fenetre')
+                if double_fenetre is not None:
+                    # dans le cas d'une double fenêtre on ne contrôle pas la cohérence tv/value dans le cas de double fenêtre.
+                    if double_fenetre.text == '1':
+                        continue
 
-        for tv in all_tv_found:
-            parent = tv.getparent()
-            parent_dict = element_to_value_dict(parent)
-            name = tv.tag
-            name_wo_id = '_'.join(name.split('_')[1:-1])
-            tv_value = convert_xml_text(tv.text)
-            value_varname_list = tv_table_to_value[name_wo_id]['values']
-            double_fenetre = parent.find('double_fenetre')
-            if double_fenetre is not None:
-                # dans le cas d'une double fenêtre on ne contrôle pas la cohérence tv/value dans le cas de double fenêtre.
-                if double_fenetre.text == '1':
+                if name_wo_id in complex_values_list or tv_value is None:
                     continue
 
-            if name_wo_id not in complex_values_list:
-
-                if tv_value is not None:
-
-                    # controle coherence avec valeur
-
-                    for value_varname in value_varname_list:
-                        if parent.find(value_varname) is not None:
-                            value = parent_dict[value_varname]
-                        else:
-                            value = parent.getparent().find(f'donnee_intermediaire/{value_varname}')
-                            if value is not None:
-                                value = convert_xml_text(value.text)
+                # controle coherence avec valeur
+                for value_varname in value_varname_list:
+                    if parent.find(value_varname) is not None:
+                        if parent_dict is None:
+                            parent_dict = element_to_value_dict(parent)
+                        value = parent_dict[value_varname]
+                    else:
+                        value = parent.getparent().find(f'donnee_intermediaire/{value_varname}')
                         if value is not None:
+                            value = convert_xml_text(value.text)
+                    if value is not None:
+                        tv_value_array = self.tv_value_arrays[name]
+                        expected_column = tv_value_array['columns'][tv_table_to_value[name_wo_id]['tv_value_name']]
+                        expected_values.append(expected_column[tv_value_array['row'][tv_value]])
+                        values.append(value)
+                        atols.append(tv_table_to_value[name_wo_id]['atol'])
+                        checks.append((tv, parent, name, name_wo_id, tv_value, value_varname, value))
+        except Exception as e:
+            collect_error = e
 
-                            tv_value_name = tv_table_to_value[name_wo_id]['tv_value_name']
-                            expected_value = self.valeur_table_dict[name][tv_value][tv_value_name]
-                            if name_wo_id == "seer":
-                                expected_seer_value = self.valeur_table_dict[name][tv_value]['seer']
+        try:
+            is_close = np.isclose(np.array(expected_values, dtype=float), np.array(values, dtype=float),
+                                  atol=np.array(atols, dtype=float))
+        except (TypeError, ValueError):
+            # valeur déclarée non numérique : comparaison élément par élément
+            is_close = None
+
+        # seuls les écarts sont traités élément par élément pour la rédaction des messages
+        for i, (tv, parent, name, name_wo_id, tv_value, value_varname, value) in enumerate(checks):
+            if is_close is not None:
+                if is_close[i]:
+                    continue
+            elif np.isclose(expected_values[i], value, atol=atols[i]):
+                continue
+            tv_value_name = tv_table_to_value[name_wo_id]['tv_value_name']
+            expected_value = self.valeur_table_dict[name][tv_value][tv_value_name]
+            if name_wo_id == "seer":
+                expected_seer_value = self.valeur_table_dict[name][tv_value]['seer']
 
-                            if not np.isclose(expected_value, value, atol=tv_table_to_value[name_wo_id]['atol']):
-                                if name_wo_id not in specific_values_list:
-                                    msg = f"""
+            if name_wo_id not in specific_values_list:
+                msg = f"""
 la valeur de {value_varname} ne correspond pas à la valeur attendue de 
 la table de valeur :
 
@@ -1289,13 +1451,13 @@ valeur : {value}
 valeur table : {expected_value} 
 {name} : {tv_value}
 """
-                                    report.generate_msg(msg=msg,
-                                                        msg_type='erreur_logiciel',
-                                                        msg_theme='bad_value_tv',
-                                                        msg_importance='blocker',
-                                                        related_objects=[tv, parent])
-                                elif name_wo_id == 'coef_transparence_ets':
-                                    msg = f"""
+                report.generate_msg(msg=msg,
+                                    msg_type='erreur_logiciel',
+                                    msg_theme='bad_value_tv',
+                                    msg_importance='blocker',
+                                    related_objects=[tv, parent])
+            elif name_wo_id == 'coef_transparence_ets':
+                msg = f"""
 la valeur de {value_varname} ne correspond pas à la valeur attendue de 
 la table de valeur :
 
@@ -1306,30 +1468,30 @@ valeur table : {expected_value}
 Dans le cas de coef_transparence_ets ceci n'est possible que dans le cas extrêmement rare
 où l'on n'est pas en mesure de déterminer un vitrage majoritaire pour l'espace tampon
 """
-                                    report.generate_msg(msg=msg,
-                                                        msg_type='warning_logiciel',
-                                                        msg_theme='bad_value_tv',
-                                                        msg_importance='critical',
-                                                        related_objects=[tv, parent])
-                                elif name_wo_id in ['umur', 'upb', 'uph']:
-                                    u0 = parent.getparent().find(f'donnee_intermediaire/{name_wo_id}0')
-                                    if u0 is not None:
-                                        u0_value = convert_xml_text(u0.text)
-                                        #                                         enum_type_doublage_id = parent.find('enum_type_doublage_id')
-                                        #                                         is_doublage = False
-                                        #                                         if enum_type_doublage_id is not None:
-                                        #                                             is_doublage = enum_type_doublage_id.text in ["3", "4", "5"]
-                                        #                                         if is_doublage:
-                                        #                                             # dans le cas d'un doublage on calcule le U en ajoutant la résistance du doublage
-                                        #                                             r_doublage = type_doublage_to_r_doublage[enum_type_doublage_id.text]
-                                        #                                             expected_value_table =expected_value
-                                        #                                             expected_value = np.minimum(expected_value,u0_value)
-                                        #                                             expected_value_with_doublage = 1 / ((1 / expected_value)+r_doublage)
-                                        #                                             # on vérifie que la valeur avec prise en compte du doublage est inférieure ou égale à la valeur saisie.
-                                        #                                             # La comparaison stricte n'est pas effectuée par sécurité à cause d'un point de détail d'interprétation de la méthode
-                                        #                                             # (est ce que la resistance de doublage s'applique aussi sur les parois qui ne sont pas nues d'isolation).
-                                        #                                             if (not np.isclose(expected_value_with_doublage,value,atol=tv_table_to_value[name_wo_id]['atol'])) & (not np.isclose(expected_value,value,atol=tv_table_to_value[name_wo_id]['atol'])):
-                                        #                                                 msg = f"""
+                report.generate_msg(msg=msg,
+                                    msg_type='warning_logiciel',
+                                    msg_theme='bad_value_tv',
+                                    msg_importance='critical',
+                                    related_objects=[tv, parent])
+            elif name_wo_id in ['umur', 'upb', 'uph']:
+                u0 = parent.getparent().find(f'donnee_intermediaire/{name_wo_id}0')
+                if u0 is not None:
+                    u0_value = convert_xml_text(u0.text)
+                    #                                         enum_type_doublage_id = parent.find('enum_type_doublage_id')
+                    #                                         is_doublage = False
+                    #                                         if enum_type_doublage_id is not None:
+                    #                                             is_doublage = enum_type_doublage_id.text in ["3", "4", "5"]
+                    #                                         if is_doublage:
+                    #                                             # dans le cas d'un doublage on calcule le U en ajoutant la résistance du doublage
+                    #                                             r_doublage = type_doublage_to_r_doublage[enum_type_doublage_id.text]
+                    #                                             expected_value_table =expected_value
+                    #                                             expected_value = np.minimum(expected_value,u0_value)
+                    #                                             expected_value_with_doublage = 1 / ((1 / expected_value)+r_doublage)
+                    #                                             # on vérifie que la valeur avec prise en compte du doublage est inférieure ou égale à la valeur saisie.
+                    #                                             # La comparaison stricte n'est pas effectuée par sécurité à cause d'un point de détail d'interprétation de la méthode
+                    #                                             # (est ce que la resistance de doublage s'applique aussi sur les parois qui ne sont pas nues d'isolation).
+                    #                                             if (not np.isclose(expected_value_with_doublage,value,atol=tv_table_to_value[name_wo_id]['atol'])) & (not np.isclose(expected_value,value,atol=tv_table_to_value[name_wo_id]['atol'])):
+                    #                                                 msg = f"""
                                         # la valeur de {value_varname} ne correspond pas à la valeur attendue de
                                         # la table de valeur OU à la valeur attendue pour une paroi avec doublage OU à la valeur du U0 en cas de U0 meilleur que la table de valeur.
                                         #
@@ -1339,13 +1501,13 @@ où l'on n'est pas en mesure de déterminer un vitrage majoritaire pour l'espace
                                         # {name} : {tv_value}
                                         # valeur {value_varname}0 : {u0_value}
                                         #                                                 """
-                                        #                                                 report.generate_msg(msg=msg,
-                                        #                                                                     msg_type='erreur_logiciel',
-                                        #                                                                     msg_theme='bad_value_tv',
-                                        #                                                                     msg_importance='blocker',
-                                        #                                                                     related_objects=[tv, parent])
-                                        if not np.isclose(value, u0_value, atol=tv_table_to_value[name_wo_id]['atol']):
-                                            msg = f"""
+                    #                                                 report.generate_msg(msg=msg,
+                    #                                                                     msg_type='erreur_logiciel',
+                    #                                                                     msg_theme='bad_value_tv',
+                    #                                                                     msg_importance='blocker',
+                    #                                                                     related_objects=[tv, parent])
+                    if not np.isclose(value, u0_value, atol=tv_table_to_value[name_wo_id]['atol']):
+                        msg = f"""
 la valeur de {value_varname} ne correspond pas à la valeur attendue de 
 la table de valeur. De plus {value_varname}0 est différent de {value_varname}.
 
@@ -1354,15 +1516,15 @@ valeur table : {expected_value}
 {name} : {tv_value}
 valeur {value_varname}0 : {u0_value} 
     """
-                                            report.generate_msg(msg=msg,
-                                                                msg_type='erreur_logiciel',
-                                                                msg_theme='bad_value_tv',
-                                                                msg_importance='blocker',
-                                                                related_objects=[tv, parent])
+                        report.generate_msg(msg=msg,
+                                            msg_type='erreur_logiciel',
+                                            msg_theme='bad_value_tv',
+                                            msg_importance='blocker',
+                                            related_objects=[tv, parent])
 
-                                    else:
+                else:
 
-                                        msg = f"""
+                    msg = f"""
 la valeur de {value_varname} ne correspond pas à la valeur attendue de 
 la table de valeur. 
 de plus la valeur {name_wo_id}0 n'est pas déclarée pour l'objet. {name_wo_id}0 doit être déclaré lorsque la table de valeur par défaut est utilisée  
@@ -1370,13 +1532,13 @@ valeur : {value}
 valeur table : {expected_value} 
 {name} : {tv_value}
 """
-                                        report.generate_msg(msg=msg,
-                                                            msg_type='erreur_logiciel',
-                                                            msg_theme='bad_value_tv',
-                                                            msg_importance='blocker',
-                                                            related_objects=[tv, parent])
-                                elif name_wo_id == 'seer':
-                                    msg = f"""
+                    report.generate_msg(msg=msg,
+                                        msg_type='erreur_logiciel',
+                                        msg_theme='bad_value_tv',
+                                        msg_importance='blocker',
+                                        related_objects=[tv, parent])
+            elif name_wo_id == 'seer':
+                msg = f"""
 la valeur du SEER/EER ne correspond pas à la valeur attendue de 
 la table de valeur :
 
@@ -1386,18 +1548,22 @@ valeur du EER de la table : {expected_seer_value}
 
 {name} : {tv_value}
                                     """
-                                    report.generate_msg(msg=msg,
-                                                        msg_type='erreur_logiciel',
-                                                        msg_theme='bad_value_tv',
-                                                        msg_importance='blocker',
-                                                        related_objects=[tv, parent])
+                report.generate_msg(msg=msg,
+                                    msg_type='erreur_logiciel',
+                                    msg_theme='bad_value_tv',
+                                    msg_importance='blocker',
+                                    related_objects=[tv, parent])
+
+        if collect_error is not None:
+            raise collect_error
 
     def controle_coherence_mutually_exclusive(self, logement, report):
+        index = self.get_document_index(logement, report)
 
         for exclusives in mutually_exclusive_elements:
             for ex in exclusives:
 
-                for el in logement.iterfind(f'*//{ex}'):
+                for el in index.iterfind(logement, f'*//{ex}'):
                     parent = el.getparent()
                     found = [found for found in element_to_value_dict(parent) if found in exclusives]
                     if len(found) > 1:
@@ -1412,15 +1578,14 @@ valeur du EER de la table : {expected_seer_value}
                                             related_objects=[parent])
 
     def controle_coherence_energie_vs_generateur(self, logement, report):
+        index = self.get_document_index(logement, report)
         # pour le chauffage
-        type_generateur_ch_table = self.enum_table['type_generateur_ch']
-
-        for el in logement.iterfind('.//generateur_chauffage'):
+        for el in index.iterfind(logement, './/generateur_chauffage'):
             el_type_energie = el.find('.//enum_type_energie_id')
             type_energie_id = int(el_type_energie.text)
             el_type_generateur_chauffage = el.find('.//enum_type_generateur_ch_id')
             type_generateur_ch_id = int(el_type_generateur_chauffage.text)
-            type_generateur_ch_property = type_generateur_ch_table.loc[type_generateur_ch_id].to_dict()
+            type_generateur_ch_property = self.get_enum_row('type_generateur_ch', type_generateur_ch_id)
             energies_admissibles_id = [int(el) for el in str(type_generateur_ch_property['enum_type_energie_id']).split('|')]
 
             if type_energie_id not in energies_admissibles_id:
@@ -1437,14 +1602,12 @@ type d'énergies admissibles : {self.display_enum_traduction('enum_type_energie_
 
         # pour l'ECS
 
-        type_generateur_ecs_table = self.enum_table['type_generateur_ecs']
-
         for el in logement.iterfind('.//generateur_ecs'):
             el_type_energie = el.find('.//enum_type_energie_id')
             type_energie_id = int(el_type_energie.text)
             el_type_generateur_ecs = el.find('.//enum_type_generateur_ecs_id')
             type_generateur_ecs_id = int(el_type_generateur_ecs.text)
-            type_generateur_ecs_property = type_generateur_ecs_table.loc[type_generateur_ecs_id].to_dict()
+            type_generateur_ecs_property = self.get_enum_row('type_generateur_ecs', type_generateur_ecs_id)
             energies_admissibles_id = [int(el) for el in str(type_generateur_ecs_property['enum_type_energie_id']).split('|')]
 
             if type_energie_id not in energies_admissibles_id:
@@ -1461,9 +1624,10 @@ ceci sera une erreur bloquante dans une future version.
                                     related_objects=[el_type_generateur_ecs, el_type_energie])
 
     def controle_coherence_correspondance_saisi_value(self, logement, report):
+        index = self.get_document_index(logement, report)
         for el_saisi in elements_saisi:
 
-            for found in logement.iterfind(f'*//{el_saisi}'):
+            for found in index.iterfind(logement, f'*//{el_saisi}'):
                 de = found.getparent()
                 double_fenetre = de.find('double_fenetre')
                 if double_fenetre is not None:
@@ -1497,10 +1661,10 @@ ceci sera une erreur bloquante dans une future version.
                                             related_objects=[de, di])
 
     def controle_coherence_structure_installation_chauffage(self, logement, report):
-        cfg_installation_ch_table = self.enum_table['cfg_installation_ch']
-        for installation in logement.iterfind('*//installation_chauffage'):
+        index = self.get_document_index(logement, report)
+        for installation in index.iterfind(logement, '*//installation_chauffage'):
             id_ = convert_xml_text(installation.find('*//enum_cfg_installation_ch_id').text)
-            cfg_inst = cfg_installation_ch_table.loc[id_].to_dict()
+            cfg_inst = self.get_enum_row('cfg_installation_ch', id_)
             nb_gen_expected = cfg_inst['nombre_generateur']
             comparaison_key = cfg_inst['comparaison_nombre_generateur']
             if len(list(installation.iterfind('*//priorite_generateur_cascade'))) > 1:
@@ -1591,10 +1755,8 @@ ceci sera une erreur bloquante dans une future version.
                                             related_objects=[installation]+el_lien_em+el_lien_gen,
                                             msg_importance='blocker')
 
-            tv_reg = self.valeur_table['rendement_regulation']
-            tv_em = self.valeur_table['rendement_emission']
-            enum_table_type_emission_distribution = self.enum_table['type_emission_distribution'].copy()
-            enum_table_type_emission_distribution.enum_type_generateur_ch_id = enum_table_type_emission_distribution.enum_type_generateur_ch_id.astype(str).apply(lambda x: [int(el) for el in x.split('|')] )
+            tv_reg = self.valeur_table_dict['tv_rendement_regulation_id']
+            tv_em = self.valeur_table_dict['tv_rendement_emission_id']
 
             # nouveaux contrôles de cohérences régulation et emission en cohérence avec les générateurs
             for lien_em in installation.iterfind('*//emetteur_chauffage//enum_lien_generateur_emetteur_id'):
@@ -1606,18 +1768,18 @@ ceci sera une erreur bloquante dans une future version.
 
                 liens_gen_associe = [el for el in el_lien_gen if el.text == lien_em_txt]
                 if len(liens_gen_associe) > 0:
-                    list_valid_generateur_reg = tv_reg.loc[tv_reg.tv_rendement_regulation_id == tv_rd_reg_id].enum_type_generateur_ch_id.iloc[0]
-                    list_valid_generateur_em = tv_em.loc[tv_em.tv_rendement_emission_id == tv_rd_em_id].enum_type_generateur_ch_id.iloc[0]
-                    list_valid_generateur_em_distrib = enum_table_type_emission_distribution.loc[enum_type_emission_distribution_id].enum_type_generateur_ch_id
-                    type_emission_distribution_lib = enum_table_type_emission_distribution.loc[enum_type_emission_distribution_id].lib
+                    list_valid_generateur_reg = tv_reg[tv_rd_reg_id]['enum_type_generateur_ch_id']
+                    list_valid_generateur_em = tv_em[tv_rd_em_id]['enum_type_generateur_ch_id']
+                    list_valid_generateur_em_distrib = self.generateurs_by_type_emission_distribution[enum_type_emission_distribution_id]
+                    type_emission_distribution_lib = self.get_enum_value('type_emission_distribution', enum_type_emission_distribution_id, 'lib')
 
 
                     # liste des id générateurs associés à ce type d'emetteurs
                     list_id_generateur = [int(el.getparent().find('enum_type_generateur_ch_id').text) for el in liens_gen_associe]
 
-                    type_emission_regulation = tv_reg.loc[tv_reg.tv_rendement_regulation_id == tv_rd_reg_id].type_emission_regulation.iloc[0]
+                    type_emission_regulation = tv_reg[tv_rd_reg_id]['type_emission_regulation']
 
-                    type_emission = tv_em.loc[tv_em.tv_rendement_emission_id == tv_rd_em_id].type_emission.iloc[0]
+                    type_emission = tv_em[tv_rd_em_id]['type_emission']
 
                     if (set(list_id_generateur) & set(list_valid_generateur_reg)) == set():
                         related_objects = [lien_em] + liens_gen_associe
@@ -1683,8 +1845,9 @@ Il existe un générateur de type PAC air/air déclaré mais aucun système de c
         Vérifie la cohérence entre 'tv_rendement_regulation_id' et 'enum_type_regulation_id'
         pour chaque émetteur de chauffage.
         """
+        index = self.get_document_index(logement, report)
         table_regulation = self.valeur_table_dict['tv_rendement_regulation_id']
-        for emetteur in logement.iterfind('*//emetteur_chauffage'):
+        for emetteur in index.iterfind(logement, '*//emetteur_chauffage'):
             tv_rendement_regulation_id = emetteur.find('*//tv_rendement_regulation_id').text
             enum_type_regulation_id = emetteur.find('*//enum_type_regulation_id').text
             type_regulation_lib = self.enum_dict['enum_type_regulation_id'][int(enum_type_regulation_id)]
@@ -1692,7 +1855,7 @@ Il existe un générateur de type PAC air/air déclaré mais aucun système de c
                 tv_rendement_regulation_id = int(tv_rendement_regulation_id)
                 regulation_data = table_regulation.get(tv_rendement_regulation_id)
                 expected_regulation_id = regulation_data['type_regulation']
-                if not pd.isnull(expected_regulation_id) and len(expected_regulation_id)>0:
+                if not is_null(expected_regulation_id) and len(expected_regulation_id)>0:
                     if type_regulation_lib != expected_regulation_id:
                         msg = f"""Incohérence régulation émetteur détectée : tv_rendement_regulation_id={tv_rendement_regulation_id} : {regulation_data['type_emission_regulation']} nécessite un enum_type_regulation_id avec {expected_regulation_id}
                         or le type de régulation déclaré est :  {self.display_enum_traduction('enum_type_regulation_id', int(enum_type_regulation_id))}."""
@@ -1735,8 +1898,7 @@ Il existe un générateur de type PAC air/air déclaré mais aucun système de c
                                         related_objects=related_objects,
                                         msg_importance='blocker')
         id_methode_application_dpe_log = convert_xml_text(logement.find('*//enum_methode_application_dpe_log_id').text)
-        surface_reference_name = self.enum_table['methode_application_dpe_log'].loc[
-            id_methode_application_dpe_log].surface_reference
+        surface_reference_name = self.get_enum_value('methode_application_dpe_log', id_methode_application_dpe_log, 'surface_reference')
         el_surface_reference = logement.find('*//enum_methode_application_dpe_log_id').getparent().find(
             surface_reference_name)
         if el_surface_reference is None:
@@ -1828,11 +1990,12 @@ n'est pas déclarée. Elle est obligatoire pour ce type de DPE.
         Vérifie que la surface habitable de l'immeuble est supérieure à celle du logement,
         uniquement si les deux balises existent et contiennent des valeurs numériques.
         """
+        index = self.get_document_index(logement, report)
 
         # Récupération des balises dans le XML
-        surface_immeuble_element = logement.find('.//surface_habitable_immeuble')
-        surface_logement_element = logement.find('.//surface_habitable_logement')
-        nombre_appartement = logement.find('.//nombre_appartement')
+        surface_immeuble_element = index.find(logement, './/surface_habitable_immeuble')
+        surface_logement_element = index.find(logement, './/surface_habitable_logement')
+        nombre_appartement = index.find(logement, './/nombre_appartement')
 
 
         # Applique le controle que si les surfaces immeuble et logement sont définies
@@ -2014,9 +2177,11 @@ tv_coef_masque_lointain_homogene_id est déclaré conjointement avec masque_loin
                                             msg_importance='critical')
 
     def controle_coherence_hors_methode(self, logement, report):
+        index = self.get_document_index(logement, report)
 
-        for enum_name, v in self.enum_hors_methode_dict.items():
-            for enum in logement.iterfind(f'*//{enum_name}'):
+        for enum_name, enums in self.rule_dispatcher.iter_elements(index, logement, RULE_HORS_METHODE, min_depth=2):
+            v = self.enum_hors_methode_dict[enum_name]
+            for enum in enums:
                 enum_value = convert_xml_text(enum.text)
                 if v[enum_value] == 1:
                     msg = f"""
@@ -2031,12 +2196,13 @@ tv_coef_masque_lointain_homogene_id est déclaré conjointement avec masque_loin
                                         msg_importance='major')
 
     def controle_coherence_existence_composants(self, logement, report):
+        index = self.get_document_index(logement, report)
 
-        methode_dpe_id = int(logement.find('*//enum_methode_application_dpe_log_id').text)
-        type_batiment = self.enum_table['methode_application_dpe_log'].loc[methode_dpe_id].type_batiment
+        methode_dpe_id = int(index.find(logement, '*//enum_methode_application_dpe_log_id').text)
+        type_batiment = self.get_enum_value('methode_application_dpe_log', methode_dpe_id, 'type_batiment')
 
         for element_enveloppe in expected_components[type_batiment]:
-            if len(list(logement.iterfind(f'*//{element_enveloppe}'))) == 0:
+            if len(list(index.iterfind(logement, f'*//{element_enveloppe}'))) == 0:
                 msg = f"""
                 aucun {' '.join(element_enveloppe.split('_'))} n'est saisi pour ce DPE {type_batiment}. Ceci constitue une anomalie importante dans la grande majorité des cas.   
                 """
@@ -2047,13 +2213,14 @@ tv_coef_masque_lointain_homogene_id est déclaré conjointement avec masque_loin
                                     msg_importance='critical')
 
     def controle_coherence_pont_thermique(self, logement, report):
-        periode_construction_id = int(logement.find('*//enum_periode_construction_id').text)
+        index = self.get_document_index(logement, report)
+        periode_construction_id = int(index.find(logement, '*//enum_periode_construction_id').text)
         # controle aucun pt de certaine catégorie.
         type_liaison_num = [int(el.text) for el in
                             list(logement.iterfind('*//pont_thermique/donnee_entree/enum_type_liaison_id'))]
 
-        methode_dpe = int(logement.find('*//enum_methode_application_dpe_log_id').text)
-        type_batiment = self.enum_table['methode_application_dpe_log'].loc[methode_dpe].type_batiment
+        methode_dpe = int(index.find(logement, '*//enum_methode_application_dpe_log_id').text)
+        type_batiment = self.get_enum_value('methode_application_dpe_log', methode_dpe, 'type_batiment')
 
         missing_type_liaison_num = expected_pt_liaison[type_batiment] - set(type_liaison_num)
 
@@ -2080,8 +2247,7 @@ tv_coef_masque_lointain_homogene_id est déclaré conjointement avec masque_loin
         type_isolation_mur_id = [default_isol_for_pt_isol_mais_inconnu['mur'].get(el, el) for el in
                                  type_isolation_mur_id]
 
-        default_isolation_by_period = self.enum_table['periode_construction'].loc[
-            periode_construction_id].defaut_mur_enum_type_isolation_id
+        default_isolation_by_period = self.get_enum_value('periode_construction', periode_construction_id, 'defaut_mur_enum_type_isolation_id')
         default_isolation_by_period = {1: default_isolation_by_period}
         type_isolation_mur_id = [default_isolation_by_period.get(el, el) for el in type_isolation_mur_id]
         type_isolation_mur = [self.enum_dict['enum_type_isolation_id'][el] for el in type_isolation_mur_id]
@@ -2125,10 +2291,8 @@ tv_coef_masque_lointain_homogene_id est déclaré conjointement avec masque_loin
         type_isolation_plancher_bas_id = [default_isol_for_pt_isol_mais_inconnu['plancher_bas'].get(el, el) for el in
                                           type_isolation_plancher_bas_id]
 
-        default_isolation_by_period = self.enum_table['periode_construction'].loc[
-            periode_construction_id].defaut_plancher_bas_enum_type_isolation_id
-        default_isolation_by_period_tp = self.enum_table['periode_construction'].loc[
-            periode_construction_id].defaut_terre_plein_enum_type_isolation_id
+        default_isolation_by_period = self.get_enum_value('periode_construction', periode_construction_id, 'defaut_plancher_bas_enum_type_isolation_id')
+        default_isolation_by_period_tp = self.get_enum_value('periode_construction', periode_construction_id, 'defaut_terre_plein_enum_type_isolation_id')
 
         # gestion de la subtilité terre plein vs autres planchers
         default_isolation_by_period_by_adj = {False: {1: default_isolation_by_period},
@@ -2184,8 +2348,7 @@ tv_coef_masque_lointain_homogene_id est déclaré conjointement avec masque_loin
         type_isolation_plancher_haut_id = [default_isol_for_pt_isol_mais_inconnu['plancher_haut'].get(el, el) for el in
                                            type_isolation_plancher_haut_id]
 
-        default_isolation_by_period = self.enum_table['periode_construction'].loc[
-            periode_construction_id].defaut_plancher_haut_enum_type_isolation_id
+        default_isolation_by_period = self.get_enum_value('periode_construction', periode_construction_id, 'defaut_plancher_haut_enum_type_isolation_id')
         default_isolation_by_period = {1: default_isolation_by_period}
         type_isolation_plancher_haut_id = [default_isolation_by_period.get(el, el) for el in
                                            type_isolation_plancher_haut_id]
@@ -2268,7 +2431,7 @@ tv_coef_masque_lointain_homogene_id est déclaré conjointement avec masque_loin
                                 related_objects=related_objects,
                                 msg_importance='major')
 
-        calcul_pont_thermique_baie = [(self.enum_table['type_vitrage'].loc[int(el.text)].calcul_pont_thermique_baie, int(el.getparent().find('enum_type_adjacence_id').text), int(el.getparent().find('enum_inclinaison_vitrage_id').text),el) for
+        calcul_pont_thermique_baie = [(self.get_enum_value('type_vitrage', int(el.text), 'calcul_pont_thermique_baie'), int(el.getparent().find('enum_type_adjacence_id').text), int(el.getparent().find('enum_inclinaison_vitrage_id').text),el) for
                                       el in logement.iterfind('*//baie_vitree/donnee_entree/enum_type_vitrage_id')]
 
         el_baie_ext_pt = [el[3] for el in calcul_pont_thermique_baie if el[0:3]==(1, 1, 3)]
@@ -2277,7 +2440,7 @@ tv_coef_masque_lointain_homogene_id est déclaré conjointement avec masque_loin
         # on a au moins une baie extérieure verticale qui fait l'objet d'un calcul de pont thermique
         baie_ext_pt = {(1, 1, 3)}.issubset(set(calcul_pont_thermique_baie))
 
-        calcul_pont_thermique_mur = [(self.enum_table['materiaux_structure_mur'].loc[int(el.text)].calcul_pont_thermique_baie, int(el.getparent().find('enum_type_adjacence_id').text),el) for
+        calcul_pont_thermique_mur = [(self.get_enum_value('materiaux_structure_mur', int(el.text), 'calcul_pont_thermique_baie'), int(el.getparent().find('enum_type_adjacence_id').text),el) for
                                      el in logement.iterfind('*//mur//enum_materiaux_structure_mur_id')]
 
         el_mur_ext_pt = [el[2] for el in calcul_pont_thermique_mur if el[0:2] == (1, 1)]
@@ -2305,14 +2468,14 @@ aucun pont thermique n'est saisi pour les intéractions baie/mur. En l'absence d
 
         el_paroi_lourde_pb = [el[1] for el in paroi_lourde_pb if el[0] == 1]
         # on a que des plancher bas lourds
-        paroi_lourde_pb = pd.Series([el[0] for el in paroi_lourde_pb]).min() == 1
+        paroi_lourde_pb = min([el[0] for el in paroi_lourde_pb], default=None) == 1
 
         paroi_lourde_ph = [(int(el.text), el) for
                            el in logement.iterfind('*//plancher_haut//paroi_lourde')]
 
         el_paroi_lourde_ph = [el[1] for el in paroi_lourde_ph if el[0] == 1]
         # on a que des plancher bas lourds
-        paroi_lourde_ph = pd.Series([el[0] for el in paroi_lourde_ph]).min() == 1
+        paroi_lourde_ph = min([el[0] for el in paroi_lourde_ph], default=None) == 1
 
         paroi_lourde_mur_ext = [(int(el.text), int(el.getparent().find('enum_type_adjacence_id').text), el) for
                                 el in logement.iterfind('*//mur//paroi_lourde')]
@@ -2320,7 +2483,7 @@ aucun pont thermique n'est saisi pour les intéractions baie/mur. En l'absence d
         paroi_lourde_mur_ext = [el for el in paroi_lourde_mur_ext if el[1] == 1]
         el_paroi_lourde_mur = [el[2] for el in paroi_lourde_mur_ext if el[0] == 1]
         # on a que des murs lourds
-        paroi_lourde_mur_ext = pd.Series([el[0] for el in paroi_lourde_mur_ext]).min() == 1
+        paroi_lourde_mur_ext = min([el[0] for el in paroi_lourde_mur_ext], default=None) == 1
 
         if paroi_lourde_mur_ext and paroi_lourde_pb and (not {1}.issubset(type_liaison_num)):
             msg = f"""
@@ -2343,19 +2506,19 @@ Ceci est une anomalie dans la très grande majorité des cas. Cet avertissement
                                 msg_importance='blocker')
 
     def controle_coherence_enveloppe(self, logement, report):
+        index = self.get_document_index(logement, report)
 
         # coherence isolation pour b et isolation déclarée de la paroi
-        periode_construction_id = int(logement.find('*//enum_periode_construction_id').text)
+        periode_construction_id = int(index.find(logement, '*//enum_periode_construction_id').text)
 
-        type_isolation = [el for el in logement.iterfind('*//enum_type_isolation_id')]
+        type_isolation = [el for el in index.iterfind(logement, '*//enum_type_isolation_id')]
         type_isolation_lnc = [el for el in type_isolation if
                               el.getparent().find('enum_cfg_isolation_lnc_id') is not None]
         cfg_isolation_lnc = [el.getparent().find('enum_cfg_isolation_lnc_id') for el in type_isolation_lnc]
         type_paroi_lnc = [el.getparent().getparent().tag for el in type_isolation_lnc]
         type_isolation_lnc_id = [int(el.text) for el in type_isolation_lnc]
-        pc_tab = self.enum_table['periode_construction']
-        pc_id = periode_construction_id
-        type_isolation_lnc_id = [{1: pc_tab.loc[pc_id][f'defaut_{paroi}_enum_type_isolation_id']}.get(el, el) for
+        pc_row = self.get_enum_row('periode_construction', periode_construction_id)
+        type_isolation_lnc_id = [{1: pc_row[f'defaut_{paroi}_enum_type_isolation_id']}.get(el, el) for
                                  el, paroi in zip(type_isolation_lnc_id, type_paroi_lnc)]
         is_isole_lnc = [el in range(3, 10) for el in type_isolation_lnc_id]
 
@@ -2400,7 +2563,7 @@ Ceci est une anomalie dans la très grande majorité des cas. Cet avertissement
 
         # cohérence type paroi autorisée pour adjacence
 
-        type_paroi_autorise_dict = self.enum_table['type_adjacence']['type_paroi_autorise'].to_dict()
+        type_paroi_autorise_dict = self.get_enum_column('type_adjacence', 'type_paroi_autorise', dropna=False)
         for el_type_adjacence in logement.iterfind('*//enum_type_adjacence_id'):
             type_adjacence_id = int(el_type_adjacence.text)
             type_paroi_autorise = type_paroi_autorise_dict[type_adjacence_id].split('|')
@@ -2582,8 +2745,9 @@ Ceci est une anomalie dans la très grande majorité des cas. Cet avertissement
         for el_paroi_lourde in logement.iterfind('*//mur//paroi_lourde'):
             materiau = int(el_paroi_lourde.getparent().find('enum_materiaux_structure_mur_id').text)
             paroi_lourde = int(el_paroi_lourde.text)
-            expected_paroi_lourde = self.enum_table['materiaux_structure_mur'].loc[materiau].fillna(0).paroi_lourde
-            min_epaisseur = self.enum_table['materiaux_structure_mur'].loc[materiau].fillna(0).paroi_lourde_epaisseur
+            materiau_row = self.get_enum_row('materiaux_structure_mur', materiau)
+            expected_paroi_lourde = 0 if is_null(materiau_row['paroi_lourde']) else materiau_row['paroi_lourde']
+            min_epaisseur = 0 if is_null(materiau_row['paroi_lourde_epaisseur']) else materiau_row['paroi_lourde_epaisseur']
             type_isolation = int(el_paroi_lourde.getparent().find('enum_type_isolation_id').text)
             type_adjacence = int(el_paroi_lourde.getparent().find('enum_type_adjacence_id').text)
             if el_paroi_lourde.getparent().find('epaisseur_structure') is not None:
@@ -2612,14 +2776,15 @@ Ceci est une anomalie dans la très grande majorité des cas. Cet avertissement
                                     )
 
     def controle_coherence_systeme(self, logement, report):
+        index = self.get_document_index(logement, report)
 
-        periode_construction_id = int(logement.find('*//enum_periode_construction_id').text)
+        periode_construction_id = int(index.find(logement, '*//enum_periode_construction_id').text)
 
         # vérification cohérence période de ventilation
 
-        periode_ventilation = self.enum_table['type_ventilation'].periode_construction.dropna().to_dict()
+        periode_ventilation = self.get_enum_column('type_ventilation', 'periode_construction')
 
-        for el_type_ventilation in logement.iterfind('*//enum_type_ventilation_id'):
+        for el_type_ventilation in index.iterfind(logement, '*//enum_type_ventilation_id'):
             type_ventilation_id = int(el_type_ventilation.text)
             periodes = periode_ventilation.get(type_ventilation_id)
             if periodes is not None:
@@ -2639,7 +2804,7 @@ Ceci est une anomalie dans la très grande majorité des cas. Cet avertissement
 
         # controle de cohérence valeur rpn/rpint
 
-        rpn_sup_rpint = self.enum_table['type_generateur_ch']['rpn_sup_rpint'].dropna()
+        rpn_sup_rpint = self.get_enum_column('type_generateur_ch', 'rpn_sup_rpint')
         for el_rpn in logement.iterfind('*//generateur_chauffage//rpn'):
             el_rpint = el_rpn.getparent().find('rpint')
             if el_rpint is not None:
@@ -2678,7 +2843,7 @@ Ceci est une anomalie dans la très grande majorité des cas. Cet avertissement
                                             msg_importance="minor"
                                             )
         # controle coherence intermittence inertie
-        intermittence_inertie_dict = self.valeur_table['intermittence'].enum_classe_inertie_id.dropna().to_dict()
+        intermittence_inertie_dict = self.valeur_lookup['intermittence'].column('enum_classe_inertie_id')
         for el_intermittence in logement.iterfind('*//tv_intermittence_id'):
             intermittence_id = int(el_intermittence.text)
             intermittence_inertie = intermittence_inertie_dict.get(intermittence_id)
@@ -2701,9 +2866,8 @@ Ceci est une anomalie dans la très grande majorité des cas. Cet avertissement
 
         # position probable des générateurs (volume chauffé) comparé avec valeur déclarée.
         methode_dpe = int(logement.find('*//enum_methode_application_dpe_log_id').text)
-        type_batiment = self.enum_table['methode_application_dpe_log'].loc[methode_dpe].type_batiment
-        pos_prob_vol_ch_dict = self.enum_table['type_generateur_ch'][
-            'position_probable_volume_chauffe'].dropna().to_dict()
+        type_batiment = self.get_enum_value('methode_application_dpe_log', methode_dpe, 'type_batiment')
+        pos_prob_vol_ch_dict = self.get_enum_column('type_generateur_ch', 'position_probable_volume_chauffe')
         for el_type_generateur_ch in logement.iterfind('*//enum_type_generateur_ch_id'):
             type_generateur_ch_id = int(el_type_generateur_ch.text)
             position_probable_volume_chauffe = pos_prob_vol_ch_dict.get(type_generateur_ch_id)
@@ -2732,8 +2896,7 @@ Ceci est une anomalie dans la très grande majorité des cas. Cet avertissement
                                         related_objects=related_objects,
                                         msg_importance='minor')
 
-        pos_prob_vol_ecs_dict = self.enum_table['type_generateur_ecs'][
-            'position_probable_volume_chauffe'].dropna().to_dict()
+        pos_prob_vol_ecs_dict = self.get_enum_column('type_generateur_ecs', 'position_probable_volume_chauffe')
         for el_type_generateur_ecs in logement.iterfind('*//enum_type_generateur_ecs_id'):
             type_generateur_ecs_id = int(el_type_generateur_ecs.text)
             position_probable_volume_chauffe = pos_prob_vol_ecs_dict.get(type_generateur_ecs_id)
@@ -2764,15 +2927,15 @@ Ceci est une anomalie dans la très grande majorité des cas. Cet avertissement
         """
         Ce contrôle de cohérence ne s'applique que dans le cas d'un DPE appartement réalisé à partir d'un DPE immeuble.
         """
-        methode_dpe = int(logement.find('*//enum_methode_application_dpe_log_id').text)
-        methode_application_dpe = self.enum_table['methode_application_dpe_log'].loc[
-            methode_dpe].methode_application_dpe
+        index = self.get_document_index(logement, report)
+        methode_dpe = int(index.find(logement, '*//enum_methode_application_dpe_log_id').text)
+        methode_application_dpe = self.get_enum_value('methode_application_dpe_log', methode_dpe, 'methode_application_dpe')
 
         is_dpe_appartement_immeuble = methode_application_dpe == 'dpe appartement généré à partir des données DPE immeuble'
 
         if is_dpe_appartement_immeuble:
             for container_name, cle_repartition in systeme_to_cle_repartition.items():
-                for container_object in logement.iterfind(f'*//{container_name}'):
+                for container_object in index.iterfind(logement, f'*//{container_name}'):
                     el_cle_repartition = container_object.find(f'*//{cle_repartition}')
                     if el_cle_repartition is None:
                         msg = f"""
@@ -2925,11 +3088,12 @@ Le générateur en question ne correspond pas à cette configuration.
                                         msg_importance='blocker')
 
     def controle_coherence_unicite_reference(self, logement, report):
+        index = self.get_document_index(logement, report)
 
-        all_references = list(logement.iterfind('*//reference'))
+        all_references = list(index.iterfind(logement, '*//reference'))
         # gestion d'étape travaux (on supprime toutes les références dans etape travaux (car ce sont des liens vers references existantes).
 
-        etape_travaux = logement.find('.//etape_travaux')
+        etape_travaux = index.find(logement, './/etape_travaux')
         if etape_travaux is not None:
             all_elements_etape_travaux = list(etape_travaux.iterfind('*//reference'))
             all_references = [el for el in all_references if el not in all_elements_etape_travaux]
@@ -2948,13 +3112,13 @@ Le générateur en question ne correspond pas à cette configuration.
                 msg_importance='blocker')
 
     def controle_coherence_modele_methode_application(self, logement, report):
+        index = self.get_document_index(logement, report)
         xml_reg = logement.getroottree().getroot()
-        enum_modele_dpe_id = xml_reg.find('*//enum_modele_dpe_id')
-        enum_modele_audit_id = xml_reg.find('*//enum_modele_audit_id')
+        enum_modele_dpe_id = index.find(xml_reg, '*//enum_modele_dpe_id')
+        enum_modele_audit_id = index.find(xml_reg, '*//enum_modele_audit_id')
         if enum_modele_dpe_id is not None:
-            enum_methode_application_dpe_log_id = logement.find('*//enum_methode_application_dpe_log_id')
-            enum_modele_dpe_id_associe = str(self.enum_table['methode_application_dpe_log'].loc[
-                                                 int(enum_methode_application_dpe_log_id.text)].enum_modele_dpe_id)
+            enum_methode_application_dpe_log_id = index.find(logement, '*//enum_methode_application_dpe_log_id')
+            enum_modele_dpe_id_associe = str(self.get_enum_value('methode_application_dpe_log', int(enum_methode_application_dpe_log_id.text), 'enum_modele_dpe_id'))
             if enum_modele_dpe_id.text != enum_modele_dpe_id_associe:
                 report.generate_msg(f"""
 la méthode d'application du dpe n'est pas compatible avec le modèle choisi : un modèle DPE logement neuf est appliqué avec une méthode DPE logement existant ou l'inverse
@@ -2968,8 +3132,7 @@ methode d'application : {self.display_enum_traduction('enum_methode_application_
         elif enum_modele_audit_id is not None:
             enum_methode_application_dpe_log_id_list = list(logement.iterfind('*//enum_methode_application_dpe_log_id'))
             for enum_methode_application_dpe_log_id in enum_methode_application_dpe_log_id_list:
-                enum_modele_audit_id_associe = str(self.enum_table['methode_application_dpe_log'].loc[
-                                                       int(enum_methode_application_dpe_log_id.text)].enum_modele_audit_id)
+                enum_modele_audit_id_associe = str(self.get_enum_value('methode_application_dpe_log', int(enum_methode_application_dpe_log_id.text), 'enum_modele_audit_id'))
                 if enum_modele_audit_id_associe == '0':
                     report.generate_msg(f"""
 l'audit énergétique ne peut utiliser : ni une méthode d'application pour les bâtiments neufs, ni une méthode d'application d'appartement à partir de l'immeuble.
@@ -2991,7 +3154,8 @@ methode d'application : {self.display_enum_traduction('enum_methode_application_
                                         msg_importance='blocker')
 
     def controle_coherence_double_fenetre(self, logement, report):
-        for double_fenetre in logement.iterfind('*//double_fenetre'):
+        index = self.get_document_index(logement, report)
+        for double_fenetre in index.iterfind(logement, '*//double_fenetre'):
             double_fenetre_value = int(double_fenetre.text)
             # si double fenetre alors on vérifie que la sous structure est saisie
             if double_fenetre_value == 1:
@@ -3006,17 +3170,13 @@ une baie_vitree est déclarée en double fenetre sans le nouveau sous élément
                                         msg_importance='blocker')
 
     def controle_coherence_presence_veilleuse(self, logement, report):
+        index = self.get_document_index(logement, report)
 
-        tv_generateur_combustion = self.valeur_table['generateur_combustion']
-        gen_veilleuse = tv_generateur_combustion.loc[tv_generateur_combustion.pveil > 0]
-
-        enum_type_generateur_ch_id_avec_pveilleuse = gen_veilleuse.explode(
-            'enum_type_generateur_ch_id').enum_type_generateur_ch_id.dropna().astype(str).unique()
-        enum_type_generateur_ecs_id_avec_pveilleuse = gen_veilleuse.explode(
-            'enum_type_generateur_ecs_id').enum_type_generateur_ecs_id.dropna().astype(str).unique()
+        enum_type_generateur_ch_id_avec_pveilleuse = self.generateurs_avec_veilleuse['enum_type_generateur_ch_id']
+        enum_type_generateur_ecs_id_avec_pveilleuse = self.generateurs_avec_veilleuse['enum_type_generateur_ecs_id']
 
-        el_type_generateur_ch = list(logement.iterfind('*//enum_type_generateur_ch_id'))
-        el_type_generateur_ecs = list(logement.iterfind('*//enum_type_generateur_ecs_id'))
+        el_type_generateur_ch = list(index.iterfind(logement, '*//enum_type_generateur_ch_id'))
+        el_type_generateur_ecs = list(index.iterfind(logement, '*//enum_type_generateur_ecs_id'))
 
         for el in el_type_generateur_ch:
 
@@ -3053,6 +3213,7 @@ si la saisie est par défaut {self.display_enum_traduction("enum_methode_saisie_
                                         msg_importance='major')
 
     def controle_coherence_reseau_chaleur(self, logement, report, is_blocker,now):
+        index = self.get_document_index(logement, report)
 
         if is_blocker == True:
             msg_type = 'erreur_logiciel'
@@ -3065,7 +3226,7 @@ si la saisie est par défaut {self.display_enum_traduction("enum_methode_saisie_
             msg_importance = 'critical'
             msg_add = ' \nceci sera bloquant dans une future version du moteur de contrôle de cohérence'
 
-        for el_reseau in logement.iterfind('*//identifiant_reseau_chaleur'):
+        for el_reseau in index.iterfind(logement, '*//identifiant_reseau_chaleur'):
 
             parent = el_reseau.getparent()
 
@@ -3083,16 +3244,15 @@ le champ date_arrete_reseau_chaleur doit être renseigné lorsqu'un réseau de c
             else:
                 date_arrete_reseau_chaleur_txt = parent.find('date_arrete_reseau_chaleur').text
                 date_arrete_reseau_chaleur = datetime.fromisoformat(date_arrete_reseau_chaleur_txt)
-                last_date_arrete_reseau_chaleur_txt = self.arrete_reseau_chaleur[-1]['date_arrete_reseau_chaleur']
+                dernier_arrete = self.arrete_reseau_chaleur_index.latest
+                last_date_arrete_reseau_chaleur_txt = dernier_arrete.date_arrete_txt
 
-                date_application_dernier_arrete_txt = self.arrete_reseau_chaleur[-1]['date_application_arrete']
                 # si la date d'arrêté de réseau de chaleur est inférieure à la dernière date en vigueur alors on bloque le dépot
-                if datetime.fromisoformat(date_arrete_reseau_chaleur_txt) <= datetime.fromisoformat(last_date_arrete_reseau_chaleur_txt):
-                    found_date_arrete = [el for el in self.arrete_reseau_chaleur if
-                                         el['date_arrete_reseau_chaleur'] == date_arrete_reseau_chaleur_txt]
+                if date_arrete_reseau_chaleur <= dernier_arrete.date_arrete:
+                    found_date_arrete = self.arrete_reseau_chaleur_index.get(date_arrete_reseau_chaleur_txt)
 
-                    if len(found_date_arrete) == 0:
-                        all_date_arrete = [el['date_arrete_reseau_chaleur'] for el in self.arrete_reseau_chaleur]
+                    if found_date_arrete is None:
+                        all_date_arrete = self.arrete_reseau_chaleur_index.all_dates_txt
                         msg = f"""
 la date d'arrêté de réseau de chaleur fournie n'est pas une date valide d'arrêté autorisée :
 liste des dates autorisées :
@@ -3104,14 +3264,8 @@ liste des dates autorisées :
                                             related_objects=[parent, el_reseau],
                                             msg_importance=msg_importance)
                     else:
-                        found_date_arrete = found_date_arrete[0]
-
-                        tv_reseau = self.valeur_table[found_date_arrete['nom_table_valeur']]
-
-                        if 'identifiant_reseau' in tv_reseau:
-                            identifiants_reseaux_connus = tv_reseau.identifiant_reseau.unique().tolist()
-
-                            if el_reseau.text not in identifiants_reseaux_connus:
+                        if found_date_arrete.identifiants_reseaux is not None:
+                            if el_reseau.text not in found_date_arrete.identifiants_reseaux:
                                 msg = f"""
 l'identifiant réseau {el_reseau.text} déclaré ne figure pas dans la liste des identifiants réseaux de l'arrêté. Il peut s'agir d'une erreur de saisie.            
                                 """
@@ -3124,9 +3278,9 @@ l'identifiant réseau {el_reseau.text} déclaré ne figure pas dans la liste des
 les valeurs provenant de l'arrêté de réseau de chaleur utilisé par votre logiciel sont obsolètes. Le logiciel doit être mis à jour avec le nouvel arrêté réseau de chaleur
 date_arrete_reseau_chaleur : {date_arrete_reseau_chaleur_txt}     
 date_arrete_reseau_chaleur en vigueur :  {last_date_arrete_reseau_chaleur_txt}
-date de fin de validité de l'arrêté utilisé dans l'observatoire DPE :  {found_date_arrete['date_fin']}                
+date de fin de validité de l'arrêté utilisé dans l'observatoire DPE :  {found_date_arrete.date_fin_txt}                
 """
-                        if now > datetime.fromisoformat(found_date_arrete['date_fin']) and date_arrete_reseau_chaleur_txt!=last_date_arrete_reseau_chaleur_txt:
+                        if now > found_date_arrete.date_fin and date_arrete_reseau_chaleur_txt!=last_date_arrete_reseau_chaleur_txt:
 
 
                             report.generate_msg(msg+msg_add, msg_type=msg_type,
@@ -3134,7 +3288,7 @@ date de fin de validité de l'arrêté utilisé dans l'observatoire DPE :  {foun
                                                 related_objects=[parent, el_reseau],
                                                 msg_importance=msg_importance)
                         # si le nouvel arrêté est déjà en vigueur on envoi un message pour avertir du blocage prochain
-                        elif now <= datetime.fromisoformat(found_date_arrete['date_fin']) and now > datetime.fromisoformat(date_application_dernier_arrete_txt) and date_arrete_reseau_chaleur_txt!=last_date_arrete_reseau_chaleur_txt:
+                        elif now <= found_date_arrete.date_fin and now > dernier_arrete.date_application and date_arrete_reseau_chaleur_txt!=last_date_arrete_reseau_chaleur_txt:
                             msg_type = 'warning_logiciel'
                             msg_importance = 'critical'
                             msg += " \ncette erreur sera bloquante une fois la date de fin de validité échue."
@@ -3144,6 +3298,7 @@ date de fin de validité de l'arrêté utilisé dans l'observatoire DPE :  {foun
                                                 msg_importance=msg_importance)
 
     def controle_coherence_calcul_ue(self, logement, report, is_blocker):
+        index = self.get_document_index(logement, report)
 
         if is_blocker == True:
             msg_type = 'erreur_logiciel'
@@ -3155,11 +3310,9 @@ date de fin de validité de l'arrêté utilisé dans l'observatoire DPE :  {foun
             msg_add = ' \nceci sera bloquant dans une future version du moteur de contrôle de cohérence'
 
         ue_balises = ['surface_ue', 'perimetre_ue', 'ue']
-        type_adjacence_table = self.enum_table['type_adjacence']
-        adjacence_id_avec_ue = type_adjacence_table.loc[type_adjacence_table.calcul_ue_plancher_bas == 1].index.astype(
-            str).unique().tolist()
+        adjacence_id_avec_ue = self.adjacence_id_avec_ue
 
-        for el_plancher_bas in logement.iterfind('*//plancher_bas'):
+        for el_plancher_bas in index.iterfind(logement, '*//plancher_bas'):
             el_adjacence = el_plancher_bas.find('*//enum_type_adjacence_id')
 
             if el_adjacence.text in adjacence_id_avec_ue:
@@ -3244,10 +3397,10 @@ la balise calcul_ue est déclarée à 1 (vrai) alors qu'elle devrait être à 0
                                         msg_importance=msg_importance)
 
     def controle_coherence_calcul_echantillonage(self, logement, report):
+        index = self.get_document_index(logement, report)
 
-        enum_methode_application_dpe_log_id = logement.find('*//enum_methode_application_dpe_log_id')
-        methode_application_dpe = self.enum_table['methode_application_dpe_log'].loc[
-            int(enum_methode_application_dpe_log_id.text)].methode_application_dpe
+        enum_methode_application_dpe_log_id = index.find(logement, '*//enum_methode_application_dpe_log_id')
+        methode_application_dpe = self.get_enum_value('methode_application_dpe_log', int(enum_methode_application_dpe_log_id.text), 'methode_application_dpe')
 
         if methode_application_dpe == 'dpe immeuble collectif' and logement.find(
                 '*//enum_calcul_echantillonnage_id') is None:
@@ -3261,21 +3414,41 @@ methode d'application : {self.display_enum_traduction('enum_methode_application_
                                 related_objects=[enum_methode_application_dpe_log_id],
                                 msg_importance='blocker')
 
-    def exist_var(self, element, var, version_id_str):
+    def get_model_variables(self, version_id_str, model_tag):
+        # ensemble des variables du modèle xsd d'un objet, mémorisé par version
+        key = (version_id_str, model_tag)
+        model_variables = self._model_variables.get(key)
+        if model_variables is None:
+            model_variables = frozenset(self.logement_models[version_id_str][model_tag])
+            self._model_variables[key] = model_variables
+        return model_variables
+
+    def get_exist_var_func(self, element, version_id_str):
+        """
+        fonction var -> exist_var(element, var, version_id_str) avec le modèle de l'élément résolu une seule fois.
+        """
         if element.tag == 'donnee_entree':
             parent = element.getparent()
             model_tag = parent.tag
         else:
             model_tag = element.tag
             parent = element
-        if var not in self.logement_models[version_id_str][model_tag]:
-            return None
-        if element.find(var) is not None:
-            return True
-        elif parent.find(f'donnee_intermediaire/{var}') is not None:
-            return True
-        else:
-            return False
+        model_variables = self.get_model_variables(version_id_str, model_tag)
+
+        def exists(var):
+            if var not in model_variables:
+                return None
+            if element.find(var) is not None:
+                return True
+            elif parent.find(f'donnee_intermediaire/{var}') is not None:
+                return True
+            else:
+                return False
+
+        return exists
+
+    def exist_var(self, element, var, version_id_str):
+        return self.get_exist_var_func(element, version_id_str)(var)
 
 
 class EngineDPE(CoreEngine):
@@ -3301,6 +3474,8 @@ class EngineDPE(CoreEngine):
 
         report = ReportDPE()
         report = self.run_validation_xsd(dpe, report)
+        # index des éléments par tag construit en un seul parcours et partagé par tous les contrôles
+        report.document_index = DocumentIndex(dpe)
 
         if report.xsd_validation['valid'] is False:
             if debug is False:
@@ -3454,11 +3629,12 @@ il manque l'objet suivant {path}
         return True
 
     def controle_coherence_tertiaire(self, dpe, report):
+        index = self.get_document_index(dpe, report)
 
-        enum_methode_application_dpe_ter_id = dpe.find('*//enum_methode_application_dpe_ter_id')
+        enum_methode_application_dpe_ter_id = index.find(dpe, '*//enum_methode_application_dpe_ter_id')
         methode_application_dpe_ter = int(enum_methode_application_dpe_ter_id.text)
         if methode_application_dpe_ter < 3:  # non vierge
-            bilan_consommation = dpe.find('*//bilan_consommation')
+            bilan_consommation = index.find(dpe, '*//bilan_consommation')
             consommation = dpe.find('*//consommation_collection/consommation')
             if bilan_consommation is None:
                 related_objects = [enum_methode_application_dpe_ter_id]
@@ -3480,10 +3656,11 @@ Le DPE Tertiaire est non vierge, il faut au moins déclarer une consommation dan
                                     msg_importance='blocker')
 
     def controle_coherence_etiquette_tertiaire(self, dpe, report):
+        index = self.get_document_index(dpe, report)
 
-        el_bilan_consommation = dpe.find('.//bilan_consommation')
+        el_bilan_consommation = index.find(dpe, './/bilan_consommation')
 
-        el_enum_sous_modele_dpe_ter_id = dpe.find('.//enum_sous_modele_dpe_ter_id')
+        el_enum_sous_modele_dpe_ter_id = index.find(dpe, './/enum_sous_modele_dpe_ter_id')
 
         if el_enum_sous_modele_dpe_ter_id is None:
             msg = """
@@ -3550,9 +3727,10 @@ la balise enum_sous_modele_dpe_ter_id qui spécifie le sous modèle tertiaire do
                                     msg_importance='critical')
 
     def controle_coherence_rset_rsee(self, dpe, report):
+        index = self.get_document_index(dpe, report)
 
-        rset = dpe.find('*//rset')
-        rsee = dpe.find('*//rsee')
+        rset = index.find(dpe, '*//rset')
+        rsee = index.find(dpe, '*//rsee')
         if rset is not None and rsee is not None:
             related_objects = [rset, rsee]
             msg = """
@@ -3620,15 +3798,15 @@ la balise enum_sous_modele_dpe_ter_id qui spécifie le sous modèle tertiaire do
                                         msg_importance='critical')
 
     def controle_coherence_ref_dpe_immeuble(self, dpe, report):
-        el_methode_dpe = dpe.find('*//enum_methode_application_dpe_log_id')
+        index = self.get_document_index(dpe, report)
+        el_methode_dpe = index.find(dpe, '*//enum_methode_application_dpe_log_id')
         methode_dpe = int(el_methode_dpe.text)
-        methode_application_dpe = self.enum_table['methode_application_dpe_log'].loc[
-            methode_dpe].methode_application_dpe
+        methode_application_dpe = self.get_enum_value('methode_application_dpe_log', methode_dpe, 'methode_application_dpe')
 
         is_dpe_appartement_immeuble = methode_application_dpe == 'dpe appartement généré à partir des données DPE immeuble'
 
         if is_dpe_appartement_immeuble:
-            dpe_immeuble = dpe.find('*//dpe_immeuble_associe')
+            dpe_immeuble = index.find(dpe, '*//dpe_immeuble_associe')
             if dpe_immeuble is None:
                 report.generate_msg(
                     "il manque le champ dpe_immeuble_associe pour un DPE qui applique une méthode appartement à partir de l'immeuble. Fournir le numéro de DPE de l'immeuble est désormais obligatoire pour ce type de DPE",
@@ -3667,7 +3845,7 @@ class EngineAudit(CoreEngine):
 
         # ============== ENUMS AUDIT =============================================
 
-        enum_table_audit = pd.read_excel(self.mdd_path / 'enum_tables_audit.xlsx', sheet_name=None)
+        enum_table_audit = self._read_asset('enum_tables_audit.xlsx')
         enum_dict_audit = {f'enum_{k}_id': v.set_index('id').lib.to_dict() for k, v in enum_table_audit.items() if
                            'lib' in v and 'id' in v}
         # retrocompatibilité renommage enum_travaux_resume_id
@@ -3675,8 +3853,19 @@ class EngineAudit(CoreEngine):
         enum_table_audit['travaux_resume_collection'] = enum_table_audit['travaux_resume']
 
         self.enum_dict.update(enum_dict_audit)
+        self.enum_registry = EnumRegistry(self.enum_dict)
         self.enum_table_audit = enum_table_audit
 
+    def _instanciate_enum_lookup(self):
+        CoreEngine._instanciate_enum_lookup(self)
+        self.enum_lookup_audit = compile_enum_tables(self.enum_table_audit)
+
+        # types de travaux pour lesquels les caractéristiques travaux sont exigées
+        type_travaux = self.enum_table_audit['type_travaux'].dropna(subset=['caracteristiques_travaux'])
+        self.type_travaux_caracteristiques = {'ids': list(type_travaux.index),
+                                              'libs': list(type_travaux.lib),
+                                              'caracteristiques_travaux': type_travaux['caracteristiques_travaux'].to_dict()}
+
     # TO DEL
     # def validate_by_xsd(self, xml):
     #     el_version = xml.find('/administratif/enum_version_audit_id')
@@ -3713,6 +3902,8 @@ class EngineAudit(CoreEngine):
 
         report = ReportAudit()
         report = self.run_validation_xsd(audit, report)
+        # index des éléments par tag construit en un seul parcours et partagé par tous les contrôles
+        report.document_index = DocumentIndex(audit)
 
         if report.xsd_validation['valid'] is False:
             if debug is False:
@@ -3751,54 +3942,9 @@ class EngineAudit(CoreEngine):
         arrete_pef_elec = (now >= DATE_APPLICATION_PEF_ELEC) | (Version(el_version.text) >= Version('2.5'))
         controle_bloquant_reseau_chaleur = now >= DATE_APPLICATION_BLOCAGE_CONTROLE_RCU
 
-        for logement in audit.iterfind('*//logement'):
-            # ===========  controle de cohérence 1.0 ============== controle_coherence_conso_5_usages
-            self.controle_coherence_etiquette(logement, report, arrete_petite_surface)
-            self.controle_coherence_conso_5_usages(logement, report, is_arrete_pef_elec=arrete_pef_elec)
-            self.controle_coherence_5_usages_surface(logement, report)
-            self.controle_coherence_table_valeur_enum(logement, report)
-            self.controle_coherence_tv_values_simple(logement, report)
-            self.controle_coherence_mutually_exclusive(logement, report)
-            self.controle_coherence_correspondance_saisi_value(logement, report)
-            self.controle_coherence_structure_installation_chauffage(logement, report)
-            self.controle_coherence_surfaces(logement, report)
-            self.controle_coherence_energie_entree_sortie(logement, report)
-            self.controle_coherence_hors_methode(logement, report)
-            self.controle_coherence_existence_composants(logement, report)
-            self.controle_coherence_pont_thermique(logement, report)
-            self.controle_coherence_enveloppe(logement, report)
-            self.controle_coherence_systeme(logement, report)
-            self.controle_coherence_consommation_0_generateur_installation(logement, report)
-            self.controle_coherence_cle_repartition_dpe_appartement(logement, report)
-            self.controle_coherence_unicite_reference(logement, report)
-
-            # ===========  controle de cohérence 1.1 ==============
-
-            self.controle_coherence_modele_methode_application(logement, report)
-            self.controle_coherence_double_fenetre(logement, report)
-            self.controle_coherence_calcul_echantillonage(logement, report)
-
-            # Contrôle de cohérence sous forme de warning pour le moment car réintroduit à postériori
-            self.controle_coherence_presence_veilleuse(logement, report)
-
-            # ===========  controle de cohérence 2.4 ==============
-
-            self.controle_coherence_energie_vs_generateur(logement, report)
-
-            # pour l'instant sous forme de warning , sera placé en bloquant sur une prochaine version
-            self.controle_coherence_reseau_chaleur(logement, report, is_blocker=controle_bloquant_reseau_chaleur, now = now)
-
-            # pour l'instant sous forme de warning , sera placé en bloquant sur une prochaine version
-
-            self.controle_coherence_calcul_ue(logement, report, is_blocker=True)
-
-            # controle cohérence 2.5
-
-            self.controle_coherence_masque_solaire(logement, report)
-            self.controle_coherence_type_regulation(logement, report)
-            self.controle_coherence_surface_immeuble_logement(logement, report)
-            self.controle_pac_air_air_clim(logement,report)
-            self.controle_coherence_paroi_lourde(logement, report)
+        self.run_controles_logements(audit, report, 'controles_logement_methode',
+                                     arrete_petite_surface=arrete_petite_surface, arrete_pef_elec=arrete_pef_elec,
+                                     controle_bloquant_reseau_chaleur=controle_bloquant_reseau_chaleur, now=now)
 
         # controle de consentement
         is_blocker = arrete_petite_surface  # a partir du moment où l'arrêté petite surface est en vigueur le consentement propriétaire l'est aussi
@@ -3843,26 +3989,97 @@ class EngineAudit(CoreEngine):
         self.controle_coherence_derogation_audit_copro(audit, report)
 
 
-        for logement in audit.iterfind('*//logement'):
-            # =========== controle de cohérence spécifique audit ==============
-
-            self.controle_coherence_reference_travaux_existent(logement, report)
-            self.controle_coherence_presence_etape_travaux(logement, report)
-            self.controle_coherence_etape_travaux_sortie_dpe(logement, report)
-            # self.controle_coherence_etape_travaux_cout(logement, report) # => Ce controle n'est plus utilisable depuis l'intégration des fourchettes de couts en audit 2.2
-            self.controle_coherence_cout_nul(logement, report)
-            self.controle_coherence_etat_composant(logement, report)
-            self.controle_coherence_conso_etape_travaux(logement, report)
-            self.controle_coherence_presence_derogation_ventilation(logement, report)
-            self.controle_coherence_ubat_base_ubat(logement, report)
-            self.controle_coherence_etat_ventilation(logement, report)
-            self.controle_coherence_presence_caracteristiques_travaux(logement, report)
-            self.controle_coherence_absence_caracteristiques_travaux(logement, report)
-            self.controle_coherence_caracteristiques_travaux(logement, report)
-            self.controle_coherence_etape_travaux_cout_presence(logement, report)
+        self.run_controles_logements(audit, report, 'controles_logement_audit')
 
         return report.generate_report(audit, engine=self)
 
+    def run_controles_logements(self, audit, report, controles_name, **params):
+        """
+        exécute pour chaque logement de l'audit les contrôles de la méthode controles_name.
+
+        si OBS_DPE_AUDIT_PROCESSES > 1 et que l'audit comporte au moins OBS_DPE_AUDIT_PROCESSES_MIN_LOGEMENTS logements,
+        les logements sont répartis sur un pool de processus et les messages sont fusionnés dans l'ordre des logements
+        (rapport identique à l'exécution séquentielle).
+        """
+        logements = list(audit.iterfind('*//logement'))
+        processes = get_audit_processes()
+        if processes > 1 and len(logements) >= get_min_logements():
+            if run_logements_in_pool(audit, report, controles_name, len(logements), processes, params) is True:
+                return
+        controles = getattr(self, controles_name)
+        for logement in logements:
+            controles(logement, report, **params)
+
+    def controles_logement_methode(self, logement, report, arrete_petite_surface, arrete_pef_elec,
+                                   controle_bloquant_reseau_chaleur, now):
+        """contrôles de cohérence de l'application de la méthode de calcul 3CL d'un logement de l'audit."""
+        # ===========  controle de cohérence 1.0 ============== controle_coherence_conso_5_usages
+        self.controle_coherence_etiquette(logement, report, arrete_petite_surface)
+        self.controle_coherence_conso_5_usages(logement, report, is_arrete_pef_elec=arrete_pef_elec)
+        self.controle_coherence_5_usages_surface(logement, report)
+        self.controle_coherence_table_valeur_enum(logement, report)
+        self.controle_coherence_tv_values_simple(logement, report)
+        self.controle_coherence_mutually_exclusive(logement, report)
+        self.controle_coherence_correspondance_saisi_value(logement, report)
+        self.controle_coherence_structure_installation_chauffage(logement, report)
+        self.controle_coherence_surfaces(logement, report)
+        self.controle_coherence_energie_entree_sortie(logement, report)
+        self.controle_coherence_hors_methode(logement, report)
+        self.controle_coherence_existence_composants(logement, report)
+        self.controle_coherence_pont_thermique(logement, report)
+        self.controle_coherence_enveloppe(logement, report)
+        self.controle_coherence_systeme(logement, report)
+        self.controle_coherence_consommation_0_generateur_installation(logement, report)
+        self.controle_coherence_cle_repartition_dpe_appartement(logement, report)
+        self.controle_coherence_unicite_reference(logement, report)
+
+        # ===========  controle de cohérence 1.1 ==============
+
+        self.controle_coherence_modele_methode_application(logement, report)
+        self.controle_coherence_double_fenetre(logement, report)
+        self.controle_coherence_calcul_echantillonage(logement, report)
+
+        # Contrôle de cohérence sous forme de warning pour le moment car réintroduit à postériori
+        self.controle_coherence_presence_veilleuse(logement, report)
+
+        # ===========  controle de cohérence 2.4 ==============
+
+        self.controle_coherence_energie_vs_generateur(logement, report)
+
+        # pour l'instant sous forme de warning , sera placé en bloquant sur une prochaine version
+        self.controle_coherence_reseau_chaleur(logement, report, is_blocker=controle_bloquant_reseau_chaleur, now = now)
+
+        # pour l'instant sous forme de warning , sera placé en bloquant sur une prochaine version
+
+        self.controle_coherence_calcul_ue(logement, report, is_blocker=True)
+
+        # controle cohérence 2.5
+
+        self.controle_coherence_masque_solaire(logement, report)
+        self.controle_coherence_type_regulation(logement, report)
+        self.controle_coherence_surface_immeuble_logement(logement, report)
+        self.controle_pac_air_air_clim(logement,report)
+        self.controle_coherence_paroi_lourde(logement, report)
+
+    def controles_logement_audit(self, logement, report):
+        """contrôles de cohérence spécifiques audit d'un logement de l'audit."""
+        # =========== controle de cohérence spécifique audit ==============
+
+        self.controle_coherence_reference_travaux_existent(logement, report)
+        self.controle_coherence_presence_etape_travaux(logement, report)
+        self.controle_coherence_etape_travaux_sortie_dpe(logement, report)
+        # self.controle_coherence_etape_travaux_cout(logement, report) # => Ce controle n'est plus utilisable depuis l'intégration des fourchettes de couts en audit 2.2
+        self.controle_coherence_cout_nul(logement, report)
+        self.controle_coherence_etat_composant(logement, report)
+        self.controle_coherence_conso_etape_travaux(logement, report)
+        self.controle_coherence_presence_derogation_ventilation(logement, report)
+        self.controle_coherence_ubat_base_ubat(logement, report)
+        self.controle_coherence_etat_ventilation(logement, report)
+        self.controle_coherence_presence_caracteristiques_travaux(logement, report)
+        self.controle_coherence_absence_caracteristiques_travaux(logement, report)
+        self.controle_coherence_caracteristiques_travaux(logement, report)
+        self.controle_coherence_etape_travaux_cout_presence(logement, report)
+
     def get_current_valid_versions(self,now):
         return get_current_valid_versions_audit(now)
 
@@ -3964,18 +4181,11 @@ class EngineAudit(CoreEngine):
 
     # Contrôler l'unicité id d'étape par scénario
     def controle_coherence_unicite_etape_par_scenario(self, audit, report):
+        index = self.get_document_index(audit, report)
 
-        mapping_scenario_etape_to_related_objects = {}
-        all_caracteristique_generale = list(audit.iterfind('*//caracteristique_generale'))
-        for caracteristique_generale in all_caracteristique_generale:
-            enum_scenario_id = caracteristique_generale.find('enum_scenario_id').text
-            enum_etape_id = caracteristique_generale.find('enum_etape_id').text
-            if enum_scenario_id + '_' + enum_etape_id in mapping_scenario_etape_to_related_objects.keys():
-                mapping_scenario_etape_to_related_objects[enum_scenario_id + '_' + enum_etape_id].append(
-                    caracteristique_generale.find('enum_etape_id'))
-            else:
-                mapping_scenario_etape_to_related_objects[enum_scenario_id + '_' + enum_etape_id] = [
-                    caracteristique_generale.find('enum_etape_id')]
+        audit_graph = get_audit_graph(audit, index)
+        mapping_scenario_etape_to_related_objects = {f'{scenario}_{etape}': [el.enum_etape_id for el in etapes]
+                                                     for (scenario, etape), etapes in audit_graph.etapes_by_scenario_etape().items()}
 
         all_duplicates_scenario_etape = [k for k, v in mapping_scenario_etape_to_related_objects.items() if len(v) > 1]
 
@@ -3991,22 +4201,14 @@ class EngineAudit(CoreEngine):
 
     #  Existence d'un seul logement de type « état initial »
     def controle_coherence_presence_etat_initial(self, audit, report):
+        index = self.get_document_index(audit, report)
+        audit_graph = get_audit_graph(audit, index)
         related_objects = []
-        mapping_scenario_etape_to_related_objects = {}
-        all_caracteristique_generale = list(audit.iterfind('*//caracteristique_generale'))
-        for caracteristique_generale in all_caracteristique_generale:
-            enum_scenario_id = caracteristique_generale.find('enum_scenario_id')
-            enum_etape_id = caracteristique_generale.find('enum_etape_id')
-            related_objects.append(enum_scenario_id)
-            related_objects.append(enum_etape_id)
-            if enum_scenario_id.text + '_' + enum_etape_id.text in mapping_scenario_etape_to_related_objects.keys():
-                mapping_scenario_etape_to_related_objects[enum_scenario_id.text + '_' + enum_etape_id.text].append(
-                    caracteristique_generale.find('enum_etape_id'))
-            else:
-                mapping_scenario_etape_to_related_objects[enum_scenario_id.text + '_' + enum_etape_id.text] = [
-                    caracteristique_generale.find('enum_etape_id')]
+        for etape in audit_graph.etapes:
+            related_objects.append(etape.enum_scenario_id)
+            related_objects.append(etape.enum_etape_id)
 
-        if "0_0" not in mapping_scenario_etape_to_related_objects.keys():
+        if ("0", "0") not in audit_graph.etapes_by_scenario_etape():
             report.generate_msg(
                 f"l'audit ne contient pas de logement avec un enum_scenario_id ET un enum_etape_id en {str({0: 'état initial'})}. L'audit doit contenir un logement en « état initial »",
                 msg_type='erreur_logiciel',
@@ -4017,9 +4219,10 @@ class EngineAudit(CoreEngine):
 
     # Contrôle la présence d'un numéro DPE, lors que le contexte de l'audit est règlementaire
     def controle_coherence_presence_numero_dpe(self, audit, report):
+        index = self.get_document_index(audit, report)
 
-        numero_dpe = audit.find('*//numero_dpe')
-        enum_modele_audit_id = audit.find('*//enum_modele_audit_id')
+        numero_dpe = index.find(audit, '*//numero_dpe')
+        enum_modele_audit_id = index.find(audit, '*//enum_modele_audit_id')
 
         if numero_dpe is None and enum_modele_audit_id.text == '1':
             report.generate_msg(f"""
@@ -4036,12 +4239,13 @@ class EngineAudit(CoreEngine):
 
     # Contrôler que tous les logements, SAUF logement de type « état initial », possèdent « etape_travaux »
     def controle_coherence_presence_etape_travaux(self, logement, report):
+        index = self.get_document_index(logement, report)
 
-        enum_scenario_id = logement.find('.//caracteristique_generale').find('enum_scenario_id')
-        enum_etape_id = logement.find('.//caracteristique_generale').find('enum_etape_id')
+        enum_scenario_id = index.find(logement, './/caracteristique_generale').find('enum_scenario_id')
+        enum_etape_id = index.find(logement, './/caracteristique_generale').find('enum_etape_id')
         scenario_and_etape = [enum_scenario_id, enum_etape_id]
         logement_etat_initial = enum_scenario_id.text == '0' and enum_etape_id.text == '0'
-        etape_travaux = logement.find('.//etape_travaux')
+        etape_travaux = index.find(logement, './/etape_travaux')
         etape_travaux_present = etape_travaux is not None
 
         if logement_etat_initial and etape_travaux_present:
@@ -4064,8 +4268,9 @@ class EngineAudit(CoreEngine):
 
     # Contrôler que les consommations 5 usages, les emissions de CO2 5 usages et les classes dans « etape_travaux » correspondent bien à celles dans « sortie » issues du calcul 3CL (tolérance à l’unité)
     def controle_coherence_etape_travaux_sortie_dpe(self, logement, report):
+        index = self.get_document_index(logement, report)
 
-        etape_travaux = logement.find('.//etape_travaux')
+        etape_travaux = index.find(logement, './/etape_travaux')
         if etape_travaux is not None:
 
             mapping_etape_travaux_sortie_dpe = {
@@ -4078,8 +4283,8 @@ class EngineAudit(CoreEngine):
 
             for etape_travaux_name in ["ep_conso_5_usages_m2", "ef_conso_5_usages_m2", "emission_ges_5_usages_m2"]:
                 dpe_sortie_name = mapping_etape_travaux_sortie_dpe[etape_travaux_name]
-                dpe_sortie_el = logement.find('.//sortie').find(f'.//{dpe_sortie_name}')
-                etape_travaux_el = logement.find('.//etape_travaux').find(f'.//{etape_travaux_name}')
+                dpe_sortie_el = index.find(logement, './/sortie').find(f'.//{dpe_sortie_name}')
+                etape_travaux_el = index.find(logement, './/etape_travaux').find(f'.//{etape_travaux_name}')
                 if not np.isclose(float(dpe_sortie_el.text), float(etape_travaux_el.text), atol=1):
                     report.generate_msg(
                         f"la valeur de la balise de etape_travaux - {etape_travaux_name} : {etape_travaux_el.text}, ne correspond pas à la valeur de la balise de sortie du DPE - {dpe_sortie_name} : {dpe_sortie_el.text}. Les valeurs dans etape_travaux doivent être cohérentes avec les sorties du calcul 3CL DPE",
@@ -4091,8 +4296,8 @@ class EngineAudit(CoreEngine):
 
             for etape_travaux_name in ["classe_emission_ges", "classe_bilan_dpe"]:
                 dpe_sortie_name = mapping_etape_travaux_sortie_dpe[etape_travaux_name]
-                dpe_sortie_el = logement.find('.//sortie').find(f'.//{dpe_sortie_name}')
-                etape_travaux_el = logement.find('.//etape_travaux').find(f'.//{etape_travaux_name}')
+                dpe_sortie_el = index.find(logement, './/sortie').find(f'.//{dpe_sortie_name}')
+                etape_travaux_el = index.find(logement, './/etape_travaux').find(f'.//{etape_travaux_name}')
                 if dpe_sortie_el.text != etape_travaux_el.text:
                     report.generate_msg(
                         f"la classe présente dans etape_travaux - {etape_travaux_name} : {etape_travaux_el.text}, ne correspond pas à celle issue du DPE - {dpe_sortie_name} : {dpe_sortie_el.text}. Les valeurs dans etape_travaux doivent être cohérentes avec les sorties du calcul 3CL DPE",
@@ -4127,8 +4332,9 @@ class EngineAudit(CoreEngine):
 
     # Lorsque des travaux, dans "travaux_collection", ont des coûts nuls
     def controle_coherence_cout_nul(self, logement, report):
+        index = self.get_document_index(logement, report)
 
-        etape_travaux = logement.find('.//etape_travaux')
+        etape_travaux = index.find(logement, './/etape_travaux')
         if etape_travaux is not None:
 
             travaux_collection_cout = list(etape_travaux.find('.//travaux_collection').iterfind('*//cout')) + list(etape_travaux.find('.//travaux_collection').iterfind('*//cout_min')) + list(etape_travaux.find('.//travaux_collection').iterfind('*//cout_max'))
@@ -4145,8 +4351,9 @@ class EngineAudit(CoreEngine):
 
     # Contrôler que les références dans « travaux/reference_collection » existent bien dans le « logement »
     def controle_coherence_reference_travaux_existent(self, logement, report):
+        index = self.get_document_index(logement, report)
 
-        etape_travaux = logement.find('.//etape_travaux')
+        etape_travaux = index.find(logement, './/etape_travaux')
         if etape_travaux is not None:
             logement_copy = copy.deepcopy(logement)
             etape_travaux_copy = logement_copy.find('etape_travaux')
@@ -4173,12 +4380,13 @@ class EngineAudit(CoreEngine):
     # Contrôler que pour le logement « état initial » que tous les « enum_etat_composant_id » soit à "1"="initial"
     # Contrôler que pour toutes les étapes de travaux (qui ne sont pas « état initial »), au moins 1 objet ait un « enum_etat_composant_id » à "2"="neuf ou rénové"
     def controle_coherence_etat_composant(self, logement, report):
+        index = self.get_document_index(logement, report)
 
-        enum_scenario_id = logement.find('.//caracteristique_generale').find('enum_scenario_id').text
-        enum_etape_id = logement.find('.//caracteristique_generale').find('enum_etape_id').text
+        enum_scenario_id = index.find(logement, './/caracteristique_generale').find('enum_scenario_id').text
+        enum_etape_id = index.find(logement, './/caracteristique_generale').find('enum_etape_id').text
         logement_etat_initial = enum_scenario_id == '0' and enum_etape_id == '0'
 
-        all_enum_etat_composant_id = list(logement.iterfind('*//enum_etat_composant_id'))
+        all_enum_etat_composant_id = list(index.iterfind(logement, '*//enum_etat_composant_id'))
 
         if logement_etat_initial:
             all_incorrect_etat_composant = [el for el in all_enum_etat_composant_id if el.text != '1']
@@ -4204,17 +4412,18 @@ class EngineAudit(CoreEngine):
 
     # Contrôler l'ordre de grandeur (facteur 10) des consommations dans etape_travaux par rapport aux sorties DPE - objectif, signaler un oubli de division par la surface habitable
     def controle_coherence_conso_etape_travaux(self, logement, report):
+        index = self.get_document_index(logement, report)
 
-        etape_travaux = logement.find('.//etape_travaux')
-        sortie_dpe = logement.find('.//sortie')
+        etape_travaux = index.find(logement, './/etape_travaux')
+        sortie_dpe = index.find(logement, './/sortie')
         if etape_travaux is not None:
-            methode_dpe = logement.find('.//enum_methode_application_dpe_log_id')
+            methode_dpe = index.find(logement, './/enum_methode_application_dpe_log_id')
             surface_reference_name = str(
-                self.enum_table['methode_application_dpe_log'].loc[int(methode_dpe.text)].surface_reference)
+                self.get_enum_value('methode_application_dpe_log', int(methode_dpe.text), 'surface_reference'))
 
-            if logement.find(f'.//{surface_reference_name}') is None:
+            if index.find(logement, f'.//{surface_reference_name}') is None:
                 report.generate_msg(f"""
-la surface {surface_reference_name} n'est pas renseignée pour la méthode DPE {self.enum_table['methode_application_dpe_log'].loc[int(methode_dpe.text)].lib}
+la surface {surface_reference_name} n'est pas renseignée pour la méthode DPE {self.get_enum_value('methode_application_dpe_log', int(methode_dpe.text), 'lib')}
 cette surface doit être obligatoirement renseignée. 
 """,
 
@@ -4272,26 +4481,18 @@ cette surface doit être obligatoirement renseignée.
 
     # Le « scénario multi étapes "principal" » existe ET contient au moins 2 étapes de travaux dont une « étape première » et une « étape finale »
     def controle_coherence_scenario_multi_etapes(self, audit, report):
-        enum_modele_audit_id = audit.find('*//enum_modele_audit_id')
+        index = self.get_document_index(audit, report)
+        enum_modele_audit_id = index.find(audit, '*//enum_modele_audit_id')
         not_audit_copro = enum_modele_audit_id.text in ['1', '2']
         if not_audit_copro:
-            mapping_scenario_etape_to_related_objects = {}
-            all_caracteristique_generale = list(audit.iterfind('*//caracteristique_generale'))
-            for caracteristique_generale in all_caracteristique_generale:
-                enum_scenario_id = caracteristique_generale.find('enum_scenario_id').text
-                enum_etape_id = caracteristique_generale.find('enum_etape_id').text
-                if enum_scenario_id + '_' + enum_etape_id in mapping_scenario_etape_to_related_objects.keys():
-                    mapping_scenario_etape_to_related_objects[enum_scenario_id + '_' + enum_etape_id].append(
-                        caracteristique_generale.find('enum_etape_id'))
-                else:
-                    mapping_scenario_etape_to_related_objects[enum_scenario_id + '_' + enum_etape_id] = [
-                        caracteristique_generale.find('enum_etape_id')]
+            audit_graph = get_audit_graph(audit, index)
+            mapping_scenario_etape_to_related_objects = {f'{scenario}_{etape}': [el.enum_etape_id for el in etapes]
+                                                         for (scenario, etape), etapes in audit_graph.etapes_by_scenario_etape().items()}
 
-            all_scenario = [k.split('_')[0] for k in mapping_scenario_etape_to_related_objects.keys()]
-            presence_scenario_multi_etapes = '1' in all_scenario
+            presence_scenario_multi_etapes = '1' in audit_graph.etapes_by_scenario()
 
-            all_etape_in_scenario_multi_etapes = [k.split('_')[-1] for k in mapping_scenario_etape_to_related_objects.keys()
-                                                  if k.split('_')[0] == '1']
+            all_etape_in_scenario_multi_etapes = [etape for scenario, etape in audit_graph.etapes_by_scenario_etape().keys()
+                                                  if scenario == '1']
             presence_etape_premiere = '1' in all_etape_in_scenario_multi_etapes
             presence_etape_finale = '2' in all_etape_in_scenario_multi_etapes
 
@@ -4362,14 +4563,14 @@ cette surface doit être obligatoirement renseignée.
 
     # Lorsqu'il y a plus de 3 étapes dans un scénario de travaux
     def controle_coherence_seuil_3_etapes(self, audit, report):
+        index = self.get_document_index(audit, report)
 
+        audit_graph = get_audit_graph(audit, index)
         mapping_scenario_logement = {"1": [], "3": [], "4": [], "5": []}
-        all_caracteristique_generale = list(audit.iterfind('*//caracteristique_generale'))
-        for caracteristique_generale in all_caracteristique_generale:
-            enum_scenario_id = caracteristique_generale.find('enum_scenario_id').text
+        for scenario, etapes in audit_graph.etapes_by_scenario().items():
             # Scenario multi etapes
-            if enum_scenario_id in mapping_scenario_logement.keys():
-                mapping_scenario_logement[enum_scenario_id].append(caracteristique_generale.getparent())
+            if scenario in mapping_scenario_logement.keys():
+                mapping_scenario_logement[scenario] = [etape.logement for etape in etapes]
 
         mapping_scenario_nb_etape = {scenario: len(etapes) for scenario, etapes in mapping_scenario_logement.items() if
                                      len(etapes) > 3}
@@ -4385,28 +4586,19 @@ cette surface doit être obligatoirement renseignée.
 
     # Le « scénario en une étape "principal" » existe ET ne contient qu’une seule étape de travaux correspondant à l’ « étape finale »
     def controle_coherence_scenario_mono_etape(self, audit, report):
+        index = self.get_document_index(audit, report)
 
-        enum_modele_audit_id = audit.find('*//enum_modele_audit_id')
+        enum_modele_audit_id = index.find(audit, '*//enum_modele_audit_id')
         not_audit_copro = enum_modele_audit_id.text in ['1', '2']
         if not_audit_copro:
-            related_objects = []
-            mapping_scenario_etape_to_related_objects = {}
-            all_caracteristique_generale = list(audit.iterfind('*//caracteristique_generale'))
-            for caracteristique_generale in all_caracteristique_generale:
-                enum_scenario_id = caracteristique_generale.find('enum_scenario_id').text
-                enum_etape_id = caracteristique_generale.find('enum_etape_id').text
-                related_objects.append(caracteristique_generale.find('enum_scenario_id'))
-                if enum_scenario_id + '_' + enum_etape_id in mapping_scenario_etape_to_related_objects.keys():
-                    mapping_scenario_etape_to_related_objects[enum_scenario_id + '_' + enum_etape_id].append(
-                        caracteristique_generale.find('enum_etape_id'))
-                else:
-                    mapping_scenario_etape_to_related_objects[enum_scenario_id + '_' + enum_etape_id] = [
-                        caracteristique_generale.find('enum_etape_id')]
-
-            all_scenario = [k.split('_')[0] for k in mapping_scenario_etape_to_related_objects.keys()]
-            presence_scenario_mono_etape = '2' in all_scenario
-            all_etape_in_scenario_mono_etape = [k.split('_')[-1] for k in mapping_scenario_etape_to_related_objects.keys()
-                                                if k.split('_')[0] == '2']
+            audit_graph = get_audit_graph(audit, index)
+            related_objects = [etape.enum_scenario_id for etape in audit_graph.etapes]
+            mapping_scenario_etape_to_related_objects = {f'{scenario}_{etape}': [el.enum_etape_id for el in etapes]
+                                                         for (scenario, etape), etapes in audit_graph.etapes_by_scenario_etape().items()}
+
+            presence_scenario_mono_etape = '2' in audit_graph.etapes_by_scenario()
+            all_etape_in_scenario_mono_etape = [etape for scenario, etape in audit_graph.etapes_by_scenario_etape().keys()
+                                                if scenario == '2']
             presence_etape_finale = '2' in all_etape_in_scenario_mono_etape
 
             if not presence_scenario_mono_etape:
@@ -4441,22 +4633,21 @@ cette surface doit être obligatoirement renseignée.
     # Si dérogation, alors il faut un saut de deux classes entre l’ « état initial » (avant travaux) et l’étape finale.
     # Si scénario principal, alors erreur bloquante. Sinon, warning.
     def controle_coherence_etape_finale(self, audit, report):
+        index = self.get_document_index(audit, report)
         class_etat_initial = None
         # enum_derogation_technique_id
-        derogation_technique = audit.find('.//enum_derogation_technique_id').text != '1'
-        derogation_economique = audit.find('.//enum_derogation_economique_id').text != '1'
+        derogation_technique = index.find(audit, './/enum_derogation_technique_id').text != '1'
+        derogation_economique = index.find(audit, './/enum_derogation_economique_id').text != '1'
 
         all_class_etape_finale = []
-        all_caracteristique_generale = list(audit.iterfind('*//caracteristique_generale'))
-        for caracteristique_generale in all_caracteristique_generale:
-            enum_scenario_id = caracteristique_generale.find('enum_scenario_id').text
-            enum_etape_id = caracteristique_generale.find('enum_etape_id').text
+        for etape in get_audit_graph(audit, index).etapes:
+            enum_scenario_id = etape.scenario_id
+            enum_etape_id = etape.etape_id
             if enum_scenario_id == "0" and enum_etape_id == "0":
-                class_etat_initial = caracteristique_generale.getparent().find('.//classe_bilan_dpe')
+                class_etat_initial = etape.classe_bilan_dpe
             elif enum_scenario_id != "0" and enum_etape_id == "2":
-                if caracteristique_generale.getparent().find('etape_travaux') is not None:
-                    all_class_etape_finale.append(
-                        caracteristique_generale.getparent().find('etape_travaux').find('classe_bilan_dpe'))
+                if etape.etape_travaux is not None:
+                    all_class_etape_finale.append(etape.classe_bilan_dpe_etape_travaux)
 
         if (derogation_technique or derogation_economique) and (class_etat_initial is not None):
             class_score = {"A": 6, "B": 5, "C": 4, "D": 3, "E": 2, "F": 1, "G": 0}
@@ -4519,28 +4710,24 @@ cette surface doit être obligatoirement renseignée.
     # Pour les dérogations, vérifier que les six postes de travaux de rénovation énergétique ont été traités pour les deux scénarios :
     # isolation des murs, l'isolation des planchers bas, l'isolation de la toiture, le remplacement des menuiseries extérieures, la ventilation, la production de chauffage et d'eau chaude sanitaire (via « enum_lot_travaux_audit_id »)
     def controle_coherence_six_postes_travaux(self, audit, report):
-        enum_modele_audit_id = audit.find('*//enum_modele_audit_id')
+        index = self.get_document_index(audit, report)
+        enum_modele_audit_id = index.find(audit, '*//enum_modele_audit_id')
         not_audit_copro = enum_modele_audit_id.text in ['1', '2']
         if not_audit_copro:
             # enum_derogation_technique_id
-            derogation_technique = audit.find('.//enum_derogation_technique_id').text != '1'
-            derogation_economique = audit.find('.//enum_derogation_economique_id').text != '1'
+            derogation_technique = index.find(audit, './/enum_derogation_technique_id').text != '1'
+            derogation_economique = index.find(audit, './/enum_derogation_economique_id').text != '1'
             if derogation_technique or derogation_economique:
                 all_lot_travaux_in_mono = []
                 all_lot_travaux_in_multi = []
-                all_caracteristique_generale = list(audit.iterfind('*//caracteristique_generale'))
-                for caracteristique_generale in all_caracteristique_generale:
-                    enum_scenario_id = caracteristique_generale.find('enum_scenario_id').text
+                for etape in get_audit_graph(audit, index).etapes:
+                    enum_scenario_id = etape.scenario_id
                     if enum_scenario_id == "2":
-                        if caracteristique_generale.getparent().find('etape_travaux') is not None:
-                            all_lot_travaux_in_mono += list(
-                                caracteristique_generale.getparent().find('etape_travaux').iterfind(
-                                    '*//enum_lot_travaux_audit_id'))
+                        if etape.etape_travaux is not None:
+                            all_lot_travaux_in_mono += etape.lot_travaux
                     elif enum_scenario_id == "1":
-                        if caracteristique_generale.getparent().find('etape_travaux') is not None:
-                            all_lot_travaux_in_multi += list(
-                                caracteristique_generale.getparent().find('etape_travaux').iterfind(
-                                    '*//enum_lot_travaux_audit_id'))
+                        if etape.etape_travaux is not None:
+                            all_lot_travaux_in_multi += etape.lot_travaux
 
                 lot_travaux_to_check = {"1": "murs",
                                         "2": "planchers bas",
@@ -4565,9 +4752,10 @@ cette surface doit être obligatoirement renseignée.
 
     # Vérifier que tous les logements ont une méthode DPE cohérents (dans :"enum_methode_application_dpe_log_id"), c'est-à-dire un même type de bâtiment (maison, appartement, immeuble)
     def controle_coherence_type_batiment_constant(self, audit, report):
-        enum_methode_application_dpe_log_id_list = list(audit.iterfind('*//enum_methode_application_dpe_log_id'))
+        index = self.get_document_index(audit, report)
+        enum_methode_application_dpe_log_id_list = list(index.iterfind(audit, '*//enum_methode_application_dpe_log_id'))
         type_batiment_list = [
-            str(self.enum_table['methode_application_dpe_log'].loc[int(methode_dpe.text)].type_batiment) for methode_dpe
+            str(self.get_enum_value('methode_application_dpe_log', int(methode_dpe.text), 'type_batiment')) for methode_dpe
             in enum_methode_application_dpe_log_id_list]
 
         if len(set(type_batiment_list)) > 1:
@@ -4582,9 +4770,10 @@ cette surface doit être obligatoirement renseignée.
 
     #  Lorsque l'auditeur n'a renseigné aucun encadré destiné aux observations (recommandation)
     def controle_coherence_presence_recommandation(self, audit, report):
-        all_recommandation_scenario = list(audit.iterfind('*//recommandation_scenario'))
+        index = self.get_document_index(audit, report)
+        all_recommandation_scenario = list(index.iterfind(audit, '*//recommandation_scenario'))
         if len(all_recommandation_scenario) == 0:
-            recommandation_auditeur_collection = audit.find('.//recommandation_auditeur_collection')
+            recommandation_auditeur_collection = index.find(audit, './/recommandation_auditeur_collection')
             report.generate_msg(
                 "aucune recommandation auditeur n'a été définie (correspond aux encadrés « observations » dans la trame).",
                 msg_type='warning_saisie',
@@ -4608,14 +4797,15 @@ cette surface doit être obligatoirement renseignée.
 
     #  Contrôle : si aucune étape (objet logement) de l'audit n'utilise la dérogration ventilation, alors la balise enum_derogation_ventilation_id doit être à "abscence de dérogation"
     def controle_coherence_abscence_derogation_ventilation(self, audit, report):
-        all_etat_ventilation = list(audit.iterfind('*//enum_etat_ventilation_id'))
+        index = self.get_document_index(audit, report)
+        all_etat_ventilation = list(index.iterfind(audit, '*//enum_etat_ventilation_id'))
         if len(all_etat_ventilation) > 0:
             all_cases_with_derogation = [el for el in all_etat_ventilation if
                                          el.text == "3"]  # "3": "cas de dérogation"
             no_cases_with_derogation = len(all_cases_with_derogation) == 0
 
             if no_cases_with_derogation:
-                derogation_ventilation = audit.find('.//administratif').find('enum_derogation_ventilation_id')
+                derogation_ventilation = index.find(audit, './/administratif').find('enum_derogation_ventilation_id')
                 # Si une déclaration ventilation a été saisie dans enum_derogation_ventilation_id
                 if derogation_ventilation is not None and derogation_ventilation.text != '1':
                     # Ajoute l'objet derogation_ventilation à la liste des objets pour related_objects
@@ -4630,7 +4820,8 @@ cette surface doit être obligatoirement renseignée.
 
     #  Controle : si la dérogration ventilation est utilisée pour l'étape (objet logement), alors une dérogation doit être présente dans enum_derogation_ventilation_id
     def controle_coherence_presence_derogation_ventilation(self, logement, report):
-        enum_etat_ventilation_id = logement.find('*//enum_etat_ventilation_id')
+        index = self.get_document_index(logement, report)
+        enum_etat_ventilation_id = index.find(logement, '*//enum_etat_ventilation_id')
         enum_derogation_ventilation_id = logement.getparent().getparent().find('.//administratif').find(
             'enum_derogation_ventilation_id')
         if enum_etat_ventilation_id is not None and enum_derogation_ventilation_id is not None:
@@ -4647,14 +4838,15 @@ cette surface doit être obligatoirement renseignée.
 
     # Controle (Warning) : vérifie que pour les scénarios mono et multi étapes principaux, que le Ubat de l'étape finale soit inférieur au Ubat_base (condition BCC réno)
     def controle_coherence_ubat_base_ubat(self, logement, report):
-        ubat_base = logement.find('*//ubat_base')
+        index = self.get_document_index(logement, report)
+        ubat_base = index.find(logement, '*//ubat_base')
         if ubat_base is not None:
-            enum_scenario_id = logement.find('*//enum_scenario_id')
-            enum_etape_id = logement.find('*//enum_etape_id')
+            enum_scenario_id = index.find(logement, '*//enum_scenario_id')
+            enum_etape_id = index.find(logement, '*//enum_etape_id')
             is_scenario_principal = enum_scenario_id.text in ["1", "2"]
             is_etape_finale = enum_etape_id.text == "2"  # "étape finale"
             if is_scenario_principal and is_etape_finale:
-                ubat = logement.find('*//ubat')
+                ubat = index.find(logement, '*//ubat')
                 if float(ubat.text) > float(ubat_base.text):
                     report.generate_msg(
                         f"l'étape finale du scénario : {list(self.display_enum_traduction('enum_scenario_id', int(enum_scenario_id.text)).values())[0]}, a un Ubat = {round(float(ubat.text), 2)} supérieur au Ubat base = {round(float(ubat_base.text), 2)}, ce qui n'est pas BCC réno compatible. \n Merci de saisir des travaux de rénovation plus performants pour l'enveloppe du bâtiment.",
@@ -4666,12 +4858,13 @@ cette surface doit être obligatoirement renseignée.
 
     # Controle (Warning) : vérifie que pour les étapes de travaux ont un état de ventilation fonctionnelle (condition BCC réno)
     def controle_coherence_etat_ventilation(self, logement, report):
-        enum_etat_ventilation_id = logement.find('*//enum_etat_ventilation_id')
-        enum_scenario_id = logement.find('*//enum_scenario_id')
-        enum_etape_id = logement.find('*//enum_etape_id')
+        index = self.get_document_index(logement, report)
+        enum_etat_ventilation_id = index.find(logement, '*//enum_etat_ventilation_id')
+        enum_scenario_id = index.find(logement, '*//enum_scenario_id')
+        enum_etape_id = index.find(logement, '*//enum_etape_id')
         if enum_etat_ventilation_id is not None and enum_scenario_id.text != "0":
             ventilation_non_fonctionnelle = enum_etat_ventilation_id.text == "1"  # "1": "ventilation non fonctionnelle"
-            enum_scenario_id = logement.find('*//enum_scenario_id')
+            enum_scenario_id = index.find(logement, '*//enum_scenario_id')
             is_scenario_principal = enum_scenario_id.text in ["1", "2"]
             is_scenario_additional = enum_scenario_id.text in ["3", "4", "5"]
 
@@ -4694,12 +4887,12 @@ cette surface doit être obligatoirement renseignée.
 
     # Contrôle la présence de l'élément "caracteristiques_travaux", pour tous les travaux, dans "travaux_collection", qui nécessitent la présence de caractéristiques techniques
     def controle_coherence_presence_caracteristiques_travaux(self, logement, report):
+        index = self.get_document_index(logement, report)
 
-        etape_travaux = logement.find('.//etape_travaux')
+        etape_travaux = index.find(logement, './/etape_travaux')
         if etape_travaux is not None:
-            df_type_travaux_with_caracteristiques_travaux = self.enum_table_audit['type_travaux'].dropna(subset=['caracteristiques_travaux'])
-            ids_with_required_caracteristiques_travaux = list(df_type_travaux_with_caracteristiques_travaux.index)
-            libs_with_required_caracteristiques_travaux = list(df_type_travaux_with_caracteristiques_travaux.lib)
+            ids_with_required_caracteristiques_travaux = self.type_travaux_caracteristiques['ids']
+            libs_with_required_caracteristiques_travaux = self.type_travaux_caracteristiques['libs']
             travaux_without_caracteristiques_travaux = [travaux for travaux in list(etape_travaux.find('.//travaux_collection')) if travaux.find('caracteristiques_travaux') is None]
 
             missing_required_caracteristiques_travaux = [travaux for travaux in travaux_without_caracteristiques_travaux if int(travaux.find('enum_type_travaux_id').text) in ids_with_required_caracteristiques_travaux]
@@ -4715,12 +4908,12 @@ cette surface doit être obligatoirement renseignée.
 
     # Contrôle l'absence de l'élément "caracteristiques_travaux", pour tous les travaux, dans "travaux_collection", qui NE nécessitent PAS la présence de caractéristiques techniques
     def controle_coherence_absence_caracteristiques_travaux(self, logement, report):
+        index = self.get_document_index(logement, report)
 
-        etape_travaux = logement.find('.//etape_travaux')
+        etape_travaux = index.find(logement, './/etape_travaux')
         if etape_travaux is not None:
-            df_type_travaux_with_caracteristiques_travaux = self.enum_table_audit['type_travaux'].dropna(subset=['caracteristiques_travaux'])
-            ids_with_required_caracteristiques_travaux = list(df_type_travaux_with_caracteristiques_travaux.index)
-            libs_with_required_caracteristiques_travaux = list(df_type_travaux_with_caracteristiques_travaux.lib)
+            ids_with_required_caracteristiques_travaux = self.type_travaux_caracteristiques['ids']
+            libs_with_required_caracteristiques_travaux = self.type_travaux_caracteristiques['libs']
             travaux_with_caracteristiques_travaux = [travaux for travaux in list(etape_travaux.find('.//travaux_collection')) if travaux.find('caracteristiques_travaux') is not None]
 
             wrong_presence_caracteristiques_travaux = [travaux for travaux in travaux_with_caracteristiques_travaux if int(travaux.find('enum_type_travaux_id').text) not in ids_with_required_caracteristiques_travaux]
@@ -4736,18 +4929,18 @@ cette surface doit être obligatoirement renseignée.
 
     # Contrôle la cohérence entre enum_type_travaux_id et l'élément renseigné dans "caracteristiques_travaux", pour tous les travaux, dans "travaux_collection". Ne s'exécute que pour les travaux qui ont un "caracteristiques_travaux"
     def controle_coherence_caracteristiques_travaux(self, logement, report):
+        index = self.get_document_index(logement, report)
 
-        etape_travaux = logement.find('.//etape_travaux')
+        etape_travaux = index.find(logement, './/etape_travaux')
         if etape_travaux is not None:
-            df_type_travaux_with_caracteristiques_travaux = self.enum_table_audit['type_travaux'].dropna(subset=['caracteristiques_travaux'])
-            ids_with_required_caracteristiques_travaux = list(df_type_travaux_with_caracteristiques_travaux.index)
-            libs_with_required_caracteristiques_travaux = list(df_type_travaux_with_caracteristiques_travaux.lib)
+            ids_with_required_caracteristiques_travaux = self.type_travaux_caracteristiques['ids']
+            libs_with_required_caracteristiques_travaux = self.type_travaux_caracteristiques['libs']
             travaux_with_caracteristiques_travaux = [travaux for travaux in list(etape_travaux.find('.//travaux_collection')) if travaux.find('caracteristiques_travaux') is not None]
 
             # On ne garde QUE les travaux qui ONT une balise 'caracteristiques_travaux' ET qui ONT une valeur de 'enum_type_travaux_id' qui nécessite la présence de 'caracteristiques_travaux'
             travaux_clean = [travaux for travaux in travaux_with_caracteristiques_travaux if int(travaux.find('enum_type_travaux_id').text) in ids_with_required_caracteristiques_travaux]
 
-            enum_type_travaux_id_to_caracteristiques_travaux = df_type_travaux_with_caracteristiques_travaux['caracteristiques_travaux'].to_dict()
+            enum_type_travaux_id_to_caracteristiques_travaux = self.type_travaux_caracteristiques['caracteristiques_travaux']
 
             # Pour tous les travaux_clean, on regarde si la valeur de enum_type_travaux_id est cohérente avec celle de la balise fille de caracteristiques_travaux
             travaux_incoherent = [travaux for travaux in travaux_clean if enum_type_travaux_id_to_caracteristiques_travaux[int(travaux.find('enum_type_travaux_id').text)] != travaux.find('caracteristiques_travaux').getchildren()[0].tag]
@@ -4767,8 +4960,9 @@ cette surface doit être obligatoirement renseignée.
     # 3) Présence des coûts dans étapes de travaux, travaux_collection et travaux_induits_collection : soit la balise 'cout' soit la fourchette de couts 'cout_min', 'cout_max' doivent être renseignées. Pour etape_travaux, il faut aussi renseigner soit 'cout_cumule', soit la fourchette 'cout_cumule_min', 'cout_cumule_max'.
     # 4) Choix d'une méthode de saisie de coûts : Il n'est pas permis de saisir la balise de coût 'cout' et la fourchette de couts 'cout_min', 'cout_max'. L'utilisateur doit choisir une méthode. Cela s'applique aussi au 'cout_cumule'.
     def controle_coherence_etape_travaux_cout_presence(self, logement, report):
+        index = self.get_document_index(logement, report)
 
-        etape_travaux = logement.find('.//etape_travaux')
+        etape_travaux = index.find(logement, './/etape_travaux')
         if etape_travaux is not None:
 
             # EVALUATION DE 'cout', 'cout_min', 'cout_max' de etape_travaux
@@ -4944,27 +5138,23 @@ cette surface doit être obligatoirement renseignée.
 
     # Pour les « scénario multi étapes "principal" » et « scénario en une étape "principal" », il faut au moins 2 postes de travaux sur l'isolation de l'enveloppe (fenêtres comprises).
     def controle_coherence_deux_postes_isolation(self, audit, report):
-        enum_modele_audit_id = audit.find('*//enum_modele_audit_id')
+        index = self.get_document_index(audit, report)
+        enum_modele_audit_id = index.find(audit, '*//enum_modele_audit_id')
         not_audit_copro = enum_modele_audit_id.text in ['1', '2']
         if not_audit_copro:
             all_lot_travaux_in_mono = []
             all_lot_travaux_in_1er_etape_multi = []
-            all_caracteristique_generale = list(audit.iterfind('*//caracteristique_generale'))
-            for caracteristique_generale in all_caracteristique_generale:
-                enum_scenario_id = caracteristique_generale.find('enum_scenario_id').text
-                enum_etape_id = caracteristique_generale.find('enum_etape_id').text
+            for etape in get_audit_graph(audit, index).etapes:
+                enum_scenario_id = etape.scenario_id
+                enum_etape_id = etape.etape_id
                 # Mono-etapes - etape finale
                 if enum_scenario_id == "2" and enum_etape_id == "2":
-                    if caracteristique_generale.getparent().find('etape_travaux') is not None:
-                        all_lot_travaux_in_mono += list(
-                            caracteristique_generale.getparent().find('etape_travaux').iterfind(
-                                '*//enum_lot_travaux_audit_id'))
+                    if etape.etape_travaux is not None:
+                        all_lot_travaux_in_mono += etape.lot_travaux
                 # Multi-etape - etape 1er
                 elif enum_scenario_id == "1" and enum_etape_id == "1":
-                    if caracteristique_generale.getparent().find('etape_travaux') is not None:
-                        all_lot_travaux_in_1er_etape_multi += list(
-                            caracteristique_generale.getparent().find('etape_travaux').iterfind(
-                                '*//enum_lot_travaux_audit_id'))
+                    if etape.etape_travaux is not None:
+                        all_lot_travaux_in_1er_etape_multi += etape.lot_travaux
 
             lot_travaux_to_check = {"1": "murs",
                                     "2": "planchers bas",
@@ -4987,22 +5177,21 @@ cette surface doit être obligatoirement renseignée.
     # Pour le « scénario multi étapes "principal" », il faut que l’ « étape première », si elle n'est pas "A", "B" ou "C", permette de réaliser un gain d'au moins 2 classes et au minimum d'atteindre la classe E
     # Si dérogation, alors le controle de s'applique pas.
     def controle_coherence_etape_premiere_saut_2_classes(self, audit, report):
+        index = self.get_document_index(audit, report)
         # Vérification de la presence de derogation
-        derogation_technique = audit.find('.//enum_derogation_technique_id').text != '1'
-        derogation_economique = audit.find('.//enum_derogation_economique_id').text != '1'
+        derogation_technique = index.find(audit, './/enum_derogation_technique_id').text != '1'
+        derogation_economique = index.find(audit, './/enum_derogation_economique_id').text != '1'
         if not derogation_technique and not derogation_economique:
             class_multi_etape_premiere = None
             class_etat_initial = None
-            all_caracteristique_generale = list(audit.iterfind('*//caracteristique_generale'))
-            for caracteristique_generale in all_caracteristique_generale:
-                enum_scenario_id = caracteristique_generale.find('enum_scenario_id').text
-                enum_etape_id = caracteristique_generale.find('enum_etape_id').text
+            for etape in get_audit_graph(audit, index).etapes:
+                enum_scenario_id = etape.scenario_id
+                enum_etape_id = etape.etape_id
                 if enum_scenario_id == "0" and enum_etape_id == "0":
-                    class_etat_initial = caracteristique_generale.getparent().find('.//classe_bilan_dpe')
+                    class_etat_initial = etape.classe_bilan_dpe
                 elif enum_scenario_id == "1" and enum_etape_id == "1":
-                    if caracteristique_generale.getparent().find('etape_travaux') is not None:
-                        class_multi_etape_premiere = caracteristique_generale.getparent().find('etape_travaux').find(
-                            'classe_bilan_dpe')
+                    if etape.etape_travaux is not None:
+                        class_multi_etape_premiere = etape.classe_bilan_dpe_etape_travaux
 
             if (class_multi_etape_premiere is not None) and (class_etat_initial is not None) and (class_etat_initial.text not in ["A", "B", "C"]):
                 class_score = {"A": 6, "B": 5, "C": 4, "D": 3, "E": 2, "F": 1, "G": 0}
@@ -5032,8 +5221,9 @@ cette surface doit être obligatoirement renseignée.
     # sauf tolérance spécifique définie.
 
     def controle_coherence_gain_cumule(self, audit, report):
+        index = self.get_document_index(audit, report)
         # La vérification ne s'applique que si les deux scénarios (1 et 2) sont présents
-        scenario_ids = {el.text for el in audit.findall('.//enum_scenario_id')}
+        scenario_ids = {el.text for el in index.iterfind(audit, './/enum_scenario_id')}
         if {'1', '2'}.issubset(scenario_ids):
             el_gain_to_check = ["ep_conso_5_usages_m2_gain", "ef_conso_5_usages_m2_gain", "emission_ges_5_usages_m2_gain", "facture_gain"]
             el_gain_cumule_relatif_to_check = ["ep_conso_5_usages_m2_gain_cumule_relatif", "ef_conso_5_usages_m2_gain_cumule_relatif", "emission_ges_5_usages_m2_gain_cumule_relatif"]
@@ -5046,51 +5236,50 @@ cette surface doit être obligatoirement renseignée.
             all_gain_in_multi = {el:0 for el in el_gain_to_check}
             all_gain_in_mono_related_objects = {el:[] for el in el_gain_to_check}
             all_gain_in_multi_related_objects = {el:[] for el in el_gain_to_check}
-            all_caracteristique_generale = list(audit.iterfind('*//caracteristique_generale'))
-            for caracteristique_generale in all_caracteristique_generale:
-                enum_etape_id = caracteristique_generale.find('enum_etape_id').text
+            audit_graph = get_audit_graph(audit, index)
+            for etape in audit_graph.etapes:
+                enum_etape_id = etape.etape_id
                 # Cas Etat initial
                 if enum_etape_id == '0':
-                    emission_ges_5_usages_m2_initial = float(caracteristique_generale.getparent().find('sortie').find('emission_ges').find('emission_ges_5_usages_m2').text)
+                    emission_ges_5_usages_m2_initial = etape.emission_ges_5_usages_m2
 
             # Calcul du seuil de tolerance GES relatif par rapport au GES de l'état initial
             tolerance_ges_relative = TOLERANCE_GES_ABSOLUE / emission_ges_5_usages_m2_initial
 
             flag_gain_in_mono_missing_data = True
             flag_gain_in_multi_missing_data = True
-            for caracteristique_generale in all_caracteristique_generale:
-                enum_scenario_id = caracteristique_generale.find('enum_scenario_id').text
-                enum_etape_id = caracteristique_generale.find('enum_etape_id').text
-                etape_travaux = caracteristique_generale.getparent().find('etape_travaux')
+            for etape in audit_graph.etapes:
+                enum_scenario_id = etape.scenario_id
+                enum_etape_id = etape.etape_id
 
-                if etape_travaux is not None:
+                if etape.etape_travaux is not None:
                     for el in all_gain_in_mono.keys():
-                        value = float(etape_travaux.find(el).text)
+                        value = etape.etape_travaux_value(el)
                         if enum_scenario_id == "2":
                             flag_gain_in_mono_missing_data = False
                             all_gain_in_mono[el] += value
-                            all_gain_in_mono_related_objects[el].append(etape_travaux.find(el))
+                            all_gain_in_mono_related_objects[el].append(etape.etape_travaux_element(el))
                         elif enum_scenario_id == "1":
                             flag_gain_in_multi_missing_data = False
                             all_gain_in_multi[el] += value
-                            all_gain_in_multi_related_objects[el].append(etape_travaux.find(el))
+                            all_gain_in_multi_related_objects[el].append(etape.etape_travaux_element(el))
 
                     # Vérification des gains relatifs cumulés à l’étape finale uniquement
                     if enum_etape_id == "2":
                         for el in el_gain_cumule_relatif_to_check:
-                            value = float(etape_travaux.find(el).text)
+                            value = etape.etape_travaux_value(el)
                             if enum_scenario_id == "2":
                                 if el == "emission_ges_5_usages_m2_gain_cumule_relatif":
                                     if value > tolerance_ges_relative:
-                                        wrong_gain_cumule_relatif_in_mono[el] = etape_travaux.find(el)
+                                        wrong_gain_cumule_relatif_in_mono[el] = etape.etape_travaux_element(el)
                                 elif value >= 0:
-                                    wrong_gain_cumule_relatif_in_mono[el] = etape_travaux.find(el)
+                                    wrong_gain_cumule_relatif_in_mono[el] = etape.etape_travaux_element(el)
                             elif enum_scenario_id == "1":
                                 if el == "emission_ges_5_usages_m2_gain_cumule_relatif":
                                     if value > tolerance_ges_relative:
-                                        wrong_gain_cumule_relatif_in_multi[el] = etape_travaux.find(el)
+                                        wrong_gain_cumule_relatif_in_multi[el] = etape.etape_travaux_element(el)
                                 elif value >= 0:
-                                    wrong_gain_cumule_relatif_in_multi[el] = etape_travaux.find(el)
+                                    wrong_gain_cumule_relatif_in_multi[el] = etape.etape_travaux_element(el)
 
             # Suppression des clés avec des valeurs < 0 (ou < 10 kgCO2/m2/an pour GES)
             def filter_gain_dict(gain_dict, turn_off_control_if_no_data:bool):
@@ -5208,16 +5397,16 @@ cette surface doit être obligatoirement renseignée.
     # - Si audit copro (id = 3) → scénario « audit copro principal » (enum_scenario_id = 7) requis. Les scénarios « multi étapes principal » (enum_scenario_id = 1) et « en une étape principal » (enum_scenario_id = 2) interdits
     # - Sinon → scénario « audit copro principal » (enum_scenario_id = 7) et scénario « complémentaire 4 - audit copro » (enum_scenario_id = 6) interdits
     def controle_coherence_scenario_audit_copro(self, audit, report):
+        index = self.get_document_index(audit, report)
 
-        enum_modele_audit_id = audit.find('*//enum_modele_audit_id')
+        enum_modele_audit_id = index.find(audit, '*//enum_modele_audit_id')
         is_audit_copro = enum_modele_audit_id is not None and enum_modele_audit_id.text == '3'
 
-        all_caracteristique_generale = list(audit.iterfind('*//caracteristique_generale'))
         scenario_ids = []
         mapping_scenario_to_related_objects = {}
 
-        for cg in all_caracteristique_generale:
-            scenario_element = cg.find('enum_scenario_id')
+        for etape in get_audit_graph(audit, index).etapes:
+            scenario_element = etape.enum_scenario_id
             scenario_id = scenario_element.text
             scenario_ids.append(scenario_id)
 
@@ -5282,9 +5471,10 @@ cette surface doit être obligatoirement renseignée.
     # - Si audit copro (id = 3) → la dérogation technique doit être à « non applicable - audit copro » (enum_derogation_technique_id = 3), et la dérogation économique à « non applicable - audit copro » (enum_derogation_economique_id = 4)
     # - Sinon → ces valeurs de dérogation « non applicable - audit copro » (3 et 4) sont interdites
     def controle_coherence_derogation_audit_copro(self, audit, report):
-        enum_modele_audit_id = audit.find('*//enum_modele_audit_id')
-        enum_derogation_technique_id = audit.find('*//enum_derogation_technique_id')
-        enum_derogation_economique_id = audit.find('*//enum_derogation_economique_id')
+        index = self.get_document_index(audit, report)
+        enum_modele_audit_id = index.find(audit, '*//enum_modele_audit_id')
+        enum_derogation_technique_id = index.find(audit, '*//enum_derogation_technique_id')
+        enum_derogation_economique_id = index.find(audit, '*//enum_derogation_economique_id')
 
         modele_id = enum_modele_audit_id.text if enum_modele_audit_id is not None else None
         tech_id = enum_derogation_technique_id.text if enum_derogation_technique_id is not None else None
@@ -5342,6 +5532,7 @@ EngineAudit()  # init the engine singleton
 class CoreReport():
     def __init__(self):
         self.xsd_validation = dict()
+        self.document_index = None
         self.warning_software = list()
         self.warning_input = list()
         self.error_software = list()
@@ -5426,49 +5617,80 @@ class CoreReport():
 
     def enrich_issues_message_and_meta_data(self, xml_reg, msg_importance_for_report, engine):
 
+        # contexte des objets concernés calculé une seule fois par objet (et par logement pour l'étape et le scénario) :
+        # les mêmes objets sont cités par de nombreux messages
+        descriptions_cache = dict()
+        references_cache = dict()
+        etape_scenario_cache = dict()
+        etape_scenario_logement_cache = dict()
+        paths_cache = dict()
+
+        def get_etape_and_scenario(el):
+            logement = self.get_logement(el)
+            if logement is None:
+                return None
+            return self._get_cached(etape_scenario_logement_cache, logement,
+                                    lambda logement: self.get_logement_etape_and_scenario(logement, engine))
+
         for k, v in self.report.items():
 
             if k not in ['validation_xsd', 'message_principal']:
                 for issue in v:
-                    descriptions = [self.get_object_description(el) for el in issue['objets_concerne'] if el is not None]
+                    descriptions = [self._get_cached(descriptions_cache, el, self.get_object_description) for el in issue['objets_concerne'] if el is not None]
                     descriptions = set([el for el in descriptions if el is not None])
                     if len(descriptions) > 0:
                         issue['message'] += "\nobjets concernés : \n" + '\n'.join(descriptions)
-                    references = [self.get_object_reference(el) for el in issue['objets_concerne'] if el is not None]
+                    references = [self._get_cached(references_cache, el, self.get_object_reference) for el in issue['objets_concerne'] if el is not None]
                     references = set([el for el in references if el is not None])
                     if len(references) > 0:
                         issue['message'] += "\nréférence des objets concernés : \n" + '\n'.join(references)
-                    etape_scenario = [self.get_etape_and_scenario(el, engine) for el in issue['objets_concerne'] if el is not None]
+                    etape_scenario = [self._get_cached(etape_scenario_cache, el, get_etape_and_scenario) for el in issue['objets_concerne'] if el is not None]
                     etape_scenario = set([el for el in etape_scenario if el is not None])
                     if len(etape_scenario) > 0:
                         issue['message'] += "\netapes et scénarios concernés : \n" + '\n'.join(etape_scenario)
                     issue['thematique'] = msg_themes[issue['thematique']]
                     issue['importance'] = msg_importance_for_report[issue['importance']]
-                    issue['objets_concerne'] = [xml_reg.getpath(el) for el in issue['objets_concerne'] if
+                    issue['objets_concerne'] = [self._get_cached(paths_cache, el, xml_reg.getpath) for el in issue['objets_concerne'] if
                                                 el is not None]
 
     @staticmethod
-    def get_etape_and_scenario(object, engine):
+    def _get_cached(cache, el, func):
+        try:
+            return cache[el]
+        except KeyError:
+            value = func(el)
+            cache[el] = value
+            return value
+
+    @staticmethod
+    def get_logement(object):
         parent = object.getparent()
         while parent is not None:
             if parent.tag == "logement":
                 break
             else:
                 parent = parent.getparent()
-        if parent is not None:
-            enum_scenario_id = parent.find('*//enum_scenario_id')
-            if enum_scenario_id is not None:
-                scenario = str(engine.display_enum_traduction(enum_scenario_id.tag, int(enum_scenario_id.text))[
-                                   int(enum_scenario_id.text)])
-                enum_etape_id = parent.find('*//enum_etape_id')
-                etape = str(
-                    engine.display_enum_traduction(enum_etape_id.tag, int(enum_etape_id.text))[int(enum_etape_id.text)])
-                scenario_etape = f'scenario_id : {scenario}\netape_id: {etape}'
-                nom_scenario = parent.find('*//nom_scenario')
-                if nom_scenario is not None:
-                    scenario_etape = f'nom_scenario : {nom_scenario.text}\n' + scenario_etape
-                return scenario_etape
+        return parent
+
+    @staticmethod
+    def get_logement_etape_and_scenario(logement, engine):
+        enum_scenario_id = logement.find('*//enum_scenario_id')
+        if enum_scenario_id is not None:
+            scenario = str(engine.enum_registry.label(enum_scenario_id.tag, int(enum_scenario_id.text)))
+            enum_etape_id = logement.find('*//enum_etape_id')
+            etape = str(engine.enum_registry.label(enum_etape_id.tag, int(enum_etape_id.text)))
+            scenario_etape = f'scenario_id : {scenario}\netape_id: {etape}'
+            nom_scenario = logement.find('*//nom_scenario')
+            if nom_scenario is not None:
+                scenario_etape = f'nom_scenario : {nom_scenario.text}\n' + scenario_etape
+            return scenario_etape
+        return None
 
+    @classmethod
+    def get_etape_and_scenario(cls, object, engine):
+        logement = cls.get_logement(object)
+        if logement is not None:
+            return cls.get_logement_etape_and_scenario(logement, engine)
         return None
 
     @staticmethod
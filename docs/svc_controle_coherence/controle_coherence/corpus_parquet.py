@@ -0,0 +1,370 @@
+import itertools
+import logging
+import os
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+import pandas as pd
+from lxml import etree
+
+from controle_coherence.utils import remove_null_elements
+from controle_coherence.utils_convert_excel import LOGEMENT_SIMPLE_ELEMENTS, LOGEMENT_COLLECTIONS, \
+    LOGEMENT_INSTALLATIONS, SORTIE_SIMPLE_ELEMENTS, SORTIE_COLLECTIONS, find_simple_element, iter_collection, \
+    element_values
+from controle_coherence.xsd_registry import xsd_registry
+
+logger = logging.getLogger(__name__)
+
+XS = 'http://www.w3.org/2001/XMLSchema'
+NAMESPACES = {'xs': XS}
+
+# type des colonnes selon le type de base xsd de la variable, texte par défaut
+DTYPES = {'int': 'Int64', 'integer': 'Int64', 'long': 'Int64', 'short': 'Int64', 'nonNegativeInteger': 'Int64',
+          'positiveInteger': 'Int64', 'double': 'Float64', 'decimal': 'Float64', 'float': 'Float64',
+          'boolean': 'boolean', 'date': 'datetime64[ns]', 'dateTime': 'datetime64[ns, UTC]'}
+
+def get_parquet_batch_size():
+    """nombre de documents par lot (et par fichier parquet de chaque composant) : variable d'environnement OBS_DPE_PARQUET_BATCH_SIZE."""
+    return int(os.getenv('OBS_DPE_PARQUET_BATCH_SIZE', 500))
+
+
+def get_parquet_processes():
+    """
+    nombre de processus aplatissant les lots : variable d'environnement OBS_DPE_PARQUET_PROCESSES (par défaut le nombre
+    de cpu, 0 : lots traités dans le process courant).
+    """
+    return int(os.getenv('OBS_DPE_PARQUET_PROCESSES', os.cpu_count() or 1))
+
+
+def get_components():
+    """
+    composants aplatis, chacun écrit dans son propre jeu de données parquet.
+
+    :return: dict nom du composant -> nom de l'installation parente (sous-collections des installations) ou None
+    """
+    components = dict.fromkeys(['administratif'] + LOGEMENT_SIMPLE_ELEMENTS + LOGEMENT_COLLECTIONS)
+    for installation, sub_collections in LOGEMENT_INSTALLATIONS.items():
+        components[installation] = None
+        components.update(dict.fromkeys(sub_collections, installation))
+    components.update(dict.fromkeys(SORTIE_SIMPLE_ELEMENTS + SORTIE_COLLECTIONS))
+    return components
+
+
+def enum_label_column(name):
+    """colonne du libellé d'un énumérateur (nom de l'élément traduit par traduction_xml_new_element) ou None."""
+    if name.startswith('enum_') and name.endswith('_id'):
+        return '_'.join(name.split('_')[1:-1])
+    if name.startswith('qualite_isol_'):
+        return f'{name}_libelle'
+    return None
+
+
+def _component_fields(definition, simple_types, complex_types, global_elements):
+    """variables (nom, type de base xsd) d'un composant dans l'ordre du xsd, comme element_values sur le xml."""
+    def child_elements(parent):
+        return [el for el in parent.iterfind('.//xs:element', namespaces=NAMESPACES)
+                if next(el.iterancestors(f'{{{XS}}}element')) is parent]
+
+    children = child_elements(definition)
+    donnee = [el for el in children if el.get('name') in ('donnee_entree', 'donnee_intermediaire')]
+    if any(el.get('name') == 'donnee_entree' for el in donnee):
+        children = [child for el in donnee for child in child_elements(el)]
+    for el in children:
+        name = el.get('name')
+        if name is None:
+            name = el.get('ref')
+            el = global_elements.get(name, el)
+        if el.find('xs:complexType', namespaces=NAMESPACES) is not None or el.get('type') in complex_types:
+            continue
+        base = el.get('type')
+        restriction = el.find('xs:simpleType/xs:restriction', namespaces=NAMESPACES)
+        if base is None and restriction is not None:
+            base = restriction.get('base')
+        while base in simple_types:
+            base = simple_types[base]
+        yield name, base.split(':')[-1] if base is not None else 'string'
+
+
+def extract_components_schema(xsd, components):
+    """
+    :param xsd: arbre du xsd
+    :return: dict composant -> dict colonne -> dtype pandas, libellés des énumérateurs compris
+    """
+    root = xsd.getroot()
+    simple_types = {el.get('name'): el.find('xs:restriction', namespaces=NAMESPACES).get('base')
+                    for el in root.iterfind('xs:simpleType', namespaces=NAMESPACES)
+                    if el.find('xs:restriction', namespaces=NAMESPACES) is not None}
+    complex_types = {el.get('name') for el in root.iterfind('xs:complexType', namespaces=NAMESPACES)}
+    global_elements = {el.get('name'): el for el in root.iterfind('xs:element', namespaces=NAMESPACES)}
+    schema = dict()
+    for component in components:
+        columns = dict()
+        for definition in root.iterfind(f'.//xs:element[@name="{component}"]', namespaces=NAMESPACES):
+            if definition.find('xs:complexType', namespaces=NAMESPACES) is None:
+                continue
+            for name, base in _component_fields(definition, simple_types, complex_types, global_elements):
+                columns.setdefault(name, DTYPES.get(base, 'string'))
+                label = enum_label_column(name)
+                if label is not None:
+                    columns.setdefault(label, 'string')
+        schema[component] = columns
+    return schema
+
+
+def merge_dtypes(dtype, other):
+    if dtype == other:
+        return dtype
+    if {dtype, other} == {'Int64', 'Float64'}:
+        return 'Float64'
+    return 'string'
+
+
+def get_corpus_schema(engines):
+    """
+    colonnes de chaque composant : union des variables de toutes les versions du xsd de chaque dispositif, pour que
+    les fichiers parquet d'un même composant partagent le même schéma quel que soit le lot.
+
+    :param engines: dict dispositif ('dpe', 'audit') -> moteur
+    :return: dict dispositif -> composant -> dict colonne -> dtype pandas
+    """
+    components = get_components()
+    corpus_schema = dict()
+    for dispositif, engine in engines.items():
+        schema = {component: dict() for component in components}
+        xsd_paths = list(dict.fromkeys(engine._xsd_path(version_id_str) for version_id_str in engine.VERSION_CFG))
+        for xsd_path in xsd_paths:
+            for component, columns in extract_components_schema(xsd_registry.parse_xsd(xsd_path), components).items():
+                for name, dtype in columns.items():
+                    schema[component][name] = merge_dtypes(schema[component].get(name, dtype), dtype)
+        corpus_schema[dispositif] = schema
+    return corpus_schema
+
+
+def _enum_label(engine, enum_name, text):
+    try:
+        return engine.enum_registry.label_traduction(enum_name, int(text))
+    except (KeyError, ValueError, TypeError):
+        return None
+
+
+def _component_row(el, engine):
+    row = dict()
+    for name, text in element_values(el, convert=False).items():
+        row[name] = text
+        label = enum_label_column(name)
+        if label is not None:
+            enum_name = name if name.startswith('enum_') else 'enum_qualite_composant_id'
+            row[label] = _enum_label(engine, enum_name, text)
+    return row
+
+
+def _logement_name(logement, dispositif):
+    # même nom que la feuille de l'export excel : scenario_X_etape_Y pour les logements de l'audit
+    if dispositif == 'dpe':
+        return logement.tag
+    caracteristique_generale = logement.find('caracteristique_generale')
+    return (f"scenario_{caracteristique_generale.findtext('enum_scenario_id')}_"
+            f"etape_{caracteristique_generale.findtext('enum_etape_id')}")
+
+
+def flatten_document(xml, engine):
+    """
+    aplatissement d'un DPE ou d'un audit : une ligne par composant, avec le numéro du document, le logement et le rang
+    du composant dans le logement (et celui de son installation pour les générateurs et émetteurs).
+
+    :return: (dispositif, dict composant -> liste de lignes dict colonne -> texte ou libellé)
+    """
+    dispositif = xml.getroot().tag
+    remove_null_elements(xml)
+    key = f'numero_{dispositif}'
+    numero = xml.getroot().findtext(key)
+    rows = defaultdict(list)
+
+    administratif = xml.getroot().find('administratif')
+    if administratif is not None:
+        rows['administratif'].append({key: numero, **_component_row(administratif, engine)})
+
+    if dispositif == 'dpe':
+        logements = [el for el in [xml.getroot().find('logement'), xml.getroot().find('logement_neuf')] if el is not None]
+    else:
+        logements = list(xml.iterfind('*//logement'))
+    for logement in logements:
+        keys = {key: numero, 'logement': _logement_name(logement, dispositif)}
+        for name in LOGEMENT_SIMPLE_ELEMENTS + SORTIE_SIMPLE_ELEMENTS:
+            el = find_simple_element(logement, name)
+            if el is not None:
+                rows[name].append({**keys, 'rang': 0, **_component_row(el, engine)})
+        for name in LOGEMENT_COLLECTIONS + SORTIE_COLLECTIONS:
+            for i, el in enumerate(iter_collection(logement, name)):
+                rows[name].append({**keys, 'rang': i, **_component_row(el, engine)})
+        for installation, sub_collections in LOGEMENT_INSTALLATIONS.items():
+            sub_rank = defaultdict(int)
+            for i, el in enumerate(logement.iterfind(f'.//{installation}')):
+                rows[installation].append({**keys, 'rang': i, **_component_row(el, engine)})
+                for name in sub_collections:
+                    for sub_el in iter_collection(el, name):
+                        rows[name].append({**keys, 'rang': sub_rank[name], f'rang_{installation}': i,
+                                           **_component_row(sub_el, engine)})
+                        sub_rank[name] += 1
+    return dispositif, rows
+
+
+def get_key_columns(dispositif, component, components=None):
+    if components is None:
+        components = get_components()
+    if component == 'administratif':
+        return {f'numero_{dispositif}': 'string'}
+    keys = {f'numero_{dispositif}': 'string', 'logement': 'string', 'rang': 'Int64'}
+    installation = components[component]
+    if installation is not None:
+        keys[f'rang_{installation}'] = 'Int64'
+    return keys
+
+
+def _typed_column(values, dtype):
+    values = pd.Series(values, dtype='string')
+    if dtype in ('Int64', 'Float64'):
+        # même conversion des décimales que convert_xml_text, valeurs invalides laissées vides
+        numbers = pd.to_numeric(values.str.replace(',', '.', regex=False), errors='coerce').astype('float64')
+        if dtype == 'Int64':
+            numbers = numbers.where(numbers.round() == numbers)
+        return numbers.astype(dtype)
+    if dtype == 'boolean':
+        return values.map({'true': True, '1': True, 'false': False, '0': False}, na_action='ignore').astype('boolean')
+    if dtype.startswith('datetime64'):
+        return pd.to_datetime(values.astype('object'), errors='coerce', utc=dtype.endswith('UTC]')).astype(dtype)
+    return values
+
+
+def component_dataframe(rows, columns):
+    """
+    :param columns: dict colonne -> dtype pandas, les variables absentes du schéma sont ignorées
+    :return: DataFrame typé avec exactement ces colonnes
+    """
+    return pd.DataFrame({name: _typed_column([row.get(name) for row in rows], dtype)
+                         for name, dtype in columns.items()})
+
+
+def flatten_batch(paths, corpus_schema, engines):
+    """
+    :return: (dict (dispositif, composant) -> DataFrame, nombre de documents aplatis, liste de (fichier, erreur))
+    """
+    components = get_components()
+    # lecture permissive comme pour l'export excel
+    parser = etree.XMLParser(remove_blank_text=True, recover=True, resolve_entities=False, no_network=True)
+    rows = defaultdict(list)
+    nb_documents = 0
+    errors = list()
+    for path in paths:
+        try:
+            xml = etree.parse(str(path), parser)
+            if xml.getroot() is None:
+                raise ValueError('fichier xml illisible')
+            if xml.getroot().tag not in engines:
+                raise ValueError(f'balise racine {xml.getroot().tag} inconnue')
+            dispositif, document_rows = flatten_document(xml, engines[xml.getroot().tag])
+        except Exception as e:
+            errors.append((str(path), repr(e)))
+            continue
+        nb_documents += 1
+        for component, component_rows in document_rows.items():
+            rows[(dispositif, component)].extend(component_rows)
+    tables = dict()
+    for (dispositif, component), component_rows in rows.items():
+        columns = {**get_key_columns(dispositif, component, components), **corpus_schema[dispositif][component]}
+        tables[(dispositif, component)] = component_dataframe(component_rows, columns)
+    return tables, nb_documents, errors
+
+
+def _get_engines():
+    from controle_coherence.controle_coherence import EngineDPE, EngineAudit
+    return {'dpe': EngineDPE(), 'audit': EngineAudit()}
+
+
+def flatten_batch_to_parquet(batch_id, paths, output_folder, corpus_schema):
+    """
+    exécuté dans un worker : écrit output_folder/<dispositif>/<composant>/part-<batch_id>.parquet pour chaque
+    composant présent dans le lot.
+
+    :return: dict {'documents', 'erreurs', 'lignes' : dict '<dispositif>/<composant>' -> nombre de lignes}
+    """
+    tables, nb_documents, errors = flatten_batch(paths, corpus_schema, _get_engines())
+    nb_rows = dict()
+    for (dispositif, component), df in tables.items():
+        folder = Path(output_folder) / dispositif / component
+        folder.mkdir(exist_ok=True, parents=True)
+        df.to_parquet(folder / f'part-{batch_id:05d}.parquet', index=False)
+        nb_rows[f'{dispositif}/{component}'] = len(df)
+    return {'documents': nb_documents, 'erreurs': errors, 'lignes': nb_rows}
+
+
+def iter_xml_paths(paths):
+    """fichiers xml des chemins donnés, les dossiers étant parcourus récursivement."""
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            yield from sorted(el for el in path.rglob('*') if el.suffix.lower() == '.xml')
+        else:
+            yield path
+
+
+def flatten_corpus(paths, output_folder, batch_size=None, processes=None):
+    """
+    aplatissement d'un corpus de DPE et d'audits en un jeu de données parquet par dispositif et par composant
+    (output_folder/<dispositif>/<composant>/part-*.parquet). Les colonnes sont typées d'après les xsd, les libellés
+    des énumérateurs sont ajoutés à côté de leurs ids.
+
+    les documents sont traités par lots de batch_size sur processes processus : au plus deux lots par processus sont
+    en cours à un instant donné, la mémoire utilisée est proportionnelle à la taille d'un lot et non à celle du corpus.
+    Un document illisible est ignoré et renvoyé dans les erreurs.
+
+    :param paths: fichiers xml et/ou dossiers
+    :return: dict {'documents', 'erreurs' : liste de (fichier, erreur), 'lignes' : dict '<dispositif>/<composant>' ->
+    nombre de lignes}
+    """
+    from controle_coherence.worker_pool import ValidationWorkerPool
+
+    try:
+        pd.io.parquet.get_engine('auto')
+    except ImportError as e:
+        raise ImportError("l'écriture des fichiers parquet nécessite pyarrow : pip install -e .[parquet]") from e
+    batch_size = batch_size or get_parquet_batch_size()
+    processes = get_parquet_processes() if processes is None else processes
+    corpus_schema = get_corpus_schema(_get_engines())
+    paths = iter_xml_paths(paths)
+    batches = enumerate(iter(lambda: list(itertools.islice(paths, batch_size)), []))
+
+    stats = {'documents': 0, 'erreurs': list(), 'lignes': defaultdict(int)}
+
+    def add_stats(batch_stats):
+        stats['documents'] += batch_stats['documents']
+        stats['erreurs'].extend(batch_stats['erreurs'])
+        for name, nb_rows in batch_stats['lignes'].items():
+            stats['lignes'][name] += nb_rows
+        logger.info(f"{stats['documents']} documents aplatis, {len(stats['erreurs'])} erreurs")
+
+    if processes == 0:
+        for batch_id, batch in batches:
+            add_stats(flatten_batch_to_parquet(batch_id, batch, output_folder, corpus_schema))
+    else:
+        # file bornée : un lot n'est soumis que lorsqu'une place se libère
+        pool = ValidationWorkerPool(processes, processes)
+        try:
+            futures = [pool.submit(flatten_batch_to_parquet, batch_id, batch, output_folder, corpus_schema,
+                                   block=True) for batch_id, batch in batches]
+            for future in futures:
+                add_stats(future.result())
+        finally:
+            pool.shutdown()
+    stats['lignes'] = dict(stats['lignes'])
+    return stats
+
+
+if __name__ == '__main__':
+    # python -m controle_coherence.corpus_parquet <dossier de sortie> <fichiers xml ou dossiers>...
+    logging.basicConfig(level=logging.INFO)
+    corpus_stats = flatten_corpus(sys.argv[2:], sys.argv[1])
+    for file_name, error in corpus_stats['erreurs']:
+        print(f'{file_name} : {error}')
+    print(f"{corpus_stats['documents']} documents aplatis dans {sys.argv[1]}")
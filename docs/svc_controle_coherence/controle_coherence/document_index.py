@@ -0,0 +1,170 @@
+from bisect import bisect_right
+from collections import defaultdict
+
+from lxml import etree
+
+
+class DocumentIndex:
+    """
+    index d'un xml DPE ou audit construit en un seul parcours du document.
+
+    les contrôles de cohérence recherchent très souvent tous les éléments d'un tag donné sous un logement
+    (logement.iterfind('*//mur')). Chaque recherche lxml reparcourt tout le sous-arbre : l'index permet de faire ces
+    recherches par tag en O(log n + k) grâce à la numérotation préfixe des éléments (un élément est descendant d'un autre
+    si son numéro est compris entre le numéro de l'ancêtre et celui de son dernier descendant).
+
+    seuls les chemins './/tag' et '*//tag' sont servis par l'index, les autres chemins et les éléments absents de l'index
+    (copies, éléments créés après coup) sont délégués à lxml.
+    """
+
+    def __init__(self, xml):
+        if isinstance(xml, etree._ElementTree):
+            xml = xml.getroot()
+        self.root = xml
+        self.elements = list()  # éléments dans l'ordre du document
+        self.start = dict()  # élément -> numéro dans l'ordre du document
+        self.end = dict()  # élément -> numéro de son dernier descendant
+        self.by_tag = defaultdict(list)  # tag -> éléments dans l'ordre du document
+        self.starts_by_tag = defaultdict(list)  # tag -> numéros des éléments
+
+        for event, el in etree.iterwalk(xml, events=('start', 'end')):
+            if event == 'start':
+                if not isinstance(el.tag, str):  # commentaires et instructions de traitement
+                    continue
+                position = len(self.elements)
+                self.elements.append(el)
+                self.start[el] = position
+                self.by_tag[el.tag].append(el)
+                self.starts_by_tag[el.tag].append(position)
+            elif el in self.start:
+                self.end[el] = len(self.elements) - 1
+        self._ancestor_cache = dict()
+        self.cache = dict()  # résultats dérivés de l'index partagés entre les contrôles (ex : répartition des règles)
+
+    def __contains__(self, element):
+        return element in self.start
+
+    @staticmethod
+    def _parse_path(path):
+        # renvoie (tag, profondeur minimale) pour les chemins './/tag' et '*//tag', None sinon
+        if path.startswith('.//'):
+            tag, min_depth = path[3:], 1
+        elif path.startswith('*//'):
+            tag, min_depth = path[3:], 2
+        else:
+            return None
+        if not tag or any(c in tag for c in '/[]*@:.'):
+            return None
+        return tag, min_depth
+
+    def iter_tag(self, tag, element=None, min_depth=1):
+        """
+        liste des éléments de tag donné descendants de element (tout le document par défaut), dans l'ordre du document.
+
+        :param min_depth: 1 pour tous les descendants ('.//tag'), 2 pour exclure les enfants directs ('*//tag')
+        """
+        if element is None:
+            element = self.root
+        elif isinstance(element, etree._ElementTree):
+            element = element.getroot()
+        if element not in self.start:
+            return list(element.iterfind(('.//' if min_depth == 1 else '*//') + tag))
+        starts = self.starts_by_tag.get(tag)
+        if starts is None:
+            return list()
+        lo = bisect_right(starts, self.start[element])
+        hi = bisect_right(starts, self.end[element])
+        found = self.by_tag[tag][lo:hi]
+        if min_depth > 1:
+            found = [el for el in found if el.getparent() is not element]
+        return found
+
+    def iterfind(self, element, path):
+        """équivalent de element.iterfind(path) renvoyant une liste."""
+        parsed = self._parse_path(path)
+        root = element.getroot() if isinstance(element, etree._ElementTree) else element
+        if parsed is None or root not in self.start:
+            return list(element.iterfind(path))
+        tag, min_depth = parsed
+        return self.iter_tag(tag, root, min_depth)
+
+    def find(self, element, path):
+        """équivalent de element.find(path)."""
+        parsed = self._parse_path(path)
+        root = element.getroot() if isinstance(element, etree._ElementTree) else element
+        if parsed is None or root not in self.start:
+            return element.find(path)
+        tag, min_depth = parsed
+        starts = self.starts_by_tag.get(tag)
+        if starts is None:
+            return None
+        i = bisect_right(starts, self.start[root])
+        end = self.end[root]
+        elements = self.by_tag[tag]
+        while i < len(starts) and starts[i] <= end:
+            el = elements[i]
+            if min_depth == 1 or el.getparent() is not root:
+                return el
+            i += 1
+        return None
+
+    def parent(self, element):
+        return element.getparent()
+
+    def ancestor(self, element, tags):
+        """
+        plus proche ancêtre de element dont le tag appartient à tags (ex : le logement ou le composant englobant).
+        """
+        if isinstance(tags, str):
+            tags = (tags,)
+        key = (element, tuple(tags))
+        try:
+            return self._ancestor_cache[key]
+        except KeyError:
+            pass
+        ancestor = element.getparent()
+        while ancestor is not None and ancestor.tag not in tags:
+            ancestor = ancestor.getparent()
+        self._ancestor_cache[key] = ancestor
+        return ancestor
+
+    def position(self, element):
+        """numéro de l'élément dans l'ordre du document (None si absent de l'index)."""
+        return self.start.get(element)
+
+
+class LxmlLookup:
+    """
+    même interface que DocumentIndex sans index : toutes les recherches sont déléguées à lxml.
+    utilisé lorsqu'un contrôle est appelé directement, hors run_controle_coherence (document éventuellement modifié
+    entre deux appels, un index serait coûteux à reconstruire à chaque appel).
+    """
+
+    def __contains__(self, element):
+        return False
+
+    def iter_tag(self, tag, element, min_depth=1):
+        return list(element.iterfind(('.//' if min_depth == 1 else '*//') + tag))
+
+    def iterfind(self, element, path):
+        return list(element.iterfind(path))
+
+    def find(self, element, path):
+        return element.find(path)
+
+    def parent(self, element):
+        return element.getparent()
+
+    def ancestor(self, element, tags):
+        if isinstance(tags, str):
+            tags = (tags,)
+        ancestor = element.getparent()
+        while ancestor is not None and ancestor.tag not in tags:
+            ancestor = ancestor.getparent()
+        return ancestor
+
+    def position(self, element):
+        return None
+
+
+lxml_lookup = LxmlLookup()
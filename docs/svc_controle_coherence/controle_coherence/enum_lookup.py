@@ -0,0 +1,48 @@
+import pandas as pd
+
+
+def is_null(value):
+    """équivalent de pd.isnull pour une valeur scalaire lue dans une table compilée."""
+    return value is None or value is pd.NaT or value is pd.NA or (isinstance(value, float) and value != value)
+
+
+class EnumLookupTable:
+    """
+    table enum compilée une fois au chargement du moteur en structures python.
+
+    remplace dans les contrôles les accès pandas (table.loc[id].colonne, table[colonne].dropna().to_dict(), filtres)
+    qui étaient refaits à chaque requête. Les valeurs sont identiques à celles renvoyées par pandas
+    (ligne : table.loc[id].to_dict(), colonne : table[colonne].to_dict()).
+    """
+    __slots__ = ('name', 'rows', 'columns', 'columns_dropna')
+
+    def __init__(self, name, table):
+        self.name = name
+        self.rows = {enum_id: row.to_dict() for enum_id, row in table.iterrows()}
+        self.columns = {column: table[column].to_dict() for column in table.columns}
+        self.columns_dropna = {column: table[column].dropna().to_dict() for column in table.columns}
+
+    def row(self, enum_id):
+        """ligne de la table : dict colonne -> valeur (KeyError si l'id est absent)."""
+        return self.rows[enum_id]
+
+    def value(self, enum_id, column):
+        return self.rows[enum_id][column]
+
+    def column(self, column, dropna=True):
+        """dict id -> valeur de la colonne, sans les valeurs nulles par défaut."""
+        if dropna:
+            return self.columns_dropna[column]
+        return self.columns[column]
+
+    def ids_where(self, column, value):
+        """ids des lignes dont la colonne vaut value, dans l'ordre de la table."""
+        return tuple(enum_id for enum_id, column_value in self.columns[column].items() if column_value == value)
+
+
+def compile_enum_tables(tables):
+    """
+    :param tables: dict nom de table -> DataFrame
+    :return: dict nom de table -> EnumLookupTable
+    """
+    return {name: EnumLookupTable(name, table) for name, table in tables.items()}
@@ -0,0 +1,56 @@
+from collections.abc import KeysView
+
+# types de collections d'ids servis par index, les autres valeurs gardent le filtrage historique
+ID_COLLECTION_TYPES = (list, tuple, set, frozenset, KeysView)
+
+
+class EnumRegistry:
+    """
+    libellés des enum (enum_dict : nom de l'enum -> dict id -> libellé) indexés au chargement du moteur.
+
+    - display : équivalent de {k: v for k, v in enum_dict[enum_name].items() if k in enum_values} en accès direct
+    par id, les ids trouvés sont renvoyés dans l'ordre de la table enum
+    - traduction : libellés en minuscule sans espaces superflus utilisés pour la traduction des xml
+    - id_from_label : libellé -> id (dernier id en cas de libellé dupliqué)
+    """
+
+    def __init__(self, enum_dict):
+        self.labels = enum_dict
+        self.items = dict()  # nom de l'enum -> liste ordonnée des (id, libellé)
+        self.rank = dict()  # nom de l'enum -> id -> position dans la table enum
+        self.labels_traduction = dict()
+        self.ids_by_label = dict()
+        for enum_name, labels in enum_dict.items():
+            self.items[enum_name] = list(labels.items())
+            self.rank[enum_name] = {enum_id: i for i, enum_id in enumerate(labels)}
+            self.labels_traduction[enum_name] = {enum_id: str(label).lower().strip() for enum_id, label in labels.items()}
+            self.ids_by_label[enum_name] = {label: enum_id for enum_id, label in labels.items()}
+
+    def label(self, enum_name, enum_id):
+        """libellé de l'id (KeyError si l'id n'existe pas)."""
+        return self.labels[enum_name][enum_id]
+
+    def label_traduction(self, enum_name, enum_id):
+        """libellé de l'id en minuscule utilisé pour la traduction des xml (KeyError si l'id n'existe pas)."""
+        return self.labels_traduction[enum_name][enum_id]
+
+    def id_from_label(self, enum_name, label):
+        """id du libellé (KeyError si le libellé n'existe pas)."""
+        return self.ids_by_label[enum_name][label]
+
+    def display(self, enum_name, enum_values):
+        """
+        :param enum_values: id ou collection d'ids
+        :return: dict id -> libellé des ids existants, dans l'ordre de la table enum
+        """
+        if isinstance(enum_values, int):
+            enum_values = [enum_values]
+        if not isinstance(enum_values, ID_COLLECTION_TYPES):
+            return {k: v for k, v in self.labels[enum_name].items() if k in enum_values}
+        rank = self.rank[enum_name]
+        try:
+            positions = {rank[enum_id] for enum_id in enum_values if enum_id in rank}
+        except TypeError:  # id non hashable
+            return {k: v for k, v in self.labels[enum_name].items() if k in enum_values}
+        items = self.items[enum_name]
+        return dict(items[i] for i in sorted(positions))
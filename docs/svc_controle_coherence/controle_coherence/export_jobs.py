@@ -0,0 +1,224 @@
+import logging
+import os
+import threading
+import time
+import traceback as tb
+import uuid
+from collections import OrderedDict, deque
+from pathlib import Path
+
+from controle_coherence.validation import load_xml_data
+from controle_coherence.utils_convert_excel import write_xml_excel
+
+logger = logging.getLogger('waitress')
+
+
+def get_export_workers():
+    """
+    nombre de processus construisant les exports excel asynchrones : variable d'environnement OBS_DPE_EXPORT_WORKERS
+    (0 par défaut : exports asynchrones désactivés, aucun processus démarré).
+    """
+    return int(os.getenv('OBS_DPE_EXPORT_WORKERS', 0))
+
+
+def get_export_queue_size():
+    """
+    nombre d'exports asynchrones en attente d'un processus : variable d'environnement OBS_DPE_EXPORT_QUEUE_SIZE (par
+    défaut deux fois le nombre de processus).
+    """
+    return int(os.getenv('OBS_DPE_EXPORT_QUEUE_SIZE', 2 * get_export_workers()))
+
+
+def get_export_store_max_bytes():
+    """taille totale maximale des exports conservés : variable d'environnement OBS_DPE_EXPORT_STORE_BYTES."""
+    return int(os.getenv('OBS_DPE_EXPORT_STORE_BYTES', 512 * 1024 ** 2))
+
+
+def build_excel_export(data, file_path):
+    """
+    exécuté dans un worker : écrit la traduction excel du xml dans file_path.
+
+    :return: dict {'debut', 'fin'} (timestamps) et 'erreur' si l'export a échoué
+    """
+    started_at = time.time()
+    part_path = f'{file_path}.part'
+    try:
+        xml, error = load_xml_data(data, recover_parse=True)
+        if error is not None:
+            return {'debut': started_at, 'fin': time.time(), 'erreur': error}
+        write_xml_excel(xml, part_path)
+        os.replace(part_path, file_path)
+    except Exception:
+        if os.path.isfile(part_path):
+            os.unlink(part_path)
+        msg = f"""ERREUR INTERNE DU MOTEUR DE CONTROLE DE COHERENCE
+    {tb.format_exc()}
+            """
+        return {'debut': started_at, 'fin': time.time(), 'erreur': msg}
+    return {'debut': started_at, 'fin': time.time()}
+
+
+class ExportJob:
+
+    def __init__(self, job_id, numero_xml, file_path):
+        self.job_id = job_id
+        self.numero_xml = numero_xml
+        self.file_path = file_path
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.size = 0
+        self.error = None
+        self.future = None
+
+    @property
+    def status(self):
+        if self.finished_at is None:
+            return 'en_cours' if self.future is not None and self.future.running() else 'en_attente'
+        return 'erreur' if self.error is not None else 'termine'
+
+    def as_dict(self):
+        resp = {'job_id': self.job_id,
+                'numero_xml': self.numero_xml,
+                'status': self.status}
+        if self.finished_at is not None:
+            resp['duree_attente'] = self.started_at - self.submitted_at
+            resp['duree_construction'] = self.finished_at - self.started_at
+        if self.error is not None:
+            resp['erreur'] = self.error
+        return resp
+
+
+class ExportJobStore:
+    """
+    exports excel construits en arrière-plan sur un pool de workers et conservés dans un dossier local.
+
+    un export terminé est conservé ttl secondes, les plus anciens sont supprimés lorsque la taille totale des exports
+    dépasse max_bytes. Les exports en attente ou en cours ne sont jamais supprimés, leur nombre est borné par la file
+    du pool (submit lève QueueFull au-delà).
+    """
+
+    def __init__(self, folder, pool, max_bytes=512 * 1024 ** 2, ttl=3600, nb_durations=100):
+        self.folder = Path(folder)
+        self.pool = pool
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.jobs = OrderedDict()  # job_id -> ExportJob, dans l'ordre de soumission
+        self.finished = OrderedDict()  # job_id -> ExportJob terminés, dans l'ordre de fin
+        self.nbytes = 0
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.evictions = 0
+        self.durations = deque(maxlen=nb_durations)  # (attente, construction) des derniers exports terminés
+        # exports laissés par une exécution précédente du service
+        self.folder.mkdir(exist_ok=True, parents=True)
+        for file in self.folder.iterdir():
+            if file.is_file():
+                file.unlink()
+
+    def submit(self, data, numero_xml):
+        """
+        :param data: contenu du xml
+        :return: ExportJob
+        """
+        self.evict_expired()
+        job_id = uuid.uuid4().hex
+        job = ExportJob(job_id, numero_xml, self.folder / f'{job_id}.xlsx')
+        future = self.pool.submit(build_excel_export, data, str(job.file_path))
+        job.future = future
+        with self.lock:
+            self.jobs[job_id] = job
+            self.submitted += 1
+        future.add_done_callback(lambda f: self._on_done(job, f))
+        return job
+
+    def _on_done(self, job, future):
+        try:
+            result = future.result()
+        except Exception as e:  # worker tué...
+            result = {'debut': job.submitted_at, 'fin': time.time(), 'erreur': f'export interrompu : {e!r}'}
+        job.error = result.get('erreur')
+        if job.error is None:
+            try:
+                job.size = job.file_path.stat().st_size
+            except OSError as e:  # fichier supprimé...
+                job.error = f'export introuvable : {e!r}'
+        with self.lock:
+            job.started_at = result['debut']
+            job.finished_at = max(result['fin'], job.started_at)
+            self.durations.append((job.started_at - job.submitted_at, job.finished_at - job.started_at))
+            self.finished[job.job_id] = job
+            self.nbytes += job.size
+            self._evict(time.time())
+        logger.info(f'export excel {job.job_id} ({job.numero_xml}) {job.status} : '
+                    f'attente {job.started_at - job.submitted_at:.3f} s, '
+                    f'construction {job.finished_at - job.started_at:.3f} s')
+
+    def _remove(self, job_id):
+        job = self.jobs.pop(job_id)
+        del self.finished[job_id]
+        self.nbytes -= job.size
+        self.evictions += 1
+        if job.file_path.is_file():
+            job.file_path.unlink()
+
+    def _evict(self, now):
+        for job_id, job in list(self.finished.items()):
+            if job.finished_at + self.ttl <= now:
+                self._remove(job_id)
+        while self.nbytes > self.max_bytes:
+            self._remove(next(iter(self.finished)))
+
+    def evict_expired(self):
+        """:return: nombre d'exports supprimés"""
+        with self.lock:
+            evictions = self.evictions
+            self._evict(time.time())
+            return self.evictions - evictions
+
+    def get(self, job_id):
+        """:return: ExportJob ou None si inconnu ou expiré"""
+        self.evict_expired()
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def open_export(self, job_id):
+        """
+        le fichier est ouvert sous le verrou : une suppression ultérieure (durée de conservation, taille) ne l'empêche
+        pas d'être envoyé.
+
+        :return: (ExportJob ou None si inconnu ou expiré, fichier binaire ouvert si l'export est terminé sinon None)
+        """
+        self.evict_expired()
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status != 'termine':
+                return job, None
+            try:
+                return job, open(job.file_path, 'rb')
+            except FileNotFoundError:
+                return None, None
+
+    def stats(self):
+        self.evict_expired()
+        with self.lock:
+            statuses = [job.status for job in self.jobs.values()]
+            durations = list(self.durations)
+            stats = {'en_attente': statuses.count('en_attente'),
+                     'en_cours': statuses.count('en_cours'),
+                     'termines': statuses.count('termine'),
+                     'erreurs': statuses.count('erreur'),
+                     'soumis': self.submitted,
+                     'evictions': self.evictions,
+                     'bytes': self.nbytes,
+                     'max_bytes': self.max_bytes,
+                     'ttl': self.ttl}
+        if durations:
+            for i, name in enumerate(['duree_attente', 'duree_construction']):
+                values = [el[i] for el in durations]
+                stats[f'{name}_moyenne'] = sum(values) / len(values)
+                stats[f'{name}_max'] = max(values)
+        return stats
+
+    def shutdown(self):
+        self.pool.shutdown()
@@ -0,0 +1,154 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from lxml import etree
+
+from controle_coherence.document_index import DocumentIndex
+
+logger = logging.getLogger(__name__)
+
+# nombre minimal de logements d'un audit pour que les contrôles par logement soient répartis sur le pool
+DEFAULT_MIN_LOGEMENTS = 20
+
+_pool = None
+_pool_processes = None
+_pool_lock = threading.Lock()
+_pool_enabled = True
+
+
+def get_audit_processes():
+    """
+    nombre de processus du pool des contrôles par logement de l'audit : variable d'environnement OBS_DPE_AUDIT_PROCESSES.
+    0 ou 1 (défaut) : les contrôles sont exécutés séquentiellement dans le process courant. Toujours 0 dans un
+    process où le pool a été désactivé (disable_pool).
+    """
+    if not _pool_enabled:
+        return 0
+    return int(os.getenv('OBS_DPE_AUDIT_PROCESSES', 0))
+
+
+def disable_pool():
+    """
+    contrôles par logement exécutés séquentiellement dans le process courant quel que soit OBS_DPE_AUDIT_PROCESSES :
+    appelé dans les workers du mode multi-process (NB_WORKERS), déjà parallèles entre requêtes, pour qu'ils ne
+    démarrent pas chacun leur propre pool.
+    """
+    global _pool, _pool_enabled
+    with _pool_lock:
+        # pool éventuellement hérité du process parent (fork) : il appartient au parent, il n'est pas arrêté ici
+        _pool = None
+        _pool_enabled = False
+
+
+def get_min_logements():
+    """nombre minimal de logements pour utiliser le pool : variable d'environnement OBS_DPE_AUDIT_PROCESSES_MIN_LOGEMENTS."""
+    return int(os.getenv('OBS_DPE_AUDIT_PROCESSES_MIN_LOGEMENTS', DEFAULT_MIN_LOGEMENTS))
+
+
+def _init_worker():
+    # chargement du moteur audit une seule fois par process du pool
+    from controle_coherence.controle_coherence import EngineAudit
+    EngineAudit()
+
+
+def get_pool(processes):
+    """pool de processus partagé par le process (recréé si le nombre de processus change)."""
+    global _pool, _pool_processes
+    with _pool_lock:
+        if _pool is None or _pool_processes != processes:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # spawn : les process du pool ne partagent pas l'état (threads, verrous) du serveur
+            _pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_worker)
+            _pool_processes = processes
+        return _pool
+
+
+def shutdown_pool():
+    """arrêt du pool de processus (recréé au prochain audit exécuté en parallèle)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+def _reset_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def _run_chunk(xml_bytes, controles_name, positions, params):
+    """
+    exécution dans un process du pool des contrôles controles_name pour les logements de rang positions.
+
+    :return: liste de (rang du logement, messages générés, exception levée ou None). Les messages sont les arguments
+    des appels à report.generate_msg, les objets concernés étant remplacés par leur chemin dans le document.
+    """
+    from controle_coherence.controle_coherence import EngineAudit, ReportAudit
+    engine = EngineAudit()
+    parser = etree.XMLParser(resolve_entities=False, no_network=True)
+    audit = etree.ElementTree(etree.fromstring(xml_bytes, parser))
+    report = ReportAudit()
+    report.document_index = DocumentIndex(audit)
+    calls = list()
+    generate_msg = report.generate_msg
+
+    def recording_generate_msg(msg, msg_type, msg_theme, related_objects, msg_importance, is_audit=False):
+        related_objects = [el for el in related_objects if el is not None]
+        generate_msg(msg, msg_type, msg_theme, related_objects, msg_importance, is_audit)
+        calls.append((msg, msg_type, msg_theme, [audit.getpath(el) for el in related_objects], msg_importance,
+                      is_audit))
+
+    report.generate_msg = recording_generate_msg
+    controles = getattr(engine, controles_name)
+    logements = list(audit.iterfind('*//logement'))
+    results = list()
+    for position in positions:
+        calls = list()
+        try:
+            controles(logements[position], report, **params)
+        except Exception as e:
+            results.append((position, calls, e))
+            break
+        results.append((position, calls, None))
+    return results
+
+
+def run_logements_in_pool(audit, report, controles_name, nb_logements, processes, params):
+    """
+    répartit les contrôles par logement de l'audit sur le pool de processus puis rejoue les messages dans le rapport
+    dans l'ordre des logements, comme lors d'une exécution séquentielle.
+
+    :return: False si le pool est inutilisable (les contrôles doivent alors être exécutés séquentiellement)
+    """
+    xml_bytes = etree.tostring(audit)
+    # un paquet par process : chaque paquet relit le document complet
+    nb_chunks = min(nb_logements, processes)
+    chunks = [list(range(i, nb_logements, nb_chunks)) for i in range(nb_chunks)]
+    pool = get_pool(processes)
+    try:
+        futures = [pool.submit(_run_chunk, xml_bytes, controles_name, chunk, params) for chunk in chunks]
+        results = [result for future in futures for result in future.result()]
+    except BrokenProcessPool as e:
+        logger.warning(f'pool des contrôles par logement inutilisable, exécution séquentielle : {e}')
+        _reset_pool(pool)
+        return False
+
+    tree = audit if isinstance(audit, etree._ElementTree) else audit.getroottree()
+    for position, calls, error in sorted(results, key=lambda result: result[0]):
+        for msg, msg_type, msg_theme, paths, msg_importance, is_audit in calls:
+            related_objects = [tree.xpath(path)[0] for path in paths]
+            report.generate_msg(msg, msg_type=msg_type, msg_theme=msg_theme, related_objects=related_objects,
+                                msg_importance=msg_importance, is_audit=is_audit)
+        if error is not None:
+            raise error
+    return True
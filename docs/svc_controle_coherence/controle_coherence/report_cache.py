@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from controle_coherence import __version_dpe__, __version_audit__
+from controle_coherence.assets_dpe import get_datetime_now
+
+
+def report_cache_key(data, route, debug=False, datetime_now=None):
+    """
+    clé du rapport d'un xml : empreinte du contenu reçu, route, mode debug, jour de la date de contrôle effective et
+    versions des moteurs de contrôle de cohérence.
+    """
+    day = get_datetime_now(datetime_now).date().isoformat()
+    return hashlib.sha256(data).hexdigest(), route, bool(debug), day, __version_dpe__, __version_audit__
+
+
+class ReportCache:
+    """
+    cache LRU des résultats de contrôle de cohérence, borné en nombre d'entrées et en taille (taille json du résultat),
+    chaque entrée expire après ttl secondes.
+
+    les calculs d'une même clé lancés simultanément sont dédupliqués : le premier appel calcule, les suivants attendent
+    son résultat. Les résultats mis en cache sont partagés entre les requêtes et ne doivent pas être modifiés.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=128 * 1024 ** 2, ttl=3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()  # clé -> (date d'expiration, taille, résultat)
+        self.in_flight = dict()  # clé -> Future du calcul en cours
+        self.nbytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0  # appels ayant attendu le calcul en cours d'un autre appel
+        self.evictions = 0
+
+    def _get(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, size, value = entry
+        if expires_at <= now:
+            self._remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key):
+        expires_at, size, value = self.entries.pop(key)
+        self.nbytes -= size
+
+    def _put(self, key, value, size, now):
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (now + self.ttl, size, value)
+        self.nbytes += size
+        while len(self.entries) > self.max_entries or self.nbytes > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def get_or_compute(self, key, compute, cacheable=lambda value: True):
+        """
+        :param compute: fonction sans argument calculant le résultat
+        :param cacheable: fonction indiquant si le résultat peut être mis en cache (ex : pas les erreurs internes)
+        :return: résultat en cache ou calculé
+        """
+        with self.lock:
+            entry = self._get(key, time.monotonic())
+            if entry is not None:
+                self.hits += 1
+                return entry[2]
+            future = self.in_flight.get(key)
+            is_owner = future is None
+            if is_owner:
+                self.misses += 1
+                future = Future()
+                self.in_flight[key] = future
+            else:
+                self.shared += 1
+        if not is_owner:
+            return future.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self.lock:
+                del self.in_flight[key]
+            future.set_exception(e)
+            raise
+        if cacheable(value):
+            size = len(json.dumps(value, default=str))
+            with self.lock:
+                if size <= self.max_bytes:
+                    self._put(key, value, size, time.monotonic())
+        with self.lock:
+            del self.in_flight[key]
+        future.set_result(value)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'shared': self.shared,
+                    'evictions': self.evictions,
+                    'entries': len(self.entries),
+                    'bytes': self.nbytes,
+                    'max_entries': self.max_entries,
+                    'max_bytes': self.max_bytes,
+                    'ttl': self.ttl}
+
+
+def get_report_cache():
+    """
+    cache des rapports du webservice configuré par les variables d'environnement OBS_DPE_REPORT_CACHE_ENTRIES (1024
+    par défaut, 0 désactive le cache), OBS_DPE_REPORT_CACHE_BYTES (128 Mo par défaut) et OBS_DPE_REPORT_CACHE_TTL
+    (secondes, 3600 par défaut).
+
+    :return: ReportCache ou None si le cache est désactivé
+    """
+    max_entries = int(os.getenv('OBS_DPE_REPORT_CACHE_ENTRIES', 1024))
+    if max_entries <= 0:
+        return None
+    return ReportCache(max_entries=max_entries,
+                       max_bytes=int(os.getenv('OBS_DPE_REPORT_CACHE_BYTES', 128 * 1024 ** 2)),
+                       ttl=float(os.getenv('OBS_DPE_REPORT_CACHE_TTL', 3600)))
@@ -0,0 +1,64 @@
+from controle_coherence.document_index import DocumentIndex
+
+# familles de règles pilotées par les tables enum / tv
+RULE_VARIABLES_INTERDITES = 'variables_interdites'
+RULE_VARIABLES_REQUISES = 'variables_requises'
+RULE_HORS_METHODE = 'hors_methode'
+RULE_TABLE_VALEUR = 'table_valeur'
+
+
+class RuleDispatcher:
+    """
+    répartition des éléments enum_* / tv_* d'un document vers les familles de règles qui les concernent.
+
+    construit au chargement du moteur à partir des dictionnaires de règles (tag -> règles). Pour un document, chaque
+    élément n'est visité qu'une fois (au parcours de l'index du document) et rangé dans les familles de règles de son
+    tag. Les contrôles ne parcourent ensuite que les tags réellement présents dans le document, dans l'ordre des tables
+    de règles, ce qui conserve l'ordre des messages du rapport.
+    """
+
+    def __init__(self, rules):
+        """
+        :param rules: dict famille de règles -> dict tag -> règles (l'ordre des tags est conservé)
+        """
+        self.rank = dict()  # famille -> tag -> rang du tag dans la table de règles
+        self.families_by_tag = dict()  # tag -> familles de règles concernées
+        for family, rules_dict in rules.items():
+            self.rank[family] = {tag: i for i, tag in enumerate(rules_dict)}
+            for tag in rules_dict:
+                self.families_by_tag.setdefault(tag, list()).append(family)
+
+    def dispatch(self, index, element):
+        """
+        :return: dict famille -> liste ordonnée des tags à contrôler présents dans le document
+        """
+        if isinstance(index, DocumentIndex):
+            # l'index du document est partagé par tous les contrôles : la répartition n'est faite qu'une fois
+            dispatched = index.cache.get(self)
+            if dispatched is None:
+                dispatched = self._dispatch_tags(index.by_tag)
+                index.cache[self] = dispatched
+            return dispatched
+        root = element.getroot() if hasattr(element, 'getroot') else element
+        return self._dispatch_tags({el.tag for el in root.iter() if isinstance(el.tag, str)})
+
+    def _dispatch_tags(self, tags):
+        dispatched = {family: list() for family in self.rank}
+        for tag in tags:
+            for family in self.families_by_tag.get(tag, ()):
+                dispatched[family].append(tag)
+        for family, family_tags in dispatched.items():
+            family_tags.sort(key=self.rank[family].__getitem__)
+        return dispatched
+
+    def iter_elements(self, index, element, family, min_depth=1):
+        """
+        parcourt les éléments du document sous element soumis à la famille de règles, groupés par tag.
+
+        :param min_depth: 1 pour './/tag', 2 pour '*//tag'
+        :return: générateur de (tag, liste des éléments)
+        """
+        for tag in self.dispatch(index, element)[family]:
+            elements = index.iter_tag(tag, element, min_depth)
+            if len(elements) > 0:
+                yield tag, elements
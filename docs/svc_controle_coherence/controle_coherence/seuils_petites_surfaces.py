@@ -0,0 +1,66 @@
+import numpy as np
+
+# en dessous de cette surface (m²) les seuils ne sont plus interpolés
+SURFACE_MIN_INTERPOLATION = 8
+
+
+class SeuilsPetitesSurfaces:
+    """
+    seuils d'étiquette des petites surfaces (< 40m²) d'une table de seuils_petites_surfaces.json, compilés au chargement
+    du moteur en un tableau numpy (surface, classe).
+
+    les seuils d'une surface sont interpolés linéairement entre les deux surfaces entières qui l'encadrent, les valeurs
+    sont identiques à celles de utils.calc_seuil_interpolate.
+    """
+    __slots__ = ('classes', 'surfaces', 'surface_min', 'values')
+
+    def __init__(self, table):
+        """
+        :param table: dict classe -> dict surface (str) -> seuil max de la classe (format de seuils_petites_surfaces.json)
+        """
+        self.classes = tuple(table) + ('G',)
+        surfaces = sorted({int(surface) for column in table.values() for surface in column})
+        if surfaces != list(range(surfaces[0], surfaces[-1] + 1)):
+            raise ValueError(f'les surfaces des seuils doivent être des entiers consécutifs : {surfaces}')
+        self.surfaces = np.array(surfaces)
+        self.surface_min = surfaces[0]
+        values = np.empty((len(surfaces), len(table)), dtype=np.float64)
+        for j, column in enumerate(table.values()):
+            for surface, value in column.items():
+                values[int(surface) - self.surface_min, j] = value
+        self.values = values
+
+    def seuils_max_batch(self, surfaces_reference):
+        """
+        seuils max des classes (G compris, infini) pour un tableau de surfaces.
+
+        :param surfaces_reference: tableau de surfaces de référence (m²)
+        :return: tableau (nombre de surfaces, nombre de classes)
+        """
+        surfaces_reference = np.maximum(np.asarray(surfaces_reference, dtype=np.float64), SURFACE_MIN_INTERPOLATION)
+        ceil_surfaces = np.ceil(surfaces_reference).astype(int)
+        ceil_rows = ceil_surfaces - self.surface_min
+        ceil_seuils = self.values[ceil_rows]
+        floor_seuils = self.values[np.maximum(ceil_rows - 1, 0)]
+        diff_ceil = (ceil_surfaces - surfaces_reference)[:, None]
+        # si en dessous de 8m² pas d'interpolation
+        seuils = np.where(surfaces_reference[:, None] <= SURFACE_MIN_INTERPOLATION, ceil_seuils,
+                          floor_seuils * diff_ceil + ceil_seuils * (1 - diff_ceil))
+        return np.concatenate([seuils, np.full((len(seuils), 1), np.inf)], axis=1)
+
+    def seuils(self, surface_reference):
+        """
+        :return: dict classe -> [seuil min, seuil max] dans l'ordre des classes (même format que seuils_energie)
+        """
+        seuils_max = self.seuils_max_batch([surface_reference])[0].tolist()
+        seuils_min = [-np.inf] + seuils_max[:-1]
+        return {classe: [seuil_min, seuil_max] for classe, seuil_min, seuil_max in zip(self.classes, seuils_min, seuils_max)}
+
+
+def compile_seuils_petites_surfaces(seuils_petites_surfaces):
+    """
+    :param seuils_petites_surfaces: contenu de seuils_petites_surfaces.json (altitude -> nom des seuils -> table)
+    :return: dict altitude -> nom des seuils -> SeuilsPetitesSurfaces
+    """
+    return {altitude: {name: SeuilsPetitesSurfaces(table) for name, table in tables.items()}
+            for altitude, tables in seuils_petites_surfaces.items()}
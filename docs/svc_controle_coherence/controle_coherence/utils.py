@@ -103,6 +103,30 @@ def element_to_value_dict(el, convert=True):
     return a_dict
 
 
+def get_names_rank(ordered_names):
+    """rang de la première occurrence de chaque nom dans ordered_names."""
+    names_rank = dict()
+    for rank, name in enumerate(ordered_names):
+        names_rank.setdefault(name, rank)
+    return names_rank
+
+
+def excel_export_metadata(ordered_names, lexique):
+    """
+    métadonnées d'un xsd utilisées par l'export excel, indépendantes du xml exporté.
+
+    :return: dict {'names_rank': rang des noms du xsd, 'names_rank_traduit': rang des noms après traduction des enum
+    (enum_x_id -> x), 'lexique_rows': lignes [nom traduit, documentation] de la feuille lexique triées par nom}
+    """
+    def nom_traduit(name):
+        return name.replace('enum_', '').replace('_id', '') if 'enum_' in name else name
+
+    lexique_traduit = dict([(nom_traduit(k), v) for k, v in lexique.items()])
+    return {'names_rank': get_names_rank(ordered_names),
+            'names_rank_traduit': get_names_rank([nom_traduit(el) for el in ordered_names]),
+            'lexique_rows': [[k, v] for k, v in sorted(lexique_traduit.items())]}
+
+
 def remove_null_elements(xml):
     namespaces = {'xsi': "http://www.w3.org/2001/XMLSchema-instance"}
     for null_el in xml.xpath('//*[@xsi:nil="true"]', namespaces=namespaces):
@@ -171,9 +195,9 @@ def traduction_xml_inplace(xml, engine):
                 except Exception:
                     is_int = 0
                 if is_int == 1:
-                    el.text = str(engine.display_enum_traduction(el.tag, int(el.text))[int(el.text)]).lower().strip()
+                    el.text = engine.enum_registry.label_traduction(el.tag, int(el.text))
         if el.tag.startswith('qualite_isol_'):
-            el.text = engine.enum_dict['enum_qualite_composant_id'][int(el.text)].lower().strip()
+            el.text = engine.enum_registry.label_traduction('enum_qualite_composant_id', int(el.text))
 
     return xml
 
@@ -192,14 +216,14 @@ def traduction_xml_new_element(xml, engine):
                 except Exception:
                     is_int = 0
                 if is_int == 1:
-                    txt = str(engine.display_enum_traduction(el.tag, int(el.text))[int(el.text)]).lower().strip()
+                    txt = engine.enum_registry.label_traduction(el.tag, int(el.text))
                 name_wo_id = '_'.join(el.tag.split('_')[1:-1])
                 new_el = Element(name_wo_id)
                 new_el.text = txt
                 el.addnext(new_el)
                 el.getparent().remove(el)
         if el.tag.startswith('qualite_isol_'):
-            el.text = engine.enum_dict['enum_qualite_composant_id'][int(el.text)].lower().strip()
+            el.text = engine.enum_registry.label_traduction('enum_qualite_composant_id', int(el.text))
 
     return xml
 
@@ -1,95 +1,179 @@
-import uuid
+import os
+import tempfile
 
-import pandas as pd
+import xlsxwriter
 from lxml import etree
 import lxml
-from pathlib import Path
-from datetime import datetime
 import copy
-import logging
 
 from controle_coherence.utils import element_to_value_dict, traduction_xml_new_element
 from controle_coherence.controle_coherence import EngineDPE,EngineAudit
 
+# composants d'un logement exportés : éléments uniques, collections, installations et leurs sous-collections
+LOGEMENT_SIMPLE_ELEMENTS = ['caracteristique_generale', 'meteo', 'inertie']
+LOGEMENT_COLLECTIONS = ['mur', 'plancher_bas', 'plancher_haut', 'baie_vitree', 'porte', 'pont_thermique', 'ventilation', 'climatisation', 'production_elec_enr', 'panneaux_pv']
+LOGEMENT_INSTALLATIONS = {'installation_ecs': ['generateur_ecs'],
+                          'installation_chauffage': ['generateur_chauffage', 'emetteur_chauffage']}
+SORTIE_SIMPLE_ELEMENTS = ['deperdition', 'apport_et_besoin', 'ef_conso', 'ep_conso', 'emission_ges', 'cout', 'production_electricite', 'confort_ete', 'qualite_isolation']
+SORTIE_COLLECTIONS = ['sortie_par_energie']
 
-def dump_dataframe_to_excel(df, currow, max_col, current_config, transform=False):
+
+class ExcelTable:
+    """
+    tableau écrit dans une feuille excel : lignes nommées (index) x colonnes nommées. Chaque colonne est un dict
+    nom de ligne -> texte de la cellule, une ligne absente du dict donne une cellule vide.
+    """
+
+    def __init__(self, index=(), columns=(), data=()):
+        self.index = list(index)
+        self.columns = list(columns)
+        self.data = list(data)
+
+    @property
+    def empty(self):
+        return len(self.index) == 0 or len(self.columns) == 0
+
+    @property
+    def T(self):
+        data = [{col: values[name] for col, values in zip(self.columns, self.data) if name in values}
+                for name in self.index]
+        return ExcelTable(self.columns, self.index, data)
+
+    def reindex(self, index):
+        return ExcelTable(index, self.columns, self.data)
+
+
+def cell_text(value):
+    # même conversion que pd.Series(..., dtype='str') : valeurs nulles laissées vides
+    if value is None or value != value:
+        return None
+    return str(value)
+
+
+def get_worksheet(current_config):
     sheet_name = current_config['sheet_name']
-    writer = current_config['writer']
-    header_format = current_config['header_format']
+    sheets = current_config['sheets']
+    if sheet_name not in sheets:
+        worksheet = current_config['workbook'].add_worksheet(sheet_name)
+        worksheet.set_column(0, 0, 46, current_config['index_format'])
+        worksheet.formatted_cols = 0
+        sheets[sheet_name] = worksheet
+    return sheets[sheet_name]
 
-    if transform is False:
-        df.to_excel(excel_writer=writer, startcol=0, startrow=currow, sheet_name=sheet_name)
-    else:
-        df = df.T
-        df.to_excel(excel_writer=writer, startcol=0, startrow=currow, sheet_name=sheet_name)
-
-    if header_format:
-        worksheet = writer.sheets[sheet_name]
-        # Write the column headers with the defined format.
-        for col_num, value in enumerate(df.columns.values):
-            worksheet.write(currow, col_num + 1, value, header_format)
-    currow += df.shape[0] + 2
-    max_col = max(max_col, df.shape[1])
+
+def format_content_columns(worksheet, nb_cols, current_config):
+    # en mode constant_memory une ligne est écrite dès que la suivante commence : le format des colonnes doit être
+    # défini avant l'écriture des cellules pour leur être appliqué
+    if nb_cols > worksheet.formatted_cols:
+        worksheet.set_column(worksheet.formatted_cols + 1, nb_cols, 30, current_config['content_format'])
+        worksheet.formatted_cols = nb_cols
+
+
+def dump_table_to_excel(table, currow, max_col, current_config, transform=False):
+    header_format = current_config['header_format']
+    index_header_format = current_config['index_header_format']
+    worksheet = get_worksheet(current_config)
+
+    if transform is True:
+        table = table.T
+    format_content_columns(worksheet, len(table.columns), current_config)
+
+    # Write the column headers with the defined format.
+    for col_num, value in enumerate(table.columns):
+        worksheet.write(currow, col_num + 1, value, header_format)
+    for row_num, name in enumerate(table.index):
+        row = currow + row_num + 1
+        worksheet.write(row, 0, name, index_header_format)
+        for col_num, values in enumerate(table.data):
+            value = values.get(name)
+            if value is not None:
+                worksheet.write(row, col_num + 1, value)
+    currow += len(table.index) + 2
+    max_col = max(max_col, len(table.columns))
     return currow, max_col
 
 
-def reorder_dataframe(df, ordered_names):
-    ordered_elements = pd.unique([el for el in ordered_names if el in df.index]).tolist()
-    missing = [el for el in df.index if el not in ordered_elements]
-    df = df.reindex(missing + ordered_elements)
-    return df
+def reorder_table(table, names_rank):
+    # noms absents du xsd en premier puis noms dans l'ordre du xsd
+    missing = [el for el in table.index if el not in names_rank]
+    ordered_elements = sorted([el for el in table.index if el in names_rank], key=names_rank.__getitem__)
+    return table.reindex(missing + ordered_elements)
+
+
+def concat_tables(tables):
+    index = dict()
+    for table in tables:
+        index.update(dict.fromkeys(table.index))
+    return ExcelTable(index,
+                      [col for table in tables for col in table.columns],
+                      [values for table in tables for values in table.data])
+
+
+def find_simple_element(root, name):
+    el = root.find(f'*//{name}')
+    if el is None:
+        el = root.find(f'{name}')
+    return el
+
+
+def iter_collection(root, name):
+    return list(root.iterfind(f'*//{name}')) + list(root.iterfind(f'{name}'))
 
 
-def convert_element_to_dataframe(el, ordered_names):
+def element_values(el, convert=True):
+    """valeurs d'un composant : données d'entrée et intermédiaires s'il en a, sinon ses sous-éléments simples."""
     if el.find('donnee_entree') is not None:
-        el_dict = element_to_value_dict(el.find('donnee_entree'))
+        el_dict = element_to_value_dict(el.find('donnee_entree'), convert=convert)
         if el.find('donnee_intermediaire') is not None:
-            for k, v in element_to_value_dict(el.find('donnee_intermediaire')).items():
+            for k, v in element_to_value_dict(el.find('donnee_intermediaire'), convert=convert).items():
                 el_dict[k] = v
     else:
-        el_dict = element_to_value_dict(el)
-    df = pd.Series(el_dict, dtype='str').to_frame(el.tag)
-    df = reorder_dataframe(df, ordered_names)
-    return df
+        el_dict = element_to_value_dict(el, convert=convert)
+    return el_dict
+
+
+def convert_element_to_table(el, names_rank):
+    values = {k: cell_text(v) for k, v in element_values(el).items()}
+    table = ExcelTable(values, [el.tag], [values])
+    table = reorder_table(table, names_rank)
+    return table
 
 
 def dump_collection_to_excel(name, root, currow, max_col, current_config, dump_empty=True, transform=False, title=False):
-    all_df = list()
-    ordered_names = current_config['ordered_names']
+    all_tables = list()
+    names_rank = current_config['names_rank']
     # components
-    for el in list(root.iterfind(f'*//{name}')) + list(root.iterfind(f'{name}')):
-        df_iter = convert_element_to_dataframe(el, ordered_names)
-        if not df_iter.empty:
-            all_df.append(df_iter)
-    if len(all_df) > 0:
-
-        df = pd.concat(all_df, axis=1)
-        df = reorder_dataframe(df, ordered_names)
-        df.columns = [f'{name}_{i}' for i in range(len(df.columns))]
+    for el in iter_collection(root, name):
+        table_iter = convert_element_to_table(el, names_rank)
+        if not table_iter.empty:
+            all_tables.append(table_iter)
+    if len(all_tables) > 0:
+
+        table = concat_tables(all_tables)
+        table = reorder_table(table, names_rank)
+        table.columns = [f'{name}_{i}' for i in range(len(table.columns))]
         if title is True:
-            df_title = pd.DataFrame(columns=[name])
-            currow, max_col = dump_dataframe_to_excel(df_title, currow, max_col, current_config)
-        currow, max_col = dump_dataframe_to_excel(df, currow, max_col, current_config, transform=transform)
+            table_title = ExcelTable(columns=[name])
+            currow, max_col = dump_table_to_excel(table_title, currow, max_col, current_config)
+        currow, max_col = dump_table_to_excel(table, currow, max_col, current_config, transform=transform)
     else:
         if dump_empty:
-            df = pd.DataFrame(columns=[name])
-            currow, max_col = dump_dataframe_to_excel(df, currow, max_col, current_config)
+            table = ExcelTable(columns=[name])
+            currow, max_col = dump_table_to_excel(table, currow, max_col, current_config)
     return currow, max_col
 
 
 def simple_element_to_excel(name, root, currow, max_col, current_config, dump_empty=True):
-    el = root.find(f'*//{name}')
-    if el is None:
-        el = root.find(f'{name}')
-    ordered_names = current_config['ordered_names']
+    el = find_simple_element(root, name)
+    names_rank = current_config['names_rank']
     if el is not None:
-        df = convert_element_to_dataframe(el, ordered_names)
+        table = convert_element_to_table(el, names_rank)
 
-        currow, max_col = dump_dataframe_to_excel(df, currow, max_col, current_config)
+        currow, max_col = dump_table_to_excel(table, currow, max_col, current_config)
     else:
         if dump_empty:
-            df = pd.DataFrame(columns=[name])
-            currow, max_col = dump_dataframe_to_excel(df, currow, max_col, current_config)
+            table = ExcelTable(columns=[name])
+            currow, max_col = dump_table_to_excel(table, currow, max_col, current_config)
 
     return currow, max_col
 
@@ -98,34 +182,54 @@ def reformat_sheet(current_config, max_col):
     sheet_name = current_config['sheet_name']
     index_format = current_config['index_format']
     content_format = current_config['content_format']
-    writer = current_config['writer']
-    if sheet_name in writer.sheets:
-        worksheet = writer.sheets[sheet_name]
+    sheets = current_config['sheets']
+    if sheet_name in sheets:
+        worksheet = sheets[sheet_name]
         worksheet.set_column(0, 0, 46, index_format)
         worksheet.set_column(1, max_col + 1, 30, content_format)
 
 
-def traduction_xml_excel(xml,excel_folder):
-    excel_folder = Path(excel_folder)
-    if excel_folder.is_dir() is False:
-        excel_folder.mkdir(exist_ok=True,parents=True)
+def get_excel_spool_max_size():
+    """
+    taille (octets) au-delà de laquelle un export excel en mémoire est déporté dans un fichier temporaire anonyme :
+    variable d'environnement OBS_DPE_EXCEL_SPOOL_MAX_SIZE.
+    """
+    return int(os.getenv('OBS_DPE_EXCEL_SPOOL_MAX_SIZE', 8 * 1024 ** 2))
+
 
+def traduction_xml_excel_buffer(xml):
+    """
+    écrit la traduction excel du xml dans un tampon sans passer par un dossier partagé : en mémoire jusqu'à
+    OBS_DPE_EXCEL_SPOOL_MAX_SIZE octets, dans un fichier temporaire anonyme au-delà.
+
+    :return: tampon binaire positionné au début du fichier xlsx, à fermer par l'appelant
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=get_excel_spool_max_size())
+    try:
+        write_xml_excel(xml, buffer)
+    except Exception:
+        buffer.close()
+        raise
+    buffer.seek(0)
+    return buffer
+
+
+def write_xml_excel(xml, output):
+    """
+    :param output: chemin ou objet fichier binaire dans lequel est écrit le xlsx
+    """
     is_audit = xml.getroot().tag == 'audit'
     if is_audit:
         engine = EngineAudit()
     else:
         engine = EngineDPE()
 
-    file_name = str(uuid.uuid4()) + '.xlsx'
-    file_path = excel_folder/file_name
     xml_traduit = traduction_xml_new_element(xml, engine)
 
-    if file_path.is_file():
-        file_path.unlink()
     try:
-        writer = pd.ExcelWriter(file_path,
-                                engine='xlsxwriter')
-        workbook = writer.book
+        # lignes écrites dans l'ordre croissant de chaque feuille : chaque ligne est vidée sur disque dès que la
+        # suivante commence, la mémoire ne dépend pas de la taille de l'export
+        workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
 
         index_format = workbook.add_format({
             'bold': True,
@@ -150,34 +254,28 @@ def traduction_xml_excel(xml,excel_folder):
             'align': 'left',
             'fg_color': '#D7E4BC',
             'border': 1})
+        # format des noms de lignes (style d'en-tête de pandas.DataFrame.to_excel)
+        index_header_format = workbook.add_format({
+            'bold': True,
+            'align': 'center',
+            'valign': 'top',
+            'border': 1})
         current_config = dict()
-        current_config['writer'] = writer
+        current_config['workbook'] = workbook
+        current_config['sheets'] = dict()
+        current_config['index_header_format'] = index_header_format
         current_config['header_format'] = header_format
         current_config['content_format'] = content_format
         current_config['index_format'] = index_format
         # INIT DOC
 
-        root_xml_complet = list(engine.xsd_dict.values())[-1]
-
-        namespaces = {'xs': 'http://www.w3.org/2001/XMLSchema',
-                      'obsdpe': "https://gitlab.com/observatoire-dpe/observatoire-dpe/-/tree/master/modele_donnee"}
-
-        ordered_names = [el.attrib.get('name', el.attrib.get('ref')) for el in list(root_xml_complet.iterfind('*//xs:element', namespaces=namespaces))]
-        current_config['ordered_names'] = ordered_names
-        doc = {el.attrib.get('name', el.attrib.get('ref')): el for el in list(root_xml_complet.iterfind('*//xs:element', namespaces=namespaces))}
+        # métadonnées du dernier xsd, calculées une seule fois par version de xsd
+        export_metadata = engine.xsd_metadata[list(engine.xsd_metadata)[-1]]['excel_export']
 
-        for k, v in doc.items():
-            if v.find('xs:annotation/xs:documentation', namespaces=namespaces) is not None:
-                doc[k] = v.find('xs:annotation/xs:documentation', namespaces=namespaces).text
-            else:
-                doc[k] = None
-
-        doc = {k: v for k, v in doc.items() if v is not None}
-
-        doc = dict([(k.replace('enum_', '').replace('_id', ''), v) if 'enum_' in k else (k, v) for k, v in doc.items()])
-
-        ordered_names = [el.replace('enum_', '').replace('_id', '') if 'enum_' in el else el for el in ordered_names]
-        doc = pd.Series(doc).to_frame('lexique')
+        current_config['names_rank'] = export_metadata['names_rank']
+        names_rank = export_metadata['names_rank_traduit']
+        lexique_rows = export_metadata['lexique_rows']
+        doc = ExcelTable([name for name, documentation in lexique_rows], ['lexique'], [dict(lexique_rows)])
 
         # ADMINISTRATIF
 
@@ -187,23 +285,23 @@ def traduction_xml_excel(xml,excel_folder):
 
         el = xml_traduit.find('administratif')
 
-        df = convert_element_to_dataframe(el, ordered_names)
-        currow, max_col = dump_dataframe_to_excel(df, currow, max_col, current_config)
+        table = convert_element_to_table(el, names_rank)
+        currow, max_col = dump_table_to_excel(table, currow, max_col, current_config)
 
         # sub administratif
         for name in ['auditeur', 'diagnostiqueur', 'bet_entreprise', 'architecte', 'geolocalisation','information_consentement_proprietaire','information_formulaire_consentement']:
             currow, max_col = simple_element_to_excel(name, xml_traduit, currow, max_col, current_config, dump_empty=False)
 
         # adresses
-        all_df = list()
+        all_tables = list()
         # adresses
         for el in xml_traduit.iterfind('*//adresses/*'):
-            df_iter = convert_element_to_dataframe(el, ordered_names)
-            all_df.append(df_iter)
+            table_iter = convert_element_to_table(el, names_rank)
+            all_tables.append(table_iter)
 
-        df = pd.concat(all_df, axis=1)
-        df = df.reindex(df_iter.index)
-        currow, max_col = dump_dataframe_to_excel(df, currow, max_col, current_config)
+        table = concat_tables(all_tables)
+        table = table.reindex(table_iter.index)
+        currow, max_col = dump_table_to_excel(table, currow, max_col, current_config)
 
         reformat_sheet(current_config, max_col)
 
@@ -212,11 +310,9 @@ def traduction_xml_excel(xml,excel_folder):
 
         if is_audit:
             # Get the audit logement_collection
-            get_scenario_id = {lib: id for id, lib in engine.enum_dict['enum_scenario_id'].items()}
-            get_etape_id = {lib: id for id, lib in engine.enum_dict['enum_etape_id'].items()}
             def _get_logement_audit_name(logement):
-                scenario_id = get_scenario_id[logement.find('caracteristique_generale').find('scenario').text]
-                etape_id = get_etape_id[logement.find('caracteristique_generale').find('etape').text]
+                scenario_id = engine.enum_registry.id_from_label('enum_scenario_id', logement.find('caracteristique_generale').find('scenario').text)
+                etape_id = engine.enum_registry.id_from_label('enum_etape_id', logement.find('caracteristique_generale').find('etape').text)
                 logement_name = f"scenario_{scenario_id}_etape_{etape_id}"
                 return logement_name
             logement_name_logement_mapping = {_get_logement_audit_name(el):el for el in xml.iterfind('*//logement')}
@@ -230,54 +326,38 @@ def traduction_xml_excel(xml,excel_folder):
 
             if logement is not None:
 
-                for name in ['caracteristique_generale', 'meteo', 'inertie']:
+                for name in LOGEMENT_SIMPLE_ELEMENTS:
                     currow, max_col = simple_element_to_excel(name, logement, currow, max_col, current_config, dump_empty=True)
 
-                for name in ['mur', 'plancher_bas', 'plancher_haut', 'baie_vitree', 'porte', 'pont_thermique', 'ventilation', 'climatisation', 'production_elec_enr', 'panneaux_pv']:
+                for name in LOGEMENT_COLLECTIONS:
                     currow, max_col = dump_collection_to_excel(name, logement, currow, max_col, current_config, dump_empty=True)
 
-                name = 'installation_ecs'
-
-                all_df = list()
-                # components
-                for i, el in enumerate(logement.iterfind(f'.//{name}')):
-                    df_iter = convert_element_to_dataframe(el, ordered_names)
-                    df_iter.columns = [f'{name}_{i}']
-                    currow, max_col = dump_dataframe_to_excel(df_iter, currow, max_col, current_config)
-
-                    currow, max_col = dump_collection_to_excel('generateur_ecs', el, currow, max_col, current_config, dump_empty=True)
-
-                    all_df.append(df_iter)
-                if len(all_df) == 0:
-                    df = pd.DataFrame(columns=[name])
-                    currow, max_col = dump_dataframe_to_excel(df, currow, max_col, current_config)
+                for name, sub_collections in LOGEMENT_INSTALLATIONS.items():
 
-                name = 'installation_chauffage'
+                    all_tables = list()
+                    # components
+                    for i, el in enumerate(logement.iterfind(f'.//{name}')):
+                        table_iter = convert_element_to_table(el, names_rank)
+                        table_iter.columns = [f'{name}_{i}']
+                        currow, max_col = dump_table_to_excel(table_iter, currow, max_col, current_config)
 
-                all_df = list()
-                # components
-                for i, el in enumerate(logement.iterfind(f'.//{name}')):
-                    df_iter = convert_element_to_dataframe(el, ordered_names)
-                    df_iter.columns = [f'{name}_{i}']
-                    currow, max_col = dump_dataframe_to_excel(df_iter, currow, max_col, current_config)
+                        for sub_name in sub_collections:
+                            currow, max_col = dump_collection_to_excel(sub_name, el, currow, max_col, current_config, dump_empty=True)
 
-                    currow, max_col = dump_collection_to_excel('generateur_chauffage', el, currow, max_col, current_config, dump_empty=True)
-                    currow, max_col = dump_collection_to_excel('emetteur_chauffage', el, currow, max_col, current_config, dump_empty=True)
-
-                    all_df.append(df_iter)
-                if len(all_df) == 0:
-                    df = pd.DataFrame(columns=[name])
-                    currow, max_col = dump_dataframe_to_excel(df, currow, max_col, current_config)
+                        all_tables.append(table_iter)
+                    if len(all_tables) == 0:
+                        table = ExcelTable(columns=[name])
+                        currow, max_col = dump_table_to_excel(table, currow, max_col, current_config)
 
                 reformat_sheet(current_config, max_col)
 
                 current_config['sheet_name'] = logement_name + '_sortie'
                 max_col = 0
                 currow = 0
-                for name in ['deperdition', 'apport_et_besoin', 'ef_conso', 'ep_conso', 'emission_ges', 'cout', 'production_electricite', 'confort_ete', 'qualite_isolation']:
+                for name in SORTIE_SIMPLE_ELEMENTS:
                     currow, max_col = simple_element_to_excel(name, logement, currow, max_col, current_config, dump_empty=True)
 
-                for name in ['sortie_par_energie']:
+                for name in SORTIE_COLLECTIONS:
                     currow, max_col = dump_collection_to_excel(name, logement, currow, max_col, current_config, dump_empty=True)
 
                 if logement.find('etape_travaux') is not None:
@@ -338,19 +418,19 @@ def traduction_xml_excel(xml,excel_folder):
 
             name = 'pack_travaux'
 
-            all_df = list()
+            all_tables = list()
             # components
             for i, el in enumerate(xml_traduit.iterfind(f'*//{name}')):
-                df_iter = convert_element_to_dataframe(el, ordered_names)
-                df_iter.columns = [f'{name}_{i}']
-                currow, max_col = dump_dataframe_to_excel(df_iter, currow, max_col, current_config)
+                table_iter = convert_element_to_table(el, names_rank)
+                table_iter.columns = [f'{name}_{i}']
+                currow, max_col = dump_table_to_excel(table_iter, currow, max_col, current_config)
 
                 currow, max_col = dump_collection_to_excel('travaux', el, currow, max_col, current_config, dump_empty=True, transform=True, title=True)
 
-                all_df.append(df_iter)
-            if len(all_df) == 0:
-                df = pd.DataFrame(columns=[name])
-                currow, max_col = dump_dataframe_to_excel(df, currow, max_col, current_config)
+                all_tables.append(table_iter)
+            if len(all_tables) == 0:
+                table = ExcelTable(columns=[name])
+                currow, max_col = dump_table_to_excel(table, currow, max_col, current_config)
 
         reformat_sheet(current_config, max_col)
 
@@ -358,34 +438,15 @@ def traduction_xml_excel(xml,excel_folder):
         current_config['sheet_name'] = 'lexique'
         max_col = 0
         currow = 0
-        doc = doc.sort_index()
-        dump_dataframe_to_excel(doc, currow, max_col, current_config)
+        dump_table_to_excel(doc, currow, max_col, current_config)
 
         reformat_sheet(current_config, max_col)
 
         # SAVING FILE
-        writer.close()
-        return file_path
+        workbook.close()
     except Exception as e:
         try:
-            writer.close()
+            workbook.close()
         except:
             pass
-        if Path(file_path).is_file():
-            Path(file_path).unlink()
         raise e
-
-
-def cleanup_excel_folder(excel_folder,delat_t_delete=3600,logger=None):
-    if logger is None:
-        logger = logging
-
-    now_tstamp = datetime.now().timestamp()
-    date_min = now_tstamp-delat_t_delete
-    files_to_del = [el for el in excel_folder.iterdir() if el.stat().st_ctime<date_min]
-    for file in files_to_del:
-
-        try:
-            file.unlink()
-        except Exception as e:
-            logger.error(f'impossible de supprimer le fichier {file} , raison : {e.args[0]}')
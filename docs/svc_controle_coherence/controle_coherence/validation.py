@@ -1,8 +1,14 @@
 from lxml import etree
 from pathlib import Path
+import logging
+import time
+import traceback as tb
+from controle_coherence import __version_dpe__, __xsdversion__, __xsdversion_audit__, __version_audit__
 from controle_coherence.utils import remove_null_elements
 from controle_coherence.controle_coherence import EngineDPE,EngineAudit
 
+logger = logging.getLogger('waitress')
+
 
 def procedure_validation(dpe,debug=False,datetime_now=None):
     resp = dict()
@@ -23,3 +29,87 @@ def procedure_validation_audit(xml,debug=False,datetime_now=None):
     remove_null_elements(xml)
 
     return engine.run_controle_coherence(xml,debug=debug,datetime_now=datetime_now)
+
+
+def load_xml_data(data, recover_parse=False):
+    """
+    :param data: contenu du xml reçu par le webservice
+    :return: (xml, message d'erreur ou None)
+    """
+    error = None
+    xml_tree = None
+    if data:
+
+        try:
+            if recover_parse is False:
+                xml_tree = etree.ElementTree(etree.fromstring(data))
+            else:
+                parser = etree.XMLParser(recover=True)
+                xml_tree = etree.ElementTree(etree.fromstring(data,parser=parser))
+        except Exception:
+            error = f"""
+impossible de lire le fichier xml envoyé de taille : {len(data)}.' 
+Extrait du fichier :
+{data[0:100]}
+"""
+    else:
+        error = 'no data provided'
+    return xml_tree, error
+
+
+def validation_xml_data(data, dispositif=None, debug=False, datetime_now=None):
+    """
+    lecture et contrôle de cohérence d'un xml reçu par le webservice.
+
+    :param data: contenu du xml
+    :param dispositif: 'dpe' ou 'audit', si None le moteur est choisi selon la balise racine du xml
+    :return: (code http, rapport ou message d'erreur)
+    """
+    try:
+        # charger xml
+        logger.debug('requête reçue par le service controle_coherence : traitement du xml en cours')
+        tstart = time.time()
+        xml_tree, error = load_xml_data(data)
+        if error is not None:
+            logger.warning(error)
+            return 400, error
+
+        if dispositif is None:
+            dispositif = xml_tree.getroot().tag
+        if dispositif not in ('dpe', 'audit'):
+            error = f"balise racine {dispositif} inconnue : le document doit être un DPE (dpe) ou un audit (audit)"
+            logger.warning(error)
+            return 400, error
+
+        try:  # procedure de validation
+            if dispositif == 'dpe':
+                resp = procedure_validation(xml_tree, debug=debug,datetime_now=datetime_now)
+                resp.update({"xsd_version": __xsdversion__,
+                             'moteur_coherence_version': __version_dpe__})
+            else:
+                resp = procedure_validation_audit(xml_tree, debug=debug,datetime_now=datetime_now)
+                resp.update({"xsd_version_audit": __xsdversion_audit__,
+                             'controle_coherence_audit_version': __version_audit__})
+        except Exception as e:
+            msg = f"""ERREUR INTERNE DU MOTEUR DE CONTROLE DE COHERENCE
+    {tb.format_exc()}
+            """
+            logger.error(msg)
+            return 500, msg
+
+        nb_errors = len(resp['erreur_logiciel']) + len(resp['erreur_saisie'])
+        if nb_errors > 0:
+            logger.debug(f"le fichier xml comporte {nb_errors} erreurs relevées par les controles de cohérences et n'est pas valide")
+        if resp['validation_xsd']['valid'] is False:
+            logger.debug(f"le fichier xml comporte des erreurs de validation xsd")
+        if resp['validation_xsd']['valid'] is True and nb_errors == 0:
+            logger.debug(f"le fichier xml a passé tous les contrôles avec succès et est valide pour dépot.")
+        logger.debug(f'traitement du xml terminé en {(time.time() - tstart) * 1000} ms')
+    except Exception as e:
+        msg = f"""ERREUR INTERNE DU MOTEUR DE CONTROLE DE COHERENCE
+        {tb.format_exc()}
+                """
+        logger.error(msg)
+        return 500, msg
+
+    return 200, resp
@@ -0,0 +1,150 @@
+import re
+
+# expressions des colonnes variables_requises / variables_interdites des tables enum.
+# exemples : 'umur0|uph0|upb0' , 'epaisseur_isolation,(umur0|uph0|upb0)' , '(tv_deltar_id,tv_ujn_id)|ujn_saisi'
+# ',' : toutes les variables sont requises, '|' : au moins une des variables est requise.
+# les expressions sont compilées une seule fois au chargement du moteur en arbres de VarGroup / VarRef.
+
+VAR_NAME_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+TOKEN_PATTERN = re.compile(r'\s*([A-Za-z_][A-Za-z0-9_]*|[(),|])\s*')
+
+OPERATOR_SEP = {',': ' et ',
+                '|': ' ou ',
+                }
+
+
+class VarRef:
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def missing(self, exists):
+        # une variable hors du modèle de l'élément (exists -> None) n'est pas exigée
+        if exists(self.name) is False:
+            return self.name
+        return None
+
+
+class VarGroup:
+    """
+    groupe de variables ou de sous-groupes reliés par un même opérateur.
+
+    missing(exists) renvoie None si l'expression est satisfaite, sinon le libellé des variables manquantes au format
+    historique du contrôle ('a et b', 'a ou b', '(a ou b) et (c)').
+    """
+    __slots__ = ('operator', 'children', 'nested', 'variables')
+
+    def __init__(self, operator, children):
+        self.operator = operator
+        self.children = tuple(children)
+        self.nested = any(isinstance(child, VarGroup) for child in self.children)
+        variables = list()
+        for child in self.children:
+            for name in (child.variables if isinstance(child, VarGroup) else (child.name,)):
+                if name not in variables:
+                    variables.append(name)
+        self.variables = tuple(variables)
+
+    def missing(self, exists):
+        sep = OPERATOR_SEP[self.operator]
+        if self.nested:
+            missing_list = list()
+            for child in self.children:
+                child_missing = child.missing(exists)
+                if child_missing is None and self.operator == '|':
+                    return None
+                if child_missing is not None:
+                    missing_list.append(child_missing)
+            if len(missing_list) == 0:
+                return None
+            return '(' + f'){sep}('.join(missing_list) + ')'
+
+        # groupe simple : les variables hors modèle sont ignorées
+        missing_list = list()
+        for child in self.children:
+            found = exists(child.name)
+            if found is True and self.operator == '|':
+                return None
+            if found is False:
+                missing_list.append(child.name)
+        if len(missing_list) == 0:
+            return None
+        return sep.join(missing_list)
+
+
+def _tokenize(expression):
+    tokens = list()
+    pos = 0
+    expression = expression.strip()
+    while pos < len(expression):
+        match = TOKEN_PATTERN.match(expression, pos)
+        if match is None:
+            raise ValueError(f'caractère invalide à la position {pos}')
+        tokens.append(match.group(1))
+        pos = match.end()
+    return tokens
+
+
+def compile_variables_requises(expression):
+    """
+    compile une expression variables_requises en VarGroup.
+
+    :raises ValueError: expression mal formée (parenthèses non équilibrées, terme vide, opérateurs ',' et '|' mélangés
+    au même niveau sans parenthèses)
+    """
+    if not isinstance(expression, str):
+        raise ValueError(f'expression de type {type(expression).__name__} au lieu de str')
+    tokens = _tokenize(expression)
+    if len(tokens) == 0:
+        raise ValueError('expression vide')
+    pos = 0
+
+    def parse_group():
+        nonlocal pos
+        children = [parse_term()]
+        operator = None
+        while pos < len(tokens) and tokens[pos] in OPERATOR_SEP:
+            if operator is None:
+                operator = tokens[pos]
+            elif tokens[pos] != operator:
+                raise ValueError("opérateurs ',' et '|' mélangés sans parenthèses")
+            pos += 1
+            children.append(parse_term())
+        return VarGroup(operator or ',', children)
+
+    def parse_term():
+        nonlocal pos
+        if pos >= len(tokens):
+            raise ValueError('terme manquant en fin d\'expression')
+        token = tokens[pos]
+        pos += 1
+        if token == '(':
+            group = parse_group()
+            if pos >= len(tokens) or tokens[pos] != ')':
+                raise ValueError('parenthèse non fermée')
+            pos += 1
+            return group
+        if VAR_NAME_PATTERN.fullmatch(token) is None:
+            raise ValueError(f'terme manquant avant {token!r}')
+        return VarRef(token)
+
+    group = parse_group()
+    if pos != len(tokens):
+        raise ValueError(f'élément inattendu {tokens[pos]!r}')
+    return group
+
+
+def compile_variables_interdites(expression):
+    """
+    compile une expression variables_interdites (liste de variables séparées par des virgules) en tuple de noms.
+
+    :raises ValueError: expression mal formée
+    """
+    if not isinstance(expression, str):
+        raise ValueError(f'expression de type {type(expression).__name__} au lieu de str')
+    variables = tuple(expression.split(','))
+    for var in variables:
+        if VAR_NAME_PATTERN.fullmatch(var) is None:
+            raise ValueError(f'nom de variable invalide {var!r}')
+    return variables
@@ -0,0 +1,110 @@
+import copy
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger('waitress')
+
+
+class QueueFull(Exception):
+    """toutes les places de la file d'attente du pool de workers sont occupées."""
+
+
+def _init_worker(versions_dpe, versions_audit):
+    # dates de validité des versions du process principal (DISABLE_DATE_RESTRICTION...), que le worker n'hérite pas
+    # lorsqu'il n'est pas forké depuis le process principal
+    from controle_coherence.assets_dpe import versions_dpe_cfg
+    from controle_coherence.assets_audit import versions_audit_cfg
+    for versions_cfg, versions in [(versions_dpe_cfg, versions_dpe), (versions_audit_cfg, versions_audit)]:
+        versions_cfg.clear()
+        versions_cfg.update(versions)
+    # les workers se partagent déjà les requêtes : pas de pool des contrôles par logement en plus dans chacun d'eux
+    from controle_coherence.logement_pool import disable_pool
+    disable_pool()
+    # moteurs chargés une fois par worker (déjà chauds si le worker est forké depuis le process principal)
+    from controle_coherence.controle_coherence import EngineDPE, EngineAudit
+    EngineDPE()
+    EngineAudit()
+
+
+def _ping():
+    return True
+
+
+class ValidationWorkerPool:
+    """
+    pool de processus workers du webservice, chacun avec ses moteurs EngineDPE/EngineAudit chargés.
+
+    les workers sont démarrés à la création du pool. Au plus nb_workers + queue_size requêtes sont traitées ou en
+    attente à un instant donné, au-delà submit lève QueueFull (le webservice répond 503). Un pool dont un worker a été
+    tué (mémoire...) est recréé à la requête suivante.
+
+    le pool est créé au démarrage du service, avant les threads waitress : ses workers sont forkés et héritent des
+    moteurs chargés. Un redémarrage a lieu pendant que les threads waitress tournent, les nouveaux workers ne sont pas
+    forkés depuis le process principal (un verrou tenu par un autre thread y resterait verrouillé) mais démarrés par
+    forkserver ou spawn et chargent leurs propres moteurs.
+    """
+
+    def __init__(self, nb_workers, queue_size):
+        self.nb_workers = nb_workers
+        self.queue_size = queue_size
+        self.slots = threading.BoundedSemaphore(nb_workers + queue_size)
+        start_methods = multiprocessing.get_all_start_methods()
+        self.mp_context = multiprocessing.get_context('fork' if 'fork' in start_methods else 'spawn')
+        self.restart_mp_context = multiprocessing.get_context('forkserver' if 'forkserver' in start_methods else 'spawn')
+        self.lock = threading.Lock()
+        self.executor = self._start_executor(self.mp_context)
+
+    def _start_executor(self, mp_context):
+        from controle_coherence.assets_dpe import versions_dpe_cfg
+        from controle_coherence.assets_audit import versions_audit_cfg
+        executor = ProcessPoolExecutor(max_workers=self.nb_workers, mp_context=mp_context, initializer=_init_worker,
+                                       initargs=(copy.deepcopy(versions_dpe_cfg), copy.deepcopy(versions_audit_cfg)))
+        # démarrage immédiat des workers plutôt qu'à la première requête
+        for future in [executor.submit(_ping) for _ in range(self.nb_workers)]:
+            future.result()
+        return executor
+
+    def _restart(self, executor):
+        with self.lock:
+            if self.executor is executor:
+                logger.warning('pool de workers inutilisable : redémarrage des workers')
+                executor.shutdown(wait=False)
+                self.executor = self._start_executor(self.restart_mp_context)
+
+    def submit(self, fn, *args, block=False):
+        """
+        :param block: si True attend qu'une place se libère dans la file au lieu de lever QueueFull
+        :return: future du résultat de fn(*args) exécuté dans un worker
+        """
+        if not self.slots.acquire(blocking=block):
+            raise QueueFull()
+        executor = self.executor
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._restart(executor)
+            try:
+                future = self.executor.submit(fn, *args)
+            except BaseException:
+                self.slots.release()
+                raise
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda f: self.slots.release())
+        return future
+
+    def run(self, fn, *args, block=False):
+        """exécute fn(*args) dans un worker et renvoie son résultat."""
+        executor = self.executor
+        try:
+            return self.submit(fn, *args, block=block).result()
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+from lxml import etree
+
+from controle_coherence import __version_global__
+
+# version du format des métadonnées extraites des xsd : à incrémenter lorsque l'extraction change
+XSD_METADATA_FORMAT_VERSION = 2
+
+logger = logging.getLogger(__name__)
+
+
+def get_cache_dir(xsd_path):
+    """
+    dossier du cache disque des métadonnées xsd : variable d'environnement OBS_DPE_XSD_CACHE_DIR
+    sinon un dossier xsd_cache à côté des xsd.
+    """
+    cache_dir = os.getenv('OBS_DPE_XSD_CACHE_DIR')
+    if cache_dir is not None:
+        return Path(cache_dir)
+    return Path(xsd_path).parent / 'xsd_cache'
+
+
+def get_xsd_pool_size():
+    """nombre maximal de validateurs conservés par xsd : variable d'environnement OBS_DPE_XSD_POOL_SIZE."""
+    return int(os.getenv('OBS_DPE_XSD_POOL_SIZE', 8))
+
+
+class XsdValidatorPool:
+    """
+    validateurs etree.XMLSchema d'un xsd partagés entre les threads du webservice.
+
+    un XMLSchema ne peut pas servir deux validations simultanées (error_log propre à l'objet), chaque validation
+    emprunte donc un validateur libre, un nouveau validateur est compilé si tous sont occupés. lxml libère le GIL
+    pendant la validation : plusieurs requêtes sont validées en parallèle dans le même process.
+    """
+
+    def __init__(self, xsd_path, max_idle=None):
+        self.xsd_path = str(xsd_path)
+        self.max_idle = max_idle if max_idle is not None else get_xsd_pool_size()
+        self._lock = threading.Lock()
+        self._idle = [self._build()]  # premier validateur compilé à la création (warmup)
+        self.nb_built = 1
+
+    def _build(self):
+        return etree.XMLSchema(file=self.xsd_path)
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            self.nb_built += 1
+        return self._build()
+
+    def _release(self, schema):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(schema)
+
+    def validate(self, xml):
+        """
+        :return: (xml valide, error_log de la validation sous forme de texte)
+        """
+        schema = self._acquire()
+        try:
+            valid = schema.validate(xml)
+            error_log = str(schema.error_log)
+        finally:
+            self._release(schema)
+        return valid, error_log
+
+
+class XsdRegistry:
+    """
+    registre des xsd partagé par tout le process et indexé par l'empreinte du contenu des fichiers.
+
+    plusieurs versions pointent vers des xsd identiques (DPEv2.5/DPEv2.6, audit_v2.4/audit_v2.5/audit.xsd, DPE 1 et 1.1),
+    chaque xsd distinct n'est donc compilé et analysé qu'une seule fois, pour toutes les versions et pour
+    les deux moteurs EngineDPE et EngineAudit.
+
+    les métadonnées extraites du xsd (modèles, noms ordonnés, lexique) sont en plus persistées sur disque en json :
+    l'arbre xsd n'est parsé qu'en cas d'absence du cache puis immédiatement libéré.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._content_hash = dict()  # chemin du fichier -> empreinte du contenu
+        self._schemas = dict()  # empreinte -> XsdValidatorPool
+        self._metadata = dict()  # empreinte -> métadonnées extraites du xsd
+
+    def content_hash(self, xsd_path):
+        xsd_path = str(xsd_path)
+        content_hash = self._content_hash.get(xsd_path)
+        if content_hash is None:
+            content_hash = hashlib.sha256(Path(xsd_path).read_bytes()).hexdigest()
+            self._content_hash[xsd_path] = content_hash
+        return content_hash
+
+    def _get_or_build(self, store, xsd_path, build):
+        content_hash = self.content_hash(xsd_path)
+        try:
+            return store[content_hash]
+        except KeyError:
+            pass
+        with self._lock:
+            if content_hash not in store:
+                store[content_hash] = build(xsd_path)
+        return store[content_hash]
+
+    def get_schema(self, xsd_path):
+        return self._get_or_build(self._schemas, xsd_path, XsdValidatorPool)
+
+    @staticmethod
+    def parse_xsd(xsd_path):
+        parser = etree.XMLParser(remove_blank_text=True, resolve_entities=False, no_network=True)  # Secure parser against XXE
+        return etree.parse(str(xsd_path), parser)
+
+    def get_metadata(self, xsd_path, extract_metadata):
+        """
+        :param extract_metadata: fonction xsd (etree._ElementTree) -> dict sérialisable en json,
+        appelée uniquement si les métadonnées de ce xsd ne sont ni en mémoire ni dans le cache disque.
+        """
+        return self._get_or_build(self._metadata, xsd_path, lambda path: self._load_metadata(path, extract_metadata))
+
+    def _cache_path(self, xsd_path):
+        return get_cache_dir(xsd_path) / f'{self.content_hash(xsd_path)}.json'
+
+    def _load_metadata(self, xsd_path, extract_metadata):
+        cache_path = self._cache_path(xsd_path)
+        cache_key = f'{XSD_METADATA_FORMAT_VERSION}-{__version_global__}'
+        if cache_path.is_file():
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    cached = json.load(f)
+                if cached.get('cache_key') == cache_key:
+                    return cached['metadata']
+            except Exception as e:
+                logger.warning(f'cache xsd {cache_path} illisible, le xsd {xsd_path} est analysé à nouveau : {e}')
+
+        metadata = extract_metadata(self.parse_xsd(xsd_path))
+
+        try:
+            cache_path.parent.mkdir(exist_ok=True, parents=True)
+            tmp_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'cache_key': cache_key, 'metadata': metadata}, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"impossible d'écrire le cache xsd {cache_path} : {e}")
+        return metadata
+
+
+xsd_registry = XsdRegistry()
@@ -4,4 +4,6 @@ setup(
     name='controle_coherence',
     packages=find_packages(),
     version='1.5.5',
+    # écriture des jeux de données parquet de controle_coherence.corpus_parquet
+    extras_require={'parquet': ['pyarrow==17.0.0']},
     url='https://gitlab.com/observatoire-dpe/observatoire-dpe')
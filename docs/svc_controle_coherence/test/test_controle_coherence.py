@@ -9,12 +9,31 @@ import json
 import inspect
 import ast
 import textwrap
+import pickle
+import io
+import zipfile
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from controle_coherence.assets_audit import versions_audit_cfg
 from controle_coherence.utils import convert_xml_text, remove_sub_el, create_sub_el, remove_null_elements, _restore_version_audit_cfg, _restore_version_dpe_cfg
-from controle_coherence.controle_coherence import EngineDPE, EngineAudit
+from controle_coherence.controle_coherence import EngineDPE, EngineAudit, LazyVersionDict
+from controle_coherence.utils import calc_seuil_interpolate
 from controle_coherence.utils import element_to_value_dict, set_xml_values_from_dict, _set_version_audit_to_valid_dates, _set_version_dpe_to_valid_dates
 from controle_coherence.assets_dpe import expected_components, versions_dpe_cfg, get_datetime_now
 from controle_coherence.controle_coherence import ReportDPE, ReportAudit
+from controle_coherence.enum_report import msg_importance
+from controle_coherence.assets_bundle import build_assets_bundle, load_assets_bundle, BUNDLE_SOURCES
+from controle_coherence.xsd_registry import xsd_registry, XsdRegistry, XsdValidatorPool
+from controle_coherence.document_index import DocumentIndex, lxml_lookup
+from controle_coherence.audit_graph import get_audit_graph
+from controle_coherence.logement_pool import shutdown_pool, get_audit_processes
+from controle_coherence.batch import iter_batch_documents, run_batch
+from controle_coherence.validation import validation_xml_data
+from controle_coherence.worker_pool import ValidationWorkerPool, QueueFull
+from controle_coherence.report_cache import ReportCache, report_cache_key
+from controle_coherence.rule_dispatcher import RULE_HORS_METHODE, RULE_TABLE_VALEUR, RULE_VARIABLES_REQUISES
+from controle_coherence.variables_expression import compile_variables_requises, compile_variables_interdites
 
 DATE_TEST_POST_DPE_latest = '2026-01-01'
 DATE_TEST_PRE_DPE_24 = '2024-05-03'
@@ -5258,14 +5277,14 @@ def test_branchement_des_controles_coherence():
         class_source = textwrap.dedent(inspect.getsource(engine))
         class_ast = ast.parse(class_source)
         # Cherche la fonction run_controle_coherence dans l'AST de la classe
+        class_methods = dict()
         for node in class_ast.body:
             if isinstance(node, ast.ClassDef):
                 for item in node.body:
-                    if isinstance(item, ast.FunctionDef) and item.name == "run_controle_coherence":
-                        run_controle_coherence_node = item
-                        break
+                    if isinstance(item, ast.FunctionDef):
+                        class_methods[item.name] = item
 
-        assert 'run_controle_coherence_node' in locals(), "Impossible de trouver la méthode run_controle_coherence"
+        assert 'run_controle_coherence' in class_methods, "Impossible de trouver la méthode run_controle_coherence"
 
         class MethodCallVisitor(ast.NodeVisitor):
             def __init__(self):
@@ -5274,13 +5293,563 @@ def test_branchement_des_controles_coherence():
                 if isinstance(node.func, ast.Attribute) and isinstance(node.func.value, ast.Name):
                     if node.func.value.id == "self":
                         self.called.add(node.func.attr)
+                        # méthodes de contrôles par logement passées par nom (ex : run_controles_logements)
+                        self.called.update(arg.value for arg in node.args
+                                           if isinstance(arg, ast.Constant) and arg.value in class_methods)
                 self.generic_visit(node)
 
+        # les méthodes de la classe appelées depuis run_controle_coherence sont parcourues à leur tour
         visitor = MethodCallVisitor()
-        visitor.visit(run_controle_coherence_node)
+        visited = set()
+        to_visit = ['run_controle_coherence']
+        while to_visit:
+            name = to_visit.pop()
+            visited.add(name)
+            visitor.visit(class_methods[name])
+            to_visit = [el for el in visitor.called if el in class_methods and el not in visited
+                        and not el.startswith('controle_coherence')]
         called_methods = visitor.called
 
         missing = [m for m in all_controle_coherence if m not in called_methods]
         assert not missing, (
             f"Pour le moteur {dispositif}, les méthodes suivantes ne sont PAS appelées dans run_controle_coherence: {missing}"
-        )
\ No newline at end of file
+        )
+
+def test_assets_bundle(tmp_path):
+    engine = EngineDPE()
+    bundle_path = tmp_path / 'assets.pkl'
+    assert (load_assets_bundle(engine.mdd_path, bundle_path) is None)
+
+    build_assets_bundle(engine.mdd_path, bundle_path)
+    sources = load_assets_bundle(engine.mdd_path, bundle_path)
+    assert (set(sources) == set(BUNDLE_SOURCES))
+    assert ([el['nom_table_valeur'] for el in sources['arrete_reseau_chaleur.json']] == [el['nom_table_valeur'] for el in engine.arrete_reseau_chaleur])
+    enum_table = sources['enum_tables.xlsx']
+    assert (set(enum_table) == set(engine.enum_table))
+
+    # un bundle dont l'empreinte ne correspond plus aux sources est ignoré
+    with open(bundle_path, 'rb') as f:
+        bundle = pickle.load(f)
+    bundle['checksum'] = 'perime'
+    with open(bundle_path, 'wb') as f:
+        pickle.dump(bundle, f)
+    assert (load_assets_bundle(engine.mdd_path, bundle_path) is None)
+
+
+def test_lazy_version_dict():
+    calls = list()
+
+    def loader(version_id_str):
+        calls.append(version_id_str)
+        return version_id_str * 2
+
+    lazy_dict = LazyVersionDict({'1': {}, '2': {}}, loader)
+    assert (list(lazy_dict.keys()) == ['1', '2'])
+    assert (calls == [])
+    assert (lazy_dict['2'] == '22')
+    assert (lazy_dict['2'] == '22')
+    assert (calls == ['2'])
+    assert (lazy_dict.is_loaded('2') and not lazy_dict.is_loaded('1'))
+    with pytest.raises(KeyError):
+        lazy_dict['3']
+
+    engine = EngineAudit()
+    with pytest.raises(ValueError):
+        engine.warmup_versions('invalide')
+    engine.warmup_versions('all')
+    assert (all(engine.schema_dict.is_loaded(version_id_str) for version_id_str in engine.VERSION_CFG))
+
+
+def test_xsd_registry_partage():
+    engine_dpe = EngineDPE()
+    engine_audit = EngineAudit()
+    # xsd identiques : un seul schéma compilé et un seul jeu de modèles
+    assert (engine_dpe.schema_dict['1'] is engine_dpe.schema_dict['1.1'])
+    assert (engine_dpe.schema_dict['2.5'] is engine_dpe.schema_dict['2.6'])
+    assert (engine_dpe.logement_models['2.5'] is engine_dpe.logement_models['2.6'])
+    assert (engine_audit.schema_dict['2.4'] is engine_audit.schema_dict['2.5'])
+    assert (engine_dpe.schema_dict['2.4'] is not engine_dpe.schema_dict['2.5'])
+    assert (xsd_registry.get_metadata(engine_audit._xsd_path('2.5'), None) is engine_audit.xsd_metadata['2.4'])
+
+
+def test_xsd_registry_cache_disque(tmp_path, monkeypatch):
+    monkeypatch.setenv('OBS_DPE_XSD_CACHE_DIR', str(tmp_path))
+    engine = EngineDPE()
+    xsd_path = engine._xsd_path('2.6')
+    calls = list()
+
+    def extract_metadata(xsd):
+        calls.append(xsd)
+        return engine._extract_xsd_metadata(xsd)
+
+    metadata = XsdRegistry().get_metadata(xsd_path, extract_metadata)
+    assert (len(calls) == 1)
+    assert (len(list(tmp_path.iterdir())) == 1)
+    assert (metadata['logement_models'] == engine.logement_models['2.6'])
+    assert ('mur' in metadata['ordered_names'])
+
+    # un nouveau process relit le cache disque sans analyser le xsd
+    assert (XsdRegistry().get_metadata(xsd_path, extract_metadata) == metadata)
+    assert (len(calls) == 1)
+
+
+def test_document_index():
+    engine = EngineAudit()
+    parser = etree.XMLParser(remove_blank_text=True)
+    f = str((engine.mdd_path / 'exemples_metier' / 'cas_test_audit_maison_1_latest_valid.xml'))
+    audit = etree.parse(f, parser)
+    index = DocumentIndex(audit)
+
+    # résultats identiques à lxml pour tous les tags, depuis la racine et depuis chaque logement
+    tags = {el.tag for el in audit.iter() if isinstance(el.tag, str)}
+    for element in [audit, audit.getroot()] + list(audit.iterfind('*//logement')):
+        for tag in tags:
+            for path in (f'.//{tag}', f'*//{tag}'):
+                assert (index.iterfind(element, path) == list(element.iterfind(path)))
+                assert (index.find(element, path) is element.find(path))
+
+    # chemins non indexés et éléments hors index délégués à lxml
+    assert (index.find(audit, './administratif/enum_version_audit_id') is audit.find('./administratif/enum_version_audit_id'))
+    logement_copy = copy.deepcopy(audit.find('*//logement'))
+    assert (len(index.iterfind(logement_copy, './/mur')) == len(list(logement_copy.iterfind('.//mur'))))
+
+    mur = audit.find('*//mur')
+    assert (index.ancestor(mur, 'logement') is next(mur.iterancestors('logement')))
+    assert (index.ancestor(mur, ('inexistant',)) is None)
+
+
+def test_compile_variables_expression():
+    expression = compile_variables_requises('(fecs|fch),enum_methode_saisie_fact_couv_sol_id,(fecs_saisi|fch_saisi)')
+    assert (expression.variables == ('fecs', 'fch', 'enum_methode_saisie_fact_couv_sol_id', 'fecs_saisi', 'fch_saisi'))
+
+    def exists_func(present, model):
+        return lambda var: (var in present) if var in model else None
+
+    model = set(expression.variables)
+    assert (expression.missing(exists_func(set(model), model)) is None)
+    assert (expression.missing(exists_func({'fch', 'fecs_saisi'}, model)) == '(enum_methode_saisie_fact_couv_sol_id)')
+    assert (expression.missing(exists_func(set(), model)) == '(fecs ou fch) et (enum_methode_saisie_fact_couv_sol_id) et (fecs_saisi ou fch_saisi)')
+    # variables hors modèle non exigées
+    assert (expression.missing(exists_func({'fch'}, {'fch'})) is None)
+
+    expression = compile_variables_requises('(tv_deltar_id,tv_ujn_id)|ujn_saisi')
+    assert (expression.missing(exists_func({'tv_deltar_id'}, set(expression.variables))) == '(tv_ujn_id) ou (ujn_saisi)')
+    assert (compile_variables_requises('umur0|uph0').missing(exists_func(set(), {'umur0', 'uph0'})) == 'umur0 ou uph0')
+    assert (compile_variables_interdites('umur0,uph0') == ('umur0', 'uph0'))
+
+    for malformed in ['a,b|c', '(a|b', 'a,', '(a|b))', 'a,,b', '', 'a b']:
+        with pytest.raises(ValueError):
+            compile_variables_requises(malformed)
+    with pytest.raises(ValueError):
+        compile_variables_interdites('a|b')
+
+
+def test_rule_dispatcher():
+    engine = EngineDPE()
+    parser = etree.XMLParser(remove_blank_text=True)
+    f = str((engine.mdd_path / 'exemples_metier' / 'cas_test_immeuble_1_valid.xml'))
+    dpe = etree.parse(f, parser)
+    logement = dpe.find('logement')
+    index = DocumentIndex(dpe)
+
+    # mêmes éléments et même ordre qu'une recherche par tag dans l'ordre des tables de règles
+    for family, rules_dict, element, path in [(RULE_TABLE_VALEUR, engine.valeur_table_dict, logement, '*//'),
+                                              (RULE_HORS_METHODE, engine.enum_hors_methode_dict, logement, '*//'),
+                                              (RULE_VARIABLES_REQUISES, engine.var_req_dict, dpe, './/')]:
+        expected = [(tag, list(element.iterfind(path + tag))) for tag in rules_dict]
+        expected = [(tag, elements) for tag, elements in expected if len(elements) > 0]
+        assert (len(expected) > 0)
+        min_depth = 2 if path == '*//' else 1
+        assert (list(engine.rule_dispatcher.iter_elements(index, element, family, min_depth)) == expected)
+        assert (list(engine.rule_dispatcher.iter_elements(lxml_lookup, element, family, min_depth)) == expected)
+    assert (engine.rule_dispatcher in index.cache)
+
+
+def test_controle_coherence_tv_values_simple_vectorise():
+    engine = EngineDPE()
+    for name, tv_value_array in engine.tv_value_arrays.items():
+        for column, values in tv_value_array['columns'].items():
+            for tv_id, row in tv_value_array['row'].items():
+                expected = engine.valeur_table_dict[name][tv_id][column]
+                assert ((expected == values[row]) or (expected != expected and values[row] != values[row]))
+
+    parser = etree.XMLParser(remove_blank_text=True)
+    f = str((engine.mdd_path / 'exemples_metier' / 'cas_test_appt_1.xml'))
+    dpe = etree.parse(f, parser)
+    report = ReportDPE()
+    engine.controle_coherence_tv_values_simple(dpe.find('logement'), report)
+    nb_errors = len(report.error_software)
+
+    # un identifiant tv absent de la table interrompt le contrôle après l'émission des messages qui le précèdent
+    tv_sw = list(dpe.iterfind('*//tv_sw_id'))
+    tv_sw[-1].text = '99999'
+    report = ReportDPE()
+    with pytest.raises(KeyError):
+        engine.controle_coherence_tv_values_simple(dpe.find('logement'), report)
+    assert (0 < len(report.error_software) <= nb_errors)
+
+
+def test_tv_enum_index():
+    engine = EngineDPE()
+    for name, vt in engine.valeur_table_dict.items():
+        for tv_id, row in vt.items():
+            related_properties, related_enums = engine.tv_related[name][tv_id]
+            assert (related_properties == {k: v for k, v in row.items() if v == v})
+            for enum_name, admissible_values in related_enums.items():
+                assert (admissible_values == frozenset(row[enum_name]))
+                # index inverse : chaque id enum admissible renvoie vers la valeur tv
+                for enum_id in admissible_values:
+                    assert (tv_id in engine.tv_ids_by_enum[name][enum_name][enum_id])
+
+    parser = etree.XMLParser(remove_blank_text=True)
+    f = str((engine.mdd_path / 'exemples_metier' / 'cas_test_appt_1.xml'))
+    dpe = etree.parse(f, parser)
+    report = ReportDPE()
+    engine.controle_coherence_table_valeur_enum(dpe.find('logement'), report)
+    suggestions = [el['message'] for el in report.error_software if 'compatibles sont' in el['message']]
+    assert (len(suggestions) > 0)
+
+
+def test_enum_lookup():
+    engine = EngineAudit()
+    # valeurs identiques à celles lues par pandas
+    for table_name, table in engine.enum_table.items():
+        for enum_id in table.index:
+            row = table.loc[enum_id]
+            if not isinstance(row, pd.Series):  # index dupliqué : table non accessible par id
+                continue
+            for column, value in row.items():
+                lookup_value = engine.get_enum_value(table_name, enum_id, column)
+                assert ((value == lookup_value) or (pd.isnull(value) and pd.isnull(lookup_value)))
+        for column in table.columns:
+            assert (engine.get_enum_column(table_name, column) == table[column].dropna().to_dict())
+    with pytest.raises(KeyError):
+        engine.get_enum_value('methode_application_dpe_log', 9999, 'type_batiment')
+
+    assert (engine.get_enum_value('methode_application_dpe_log', 1, 'type_batiment') == 'maison')
+    assert (len(engine.adjacence_id_avec_ue) > 0 and all(isinstance(el, str) for el in engine.adjacence_id_avec_ue))
+    assert (len(engine.generateurs_avec_veilleuse['enum_type_generateur_ch_id']) > 0)
+    assert (len(engine.type_travaux_caracteristiques['ids']) == len(engine.type_travaux_caracteristiques['libs']))
+
+
+def test_seuils_petites_surfaces():
+    engine = EngineDPE()
+    seuils_petites_surfaces = json.loads((engine.mdd_path / 'seuils_petites_surfaces.json').read_text(encoding='utf-8'))
+    surfaces = [1, 8, 8.2, 9, 12.345, 17.5, 25, 39.99999]
+    for altitude, tables in seuils_petites_surfaces.items():
+        for name, table in tables.items():
+            seuil_table = pd.DataFrame(table)
+            seuil_table.index = seuil_table.index.astype(int)
+            compiled = engine.seuils_petites_surfaces[altitude][name]
+            for surface in surfaces:
+                # mêmes seuils que l'interpolation pandas
+                assert (compiled.seuils(surface) == calc_seuil_interpolate(surface, seuil_table))
+            seuils_max = compiled.seuils_max_batch(surfaces)
+            assert (seuils_max.shape == (len(surfaces), len(compiled.classes)))
+            for surface, row in zip(surfaces, seuils_max):
+                assert (row.tolist() == [v[1] for v in compiled.seuils(surface).values()])
+
+
+def test_arrete_reseau_chaleur_index():
+    engine = EngineDPE()
+    arrete_index = engine.arrete_reseau_chaleur_index
+    assert (arrete_index.all_dates_txt == [el['date_arrete_reseau_chaleur'] for el in engine.arrete_reseau_chaleur])
+    assert (arrete_index.latest.date_arrete_txt == engine.arrete_reseau_chaleur[-1]['date_arrete_reseau_chaleur'])
+    assert (arrete_index.get('1999-01-01') is None)
+    for arrete in engine.arrete_reseau_chaleur:
+        found = arrete_index.get(arrete['date_arrete_reseau_chaleur'])
+        assert (found.date_fin == datetime.fromisoformat(arrete['date_fin']))
+        tv_reseau = engine.valeur_table[arrete['nom_table_valeur']]
+        if 'identifiant_reseau' in tv_reseau:
+            assert (found.identifiants_reseaux == set(tv_reseau.identifiant_reseau.unique().tolist()))
+        else:
+            assert (found.identifiants_reseaux is None)
+
+
+def test_enum_registry():
+    engine = EngineAudit()
+
+    def display_legacy(enum_name, enum_values):
+        if isinstance(enum_values, int):
+            enum_values = [enum_values]
+        return {k: v for k, v in engine.enum_dict[enum_name].items() if k in enum_values}
+
+    for enum_name, labels in engine.enum_dict.items():
+        ids = list(labels)
+        int_ids = [enum_id for enum_id in ids if isinstance(enum_id, int)][:1]
+        for enum_values in int_ids + [99999, ids[::-1], set(ids[:3]) | {99999}, frozenset(ids[1:2]),
+                            labels.keys() - {ids[0]}, [ids[0], ids[0]], []]:
+            result = engine.display_enum_traduction(enum_name, enum_values)
+            assert (result == display_legacy(enum_name, enum_values))
+            assert (list(result) == list(display_legacy(enum_name, enum_values)))
+        for enum_id, label in labels.items():
+            assert (engine.enum_registry.label_traduction(enum_name, enum_id) == str(label).lower().strip())
+    scenario_labels = engine.enum_dict['enum_scenario_id']
+    assert (engine.enum_registry.id_from_label('enum_scenario_id', scenario_labels[1]) == 1)
+    with pytest.raises(KeyError):
+        engine.enum_registry.label('enum_scenario_id', 99999)
+
+
+def test_enrich_issues_context_cache():
+    engine = EngineAudit()
+    parser = etree.XMLParser(remove_blank_text=True)
+    f = str((engine.mdd_path / 'exemples_metier' / 'cas_test_audit_maison_1_latest_valid.xml'))
+    audit = etree.parse(f, parser)
+    logements = list(audit.iterfind('*//logement'))
+    murs = [logement.find('*//mur/donnee_entree/enum_type_isolation_id') for logement in logements[:2]]
+    report = ReportAudit()
+    for i in range(3):
+        report.generate_msg(f'message {i}', msg_type='warning_saisie', msg_theme='missing_required_element',
+                            related_objects=murs, msg_importance='major')
+    report.enrich_issues_message_and_meta_data(audit, msg_importance, engine)
+    expected_etapes = {ReportAudit.get_etape_and_scenario(el, engine) for el in murs}
+    assert (len(expected_etapes) == 2 and None not in expected_etapes)
+    for issue in report.warning_input:
+        # chaque message est enrichi du même contexte, calculé une seule fois par objet et par logement
+        assert (issue['message'].split('\n', 1)[1] == report.warning_input[0]['message'].split('\n', 1)[1])
+        assert (all(etape in issue['message'] for etape in expected_etapes))
+        assert (issue['objets_concerne'] == [audit.getpath(el) for el in murs])
+
+
+def test_audit_graph():
+    engine = EngineAudit()
+    parser = etree.XMLParser(remove_blank_text=True)
+    f = str((engine.mdd_path / 'exemples_metier' / 'cas_test_audit_maison_1_latest_valid.xml'))
+    audit = etree.parse(f, parser)
+    index = DocumentIndex(audit)
+    report = ReportAudit()
+    report.document_index = index
+    audit_graph = get_audit_graph(audit, index)
+    # construit une seule fois par audit lorsque l'index est partagé
+    assert (get_audit_graph(audit, index) is audit_graph)
+    all_caracteristique_generale = list(audit.iterfind('*//caracteristique_generale'))
+    assert ([etape.caracteristique_generale for etape in audit_graph.etapes] == all_caracteristique_generale)
+    for etape in audit_graph.etapes:
+        assert (etape.scenario_id == etape.caracteristique_generale.find('enum_scenario_id').text)
+        assert (etape.logement.tag == 'logement')
+        if etape.etape_travaux is not None:
+            for name in ['ep_conso_5_usages_m2_gain', 'facture_gain']:
+                assert (etape.etape_travaux_value(name) == float(etape.etape_travaux.find(name).text))
+            assert (etape.lot_travaux == list(etape.etape_travaux.iterfind('*//enum_lot_travaux_audit_id')))
+    assert (sum(len(etapes) for etapes in audit_graph.etapes_by_scenario().values()) == len(all_caracteristique_generale))
+    assert (('0', '0') in audit_graph.etapes_by_scenario_etape())
+    # sans index partagé le graphe suit les modifications du document
+    assert (get_audit_graph(audit, lxml_lookup) is not get_audit_graph(audit, lxml_lookup))
+    engine.controle_coherence_etape_finale(audit, report)
+    engine.controle_coherence_gain_cumule(audit, report)
+    assert (len(report.error_input) == 0)
+    assert (len(report.error_software) == 0)
+
+
+def test_audit_logements_pool(monkeypatch):
+    _set_version_audit_to_valid_dates()
+    engine = EngineAudit()
+    parser = etree.XMLParser(remove_blank_text=True)
+    f = str((engine.mdd_path / 'exemples_metier' / 'cas_test_audit_maison_1_latest_valid.xml'))
+    audit = etree.parse(f, parser)
+    assert (len(list(audit.iterfind('*//logement'))) > 1)
+    report_serie = engine.run_controle_coherence(copy.deepcopy(audit))
+    assert (len(report_serie['warning_saisie']) > 0)
+
+    monkeypatch.setenv('OBS_DPE_AUDIT_PROCESSES', '2')
+    monkeypatch.setenv('OBS_DPE_AUDIT_PROCESSES_MIN_LOGEMENTS', '1')
+    try:
+        report_pool = engine.run_controle_coherence(copy.deepcopy(audit))
+    finally:
+        shutdown_pool()
+    assert (report_pool == report_serie)
+
+
+def test_run_batch():
+    _set_version_dpe_to_valid_dates()
+    _set_version_audit_to_valid_dates()
+    mdd_path = EngineDPE().mdd_path
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.write(mdd_path / 'exemples_metier' / 'cas_test_appt_1.xml', 'cas_test_appt_1.xml')
+        archive.write(mdd_path / 'exemples_metier' / 'cas_test_audit_maison_1_latest_valid.xml', 'audit/cas_test_audit.xml')
+        archive.writestr('bad_content.xml', 'bad_content')
+        archive.writestr('autre.xml', '<autre></autre>')
+    buffer.seek(0)
+    with open(mdd_path / 'exemples_metier' / 'cas_test_appt_1.xml', 'rb') as xml_file:
+        files = [('lot.zip', buffer), ('cas_test_appt_1.xml', xml_file)]
+        lines = list(run_batch(iter_batch_documents(files), workers=2, max_in_flight=2))
+    lines = {line['index']: line for line in lines}
+    assert (sorted(lines) == [0, 1, 2, 3, 4])
+    assert (lines[0]['nom_fichier'] == 'lot.zip/cas_test_appt_1.xml')
+    # aiguillage par balise racine
+    assert (lines[0]['status'] == 200 and 'moteur_coherence_version' in lines[0]['rapport'])
+    assert (lines[1]['status'] == 200 and 'controle_coherence_audit_version' in lines[1]['rapport'])
+    # les erreurs d'un document n'interrompent pas le lot
+    assert (lines[2]['status'] == 400 and lines[3]['status'] == 400)
+    assert (lines[4]['status'] == 200)
+    assert (lines[4]['rapport'] == lines[0]['rapport'])
+
+    # membre corrompu (crc) et archive impossible à ouvrir : une ligne d'erreur chacun, le reste du lot est contrôlé
+    xml_string = (mdd_path / 'exemples_metier' / 'cas_test_appt_1.xml').read_bytes()
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name in ['a.xml', 'b.xml', 'c.xml']:
+            archive.writestr(name, xml_string.replace(b'<dpe', f'<!-- {name} --><dpe'.encode(), 1))
+    corrupted = buffer.getvalue().replace(b'<!-- b.xml -->', b'<!-- b.XML -->')
+    broken = corrupted.replace(b'PK\x01\x02', b'XX\x01\x02')
+    files = [('lot.zip', io.BytesIO(corrupted)), ('casse.zip', io.BytesIO(broken)),
+             ('cas_test_appt_1.xml', io.BytesIO(xml_string))]
+    lines = list(run_batch(iter_batch_documents(files), workers=2, max_in_flight=2))
+    lines = {line['index']: line for line in lines}
+    assert (sorted(lines) == [0, 1, 2, 3, 4])
+    assert ([lines[i]['nom_fichier'] for i in range(5)] ==
+            ['lot.zip/a.xml', 'lot.zip/b.xml', 'lot.zip/c.xml', 'casse.zip', 'cas_test_appt_1.xml'])
+    assert ([lines[i]['status'] for i in range(5)] == [200, 400, 200, 400, 200])
+    assert ('impossible de lire' in lines[1]['erreur'] and 'impossible de lire' in lines[3]['erreur'])
+
+
+def test_validation_worker_pool(monkeypatch):
+    _set_version_dpe_to_valid_dates()
+    _set_version_audit_to_valid_dates()
+    mdd_path = EngineDPE().mdd_path
+    data = (mdd_path / 'exemples_metier' / 'cas_test_audit_maison_1_latest_valid.xml').read_bytes()
+    monkeypatch.setenv('OBS_DPE_AUDIT_PROCESSES', '4')
+    pool = ValidationWorkerPool(nb_workers=1, queue_size=0)
+    try:
+        # pas de pool des contrôles par logement dans les workers
+        assert (get_audit_processes() == 4)
+        assert (pool.run(get_audit_processes) == 0)
+        # rapport identique à celui calculé dans le process principal
+        assert (pool.run(validation_xml_data, data, 'audit') == validation_xml_data(data, 'audit'))
+        status, error = pool.run(validation_xml_data, b'bad_content', 'dpe')
+        assert (status == 400)
+        # file d'attente pleine
+        future = pool.submit(time.sleep, 1)
+        with pytest.raises(QueueFull):
+            pool.submit(time.sleep, 1)
+        future.result()
+        assert (pool.submit(time.sleep, 0, block=True).result() is None)
+    finally:
+        pool.shutdown()
+
+
+def _worker_versions_cfg():
+    return os.getpid(), versions_dpe_cfg, versions_audit_cfg
+
+
+def _sorted_lines(value):
+    # objets concernés listés dans l'ordre d'un set : ordre variable d'un process non forké à l'autre (hash des str)
+    if isinstance(value, str):
+        return sorted(value.splitlines())
+    if isinstance(value, dict):
+        return {k: _sorted_lines(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_sorted_lines(v) for v in value]
+    return value
+
+
+def test_validation_worker_pool_restart():
+    # worker tué : pool redémarré sans fork, avec les dates de validité du process principal
+    _set_version_dpe_to_valid_dates()
+    _set_version_audit_to_valid_dates()
+    mdd_path = EngineDPE().mdd_path
+    data = (mdd_path / 'exemples_metier' / 'cas_test_audit_maison_1_latest_valid.xml').read_bytes()
+    pool = ValidationWorkerPool(nb_workers=1, queue_size=0)
+    try:
+        pid, _, _ = pool.run(_worker_versions_cfg)
+        os.kill(pid, 9)
+        for _ in range(100):
+            try:
+                pool.run(_worker_versions_cfg)
+            except Exception:
+                break
+            time.sleep(0.05)
+        assert (pool.executor._mp_context.get_start_method() in ['forkserver', 'spawn'])
+        new_pid, versions_dpe, versions_audit = pool.run(_worker_versions_cfg)
+        assert (new_pid != pid)
+        assert ((versions_dpe, versions_audit) == (versions_dpe_cfg, versions_audit_cfg))
+        assert (_sorted_lines(pool.run(validation_xml_data, data, 'audit')) ==
+                _sorted_lines(validation_xml_data(data, 'audit')))
+    finally:
+        pool.shutdown()
+        _restore_version_dpe_cfg()
+        _restore_version_audit_cfg()
+
+
+def test_report_cache():
+    cache = ReportCache(max_entries=2, max_bytes=1000, ttl=3600)
+    calls = list()
+
+    def compute(value):
+        def func():
+            calls.append(value)
+            return value
+        return func
+
+    assert (cache.get_or_compute('a', compute({'a': 1})) == {'a': 1})
+    assert (cache.get_or_compute('a', compute({'a': 2})) == {'a': 1})
+    assert (calls == [{'a': 1}])
+    # LRU : b est évincé au profit de c car a a été relu
+    cache.get_or_compute('b', compute({'b': 1}))
+    cache.get_or_compute('a', compute({'a': 2}))
+    cache.get_or_compute('c', compute({'c': 1}))
+    assert (list(cache.entries) == ['a', 'c'])
+    # résultats non cachables et trop volumineux
+    cache.get_or_compute('d', compute((500, 'erreur')), cacheable=lambda result: result[0] == 200)
+    cache.get_or_compute('e', compute('x' * 2000))
+    assert ('d' not in cache.entries and 'e' not in cache.entries)
+    stats = cache.stats()
+    assert (stats['hits'] == 2 and stats['misses'] == 5 and stats['evictions'] == 1)
+    assert (stats['bytes'] == sum(size for expires_at, size, value in cache.entries.values()))
+    # TTL
+    cache.ttl = -1
+    cache.get_or_compute('f', compute('f'))
+    cache.get_or_compute('f', compute('f'))
+    assert (calls.count('f') == 2)
+
+    # déduplication des calculs simultanés d'une même clé
+    cache = ReportCache()
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        calls.append('slow')
+        return 'slow'
+
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(cache.get_or_compute, 'g', slow)]
+        started.wait(5)
+        futures += [executor.submit(cache.get_or_compute, 'g', slow) for _ in range(3)]
+        while cache.stats()['shared'] < 3:
+            time.sleep(0.01)
+        release.set()
+        assert ([future.result() for future in futures] == ['slow'] * 4)
+    assert (calls.count('slow') == 1)
+
+    # une erreur de calcul est propagée et n'est pas mise en cache
+    with pytest.raises(ValueError):
+        cache.get_or_compute('h', lambda: int('x'))
+    assert (cache.get_or_compute('h', lambda: 1) == 1)
+
+    key = report_cache_key(b'<dpe/>', 'controle_coherence', datetime_now='2026-01-01T10:00:00')
+    assert (key == report_cache_key(b'<dpe/>', 'controle_coherence', datetime_now='2026-01-01T18:00:00'))
+    assert (key != report_cache_key(b'<dpe/>', 'controle_coherence', datetime_now='2026-01-02'))
+    assert (key != report_cache_key(b'<dpe/>', 'controle_coherence_audit', datetime_now='2026-01-01'))
+    assert (key != report_cache_key(b'<dpe></dpe>', 'controle_coherence', datetime_now='2026-01-01'))
+
+
+def test_xsd_validator_pool_concurrent():
+    engine = EngineDPE()
+    parser = etree.XMLParser(remove_blank_text=True)
+    dpe_valid = etree.parse(str(engine.mdd_path / 'exemples_metier' / 'cas_test_maison_1_valid.xml'), parser)
+    dpe_invalid = copy.deepcopy(dpe_valid)
+    dpe_invalid.find('*//surface_habitable_logement').text = 'texte'
+    pool = XsdValidatorPool(engine._xsd_path(dpe_valid.find('*//enum_version_id').text), max_idle=2)
+    expected = [pool.validate(dpe_valid), pool.validate(dpe_invalid)]
+    assert (expected[0] == (True, ''))
+    assert (expected[1][0] is False and 'surface_habitable_logement' in expected[1][1])
+
+    # validations simultanées : chaque résultat a son propre error_log
+    cases = [0, 1] * 20
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(lambda i: pool.validate(copy.deepcopy([dpe_valid, dpe_invalid][i])), cases))
+    assert (results == [expected[i] for i in cases])
+    assert (len(pool._idle) <= 2)
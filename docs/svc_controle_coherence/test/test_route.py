@@ -3,6 +3,7 @@ from pathlib import Path
 import lxml
 from lxml import etree
 import os
+import json
 import re
 import pytest
 import requests
@@ -13,6 +14,7 @@ from test_traducteur_xml import VALID_EXPORTED_DPE_CASE, VALID_EXPORTED_AUDIT_CA
 from test_controle_coherence import VALID_CASES_AUDIT, VALID_CASES_DPE, VALID_CASES_DPE_N_MOINS_1, VALID_CASES_AUDIT_N_MOINS_1
 from controle_coherence.controle_coherence import EngineDPE, EngineAudit
 import itertools
+import time
 
 URLS_AUDIT = ["http://localhost:5000/controle_coherence_audit", "http://localhost:5000/controle_coherence_audit_test_1_janvier_2026"]
 
@@ -206,6 +208,27 @@ def test_additional_routes():
     assert (dpe_traduit.find('*//enum_modele_dpe_id').text == 'dpe 3cl 2021 méthode logement')
 
 
+def test_route_batch():
+    _set_version_dpe_to_valid_dates()
+    _set_version_audit_to_valid_dates()
+    url = "http://localhost:5000/controle_coherence_batch"
+    mdd_path = EngineDPE().mdd_path
+    files = [('xml', (cas_test_valide, open(mdd_path / 'exemples_metier' / cas_test_valide, 'rb')))
+             for cas_test_valide in VALID_CASES_DPE[:2] + VALID_CASES_AUDIT[:2]]
+    files.append(('xml', ('bad_content.xml', b'bad_content')))
+    r = requests.post(url, files=files, stream=True)
+    assert (r.status_code == 200)
+    assert (r.headers['Content-Type'] == 'application/x-ndjson')
+    lines = [json.loads(line) for line in r.iter_lines() if line]
+    assert (sorted(line['index'] for line in lines) == [0, 1, 2, 3, 4])
+    for line in lines:
+        if line['nom_fichier'] == 'bad_content.xml':
+            assert (line['status'] == 400)
+        else:
+            assert (line['status'] == 200)
+            assert (line['rapport']['erreur_logiciel'] + line['rapport']['erreur_saisie'] == [])
+
+
 @pytest.mark.parametrize("cas_test_valide", VALID_CASES_DPE + VALID_EXPORTED_DPE_CASE)
 def test_route_traduction_xml_dpe(cas_test_valide):
     xml_folder = Path('.').parent / 'excel_folder'
@@ -348,3 +371,51 @@ def test_controle_blocage_reseau_20_septembre():
 
     assert (len(errors) > 0)
     assert (resp['validation_xsd']['valid'] == True)
+
+
+@pytest.mark.parametrize("cas_test_valide", VALID_EXPORTED_AUDIT_CASE[:1] + VALID_EXPORTED_DPE_CASE[:1])
+def test_route_traduction_xml_excel_async(cas_test_valide):
+    url = "http://localhost:5000"
+    mdd_path = EngineDPE().mdd_path
+    with open(mdd_path / 'exemples_metier' / cas_test_valide, 'rb') as f:
+        xml_string = f.read()
+    route = '/traduction_xml_to_excel_audit_async' if cas_test_valide in VALID_EXPORTED_AUDIT_CASE else '/traduction_xml_to_excel_dpe_async'
+    r = requests.post(url + route, data=xml_string)
+    if not requests.get(url + '/jobs').json()['msg']['enabled']:
+        # service démarré sans OBS_DPE_EXPORT_WORKERS
+        assert (r.status_code == 503)
+        pytest.skip('exports excel asynchrones désactivés')
+    assert (r.status_code == 202)
+    job_url = url + r.headers['Location']
+    assert (r.json()['status'] in ['en_attente', 'en_cours'])
+    for _ in range(600):
+        r = requests.get(job_url)
+        if r.status_code != 202:
+            break
+        time.sleep(0.1)
+    assert (r.status_code == 200)
+    assert (re.findall("filename=(.+)", r.headers['content-disposition'])[0].endswith('.xlsx'))
+    assert (len(r.content) > 0)
+    assert (requests.get(url + '/jobs').json()['msg']['soumis'] >= 1)
+    r = requests.get(url + '/jobs/inconnu')
+    assert (r.status_code == 404)
+
+
+def test_route_controle_coherence_queue_full():
+    # service démarré en mode multi-process avec les mêmes NB_WORKERS / QUEUE_SIZE que ce test
+    nb_workers = int(os.environ.get("NB_WORKERS", 0))
+    if nb_workers == 0:
+        pytest.skip('service démarré sans NB_WORKERS')
+    queue_size = int(os.environ.get("QUEUE_SIZE", 2 * nb_workers))
+    from concurrent.futures import ThreadPoolExecutor
+    mdd_path = EngineDPE().mdd_path
+    xml_string = (mdd_path / 'exemples_metier' / VALID_CASES_AUDIT[0]).read_bytes()
+    nb_requests = 2 * (nb_workers + queue_size) + 4
+    # xml tous différents : pas de rapport en cache ni de contrôle partagé entre requêtes simultanées
+    datas = [xml_string + f'<!-- {i} {time.time()} -->'.encode() for i in range(nb_requests)]
+    with ThreadPoolExecutor(nb_requests) as executor:
+        responses = list(executor.map(lambda data: requests.post(URLS_AUDIT[0], data=data), datas))
+    status_codes = [r.status_code for r in responses]
+    assert (set(status_codes) == {200, 503})
+    assert (status_codes.count(200) >= nb_workers)
+    assert (all('Retry-After' in r.headers for r in responses if r.status_code == 503))
@@ -5,9 +5,11 @@ import time
 import logging
 from pathlib import Path
 from test_controle_coherence import _set_version_dpe_to_valid_dates
-from controle_coherence.utils_convert_excel import traduction_xml_excel, cleanup_excel_folder
+from controle_coherence.utils_convert_excel import traduction_xml_excel_buffer, write_xml_excel
 from controle_coherence.utils import traduction_xml_new_element
 import pytest
+import openpyxl
+import pandas as pd
 VALID_EXPORTED_DPE_CASE = [
     "2292E1204763Q.xml", '2294T0304804M.xml', '2193N0000135D.xml', '2193N0000155X.xml','2100E0110064G_v1.xml','2101E0880267M_v1.xml',
                            '2254N3226633T.xml',
@@ -27,18 +29,14 @@ def test_traduction_xml_excel_dpe(xml_name):
     _set_version_dpe_to_valid_dates()
     engine = EngineDPE()
     parser = etree.XMLParser(remove_blank_text=True,recover=True)
-    excel_folder = Path('excel_folder')
-    excel_folder.mkdir(exist_ok=True, parents=True)
-
-    number_of_xlsx_in_folder_before = len([i for i in excel_folder.iterdir() if ".xlsx" in i.name])
     logging.info(xml_name)
     f = str((engine.mdd_path / 'exemples_metier' / xml_name))
     xml = etree.parse(f, parser)
-    response = traduction_xml_excel(xml, excel_folder)
-    number_of_xlsx_in_folder = len([i for i in excel_folder.iterdir() if ".xlsx" in i.name])
-    # Check if a new XLSX file has been generated
-    assert number_of_xlsx_in_folder == number_of_xlsx_in_folder_before + 1
-    number_of_xlsx_in_folder_before = number_of_xlsx_in_folder
+    buffer = traduction_xml_excel_buffer(xml)
+    # Check if a valid XLSX file has been generated
+    sheet_names = openpyxl.load_workbook(buffer).sheetnames
+    buffer.close()
+    assert (sheet_names[0] == 'administratif' and sheet_names[-1] == 'lexique')
 @pytest.mark.parametrize("xml_name",VALID_EXPORTED_DPE_CASE)
 def test_traduction_xml_traduit_dpe(xml_name):
 
@@ -70,27 +68,274 @@ def test_traduction_xml_excel_audit(xml_name):
     _set_version_dpe_to_valid_dates()
     engine = EngineAudit()
     parser = etree.XMLParser(remove_blank_text=True,recover=True)
-    excel_folder = Path('excel_folder')
-    excel_folder.mkdir(exist_ok=True, parents=True)
-
-    number_of_xlsx_in_folder_before = len([i for i in excel_folder.iterdir() if ".xlsx" in i.name])
     f = str((engine.mdd_path / 'exemples_metier' / xml_name))
     xml = etree.parse(f, parser)
-    response = traduction_xml_excel(xml, excel_folder)
-    number_of_xlsx_in_folder = len([i for i in excel_folder.iterdir() if ".xlsx" in i.name])
-    # Check if a new XLSX file has been generated
-    assert number_of_xlsx_in_folder == number_of_xlsx_in_folder_before + 1
-    number_of_xlsx_in_folder_before = number_of_xlsx_in_folder
+    buffer = traduction_xml_excel_buffer(xml)
+    # Check if a valid XLSX file has been generated
+    sheet_names = openpyxl.load_workbook(buffer).sheetnames
+    buffer.close()
+    assert (sheet_names[0] == 'administratif' and sheet_names[-1] == 'lexique')
+    assert (any(name.startswith('scenario_') for name in sheet_names))
 
 
+def test_export_job_store_evict_expired(tmp_path):
+    # exports conservés ttl secondes puis supprimés du dossier du store
+    from controle_coherence.export_jobs import ExportJobStore
+    from controle_coherence.worker_pool import ValidationWorkerPool
+    _set_version_dpe_to_valid_dates()
+    mdd_path = EngineDPE().mdd_path / 'exemples_metier'
+    store = ExportJobStore(tmp_path, ValidationWorkerPool(1, 2), ttl=3600)
+    try:
+        jobs = [store.submit((mdd_path / xml_name).read_bytes(), xml_name)
+                for xml_name in [VALID_EXPORTED_AUDIT_CASE[0], VALID_EXPORTED_DPE_CASE[0]]]
+        while store.stats()['termines'] < 2:
+            time.sleep(0.01)
+        assert (store.evict_expired() == 0)
+        assert (sorted(tmp_path.iterdir()) == sorted(job.file_path for job in jobs))
+        store.ttl = 0
+        assert (store.evict_expired() == 2)
+        assert (list(tmp_path.iterdir()) == [])
+    finally:
+        store.shutdown()
+
 
-def test_cleanup_excel_folder():
+@pytest.mark.parametrize("xml_name", [VALID_EXPORTED_DPE_CASE[0], VALID_EXPORTED_AUDIT_CASE[0]])
+def test_traduction_xml_excel_buffer(xml_name, monkeypatch, tmp_path):
+    _set_version_dpe_to_valid_dates()
+    engine = EngineDPE()
+    parser = etree.XMLParser(remove_blank_text=True, recover=True)
     excel_folder = Path('excel_folder')
     excel_folder.mkdir(exist_ok=True, parents=True)
-    test_traduction_xml_excel_audit(VALID_EXPORTED_AUDIT_CASE[0])
-    test_traduction_xml_excel_dpe(VALID_EXPORTED_DPE_CASE[0])
-    len_excel = len([el for el in excel_folder.iterdir()])
-    cleanup_excel_folder(excel_folder, delat_t_delete=3600)
-    assert (len([el for el in excel_folder.iterdir()]) == len_excel)
-    cleanup_excel_folder(excel_folder, delat_t_delete=0)
-    assert (len([el for el in excel_folder.iterdir()]) == 0)
+    f = str((engine.mdd_path / 'exemples_metier' / xml_name))
+    file_path = tmp_path / 'export.xlsx'
+    write_xml_excel(etree.parse(f, parser), file_path)
+    expected = {ws.title: list(ws.values) for ws in openpyxl.load_workbook(file_path)}
+
+    files_before = sorted(excel_folder.iterdir())
+    # tampon déporté sur disque (fichier temporaire anonyme) au-delà de 1 ko
+    monkeypatch.setenv('OBS_DPE_EXCEL_SPOOL_MAX_SIZE', '1024')
+    buffer = traduction_xml_excel_buffer(etree.parse(f, parser))
+    assert (buffer.tell() == 0)
+    assert ({ws.title: list(ws.values) for ws in openpyxl.load_workbook(buffer)} == expected)
+    buffer.close()
+    # aucun fichier écrit dans le dossier partagé
+    assert (sorted(excel_folder.iterdir()) == files_before)
+
+
+def _workbook_cells(buffer):
+    # valeurs, formats des cellules et largeurs des colonnes de chaque feuille
+    workbook = openpyxl.load_workbook(buffer)
+    return {ws.title: ([(c.coordinate, c.value, c.font.b, c.alignment.wrap_text, c.alignment.horizontal,
+                         c.number_format, c.fill.fgColor.rgb, c.border.left.style) for row in ws.iter_rows() for c in row],
+                       {k: (v.min, v.max, v.width) for k, v in ws.column_dimensions.items()})
+            for ws in workbook.worksheets}
+
+
+def test_traduction_xml_excel_buffer_constant_memory(monkeypatch):
+    # audit agrandi (murs dupliqués dans chaque logement) : export en mode constant_memory identique à l'export
+    # construit entièrement en mémoire
+    import xlsxwriter
+    _set_version_dpe_to_valid_dates()
+    engine = EngineAudit()
+    parser = etree.XMLParser(remove_blank_text=True, recover=True)
+    xml = etree.parse(str(engine.mdd_path / 'exemples_metier' / VALID_EXPORTED_AUDIT_CASE[0]), parser)
+    for mur_collection in xml.iterfind('*//mur_collection'):
+        murs = list(mur_collection)
+        for i in range(50):
+            mur_collection.extend(etree.fromstring(etree.tostring(mur)) for mur in murs)
+    data = etree.tostring(xml)
+    buffer = traduction_xml_excel_buffer(etree.ElementTree(etree.fromstring(data, parser)))
+    cells = _workbook_cells(buffer)
+    buffer.close()
+    assert (len(cells['scenario_0_etape_0'][0]) > 10000)
+
+    workbook_class = xlsxwriter.Workbook
+    monkeypatch.setattr(xlsxwriter, 'Workbook', lambda output, options: workbook_class(output))
+    buffer = traduction_xml_excel_buffer(etree.ElementTree(etree.fromstring(data, parser)))
+    assert (cells == _workbook_cells(buffer))
+    buffer.close()
+
+
+def test_excel_table_layout():
+    # mise en page identique à pandas.DataFrame.to_excel : en-têtes de colonnes en ligne currow, noms de lignes en
+    # colonne A, noms absents du xsd en premier, cellules vides pour les valeurs absentes
+    import io
+    import xlsxwriter
+    from controle_coherence.utils import get_names_rank
+    from controle_coherence.utils_convert_excel import (ExcelTable, convert_element_to_table, concat_tables,
+                                                         reorder_table, dump_table_to_excel)
+    names_rank = get_names_rank(['b', 'a', 'c', 'a'])
+    mur_0 = etree.fromstring('<mur><donnee_entree><a>1,5</a><hors_xsd>x</hors_xsd><b>2</b></donnee_entree>'
+                             '<donnee_intermediaire><c>3.0</c></donnee_intermediaire></mur>')
+    mur_1 = etree.fromstring('<mur><a>4</a><d>nan</d></mur>')
+    table = convert_element_to_table(mur_0, names_rank)
+    assert (table.index == ['hors_xsd', 'b', 'a', 'c'])
+    assert (table.data == [{'a': '1.5', 'hors_xsd': 'x', 'b': '2', 'c': '3.0'}])
+    table = reorder_table(concat_tables([table, convert_element_to_table(mur_1, names_rank)]), names_rank)
+    assert (table.index == ['hors_xsd', 'd', 'b', 'a', 'c'])
+    assert (table.T.index == ['mur', 'mur'])
+
+    buffer = io.BytesIO()
+    workbook = xlsxwriter.Workbook(buffer)
+    current_config = {'workbook': workbook, 'sheets': dict(), 'sheet_name': 'logement',
+                      'header_format': workbook.add_format({'bold': True}),
+                      'index_header_format': workbook.add_format({'bold': True}),
+                      'index_format': workbook.add_format({'bold': True}),
+                      'content_format': workbook.add_format({'text_wrap': True})}
+    table.columns = ['mur_0', 'mur_1']
+    currow, max_col = dump_table_to_excel(ExcelTable(columns=['mur']), 0, 0, current_config)
+    currow, max_col = dump_table_to_excel(table, currow, max_col, current_config)
+    assert ((currow, max_col) == (9, 2))
+    workbook.close()
+    assert (list(openpyxl.load_workbook(buffer)['logement'].values) == [
+        (None, 'mur', None),
+        (None, None, None),
+        (None, 'mur_0', 'mur_1'),
+        ('hors_xsd', 'x', None),
+        ('d', None, None),
+        ('b', '2', None),
+        ('a', '1.5', '4'),
+        ('c', '3.0', None)])
+
+
+def test_excel_export_metadata():
+    from controle_coherence.utils import excel_export_metadata
+    export_metadata = excel_export_metadata(['enum_b_id', 'a', 'b', 'enum_c_id'],
+                                            {'enum_c_id': 'doc c', 'a': 'doc a', 'enum_b_id': 'doc b'})
+    assert (export_metadata['names_rank'] == {'enum_b_id': 0, 'a': 1, 'b': 2, 'enum_c_id': 3})
+    assert (export_metadata['names_rank_traduit'] == {'b': 0, 'a': 1, 'c': 3})
+    assert (export_metadata['lexique_rows'] == [['a', 'doc a'], ['b', 'doc b'], ['c', 'doc c']])
+
+    # calculées une seule fois par version de xsd et partagées par tous les exports
+    engine = EngineAudit()
+    last_version = list(engine.xsd_metadata)[-1]
+    assert (engine.xsd_metadata[last_version]['excel_export'] is engine.xsd_metadata[last_version]['excel_export'])
+    lexique_rows = engine.xsd_metadata[last_version]['excel_export']['lexique_rows']
+    assert (len(lexique_rows) > 0)
+    assert ([name for name, documentation in lexique_rows] == sorted(name for name, documentation in lexique_rows))
+
+
+def test_export_job_store(tmp_path):
+    from controle_coherence.export_jobs import ExportJobStore
+    from controle_coherence.worker_pool import ValidationWorkerPool
+    _set_version_dpe_to_valid_dates()
+    engine = EngineDPE()
+    f = engine.mdd_path / 'exemples_metier' / VALID_EXPORTED_DPE_CASE[0]
+    data = f.read_bytes()
+    expected = {ws.title: list(ws.values) for ws in openpyxl.load_workbook(
+        traduction_xml_excel_buffer(etree.parse(str(f), etree.XMLParser(remove_blank_text=True, recover=True))))}
+
+    (tmp_path / 'ancien_export.xlsx').write_bytes(b'')
+    store = ExportJobStore(tmp_path, ValidationWorkerPool(1, 2), ttl=3600)
+    try:
+        # dossier vidé à la création
+        assert (list(tmp_path.iterdir()) == [])
+        job = store.submit(data, 'numero')
+        job_erreur = store.submit(b'bad_content', 'numero_erreur')
+        assert (job.status in ['en_attente', 'en_cours'])
+        job.future.result()
+        job_erreur.future.result()
+        while store.stats()['termines'] + store.stats()['erreurs'] < 2:  # callbacks exécutés après le résultat
+            time.sleep(0.01)
+        assert (store.get(job.job_id).status == 'termine')
+        assert ({ws.title: list(ws.values) for ws in openpyxl.load_workbook(job.file_path)} == expected)
+        # fichier ouvert avant sa suppression : toujours lisible
+        job_ouvert, file = store.open_export(job.job_id)
+        assert (job_ouvert is job)
+        assert (store.open_export(job_erreur.job_id) == (job_erreur, None))
+        assert (store.get(job_erreur.job_id).status == 'erreur')
+        assert ('ERREUR INTERNE' in job_erreur.as_dict()['erreur'])
+        stats = store.stats()
+        assert (stats['soumis'] == 2 and stats['en_attente'] + stats['en_cours'] == 0)
+        assert (stats['bytes'] == job.file_path.stat().st_size)
+        assert (stats['duree_construction_max'] >= job.as_dict()['duree_construction'] > 0)
+
+        # taille bornée : les exports terminés les plus anciens sont supprimés
+        store.max_bytes = 0
+        assert (store.evict_expired() == 1)
+        assert (store.get(job.job_id) is None)
+        assert (list(tmp_path.iterdir()) == [])
+        with file:
+            assert ({ws.title: list(ws.values) for ws in openpyxl.load_workbook(file)} == expected)
+        assert (store.open_export(job.job_id) == (None, None))
+
+        # durée de conservation
+        store.max_bytes = 512 * 1024 ** 2
+        store.ttl = 0
+        job = store.submit(data, 'numero')
+        job.future.result()
+        while store.get(job.job_id) is not None:
+            time.sleep(0.01)
+        assert (list(tmp_path.iterdir()) == [])
+    finally:
+        store.shutdown()
+
+
+def test_export_job_store_missing_file(tmp_path):
+    # export terminé dont le fichier a disparu : job en erreur, plus en attente
+    from concurrent.futures import Future
+    from controle_coherence.export_jobs import ExportJobStore, ExportJob
+    store = ExportJobStore(tmp_path, pool=None)
+    job = ExportJob('job', 'numero', tmp_path / 'job.xlsx')
+    store.jobs[job.job_id] = job
+    future = Future()
+    future.set_result({'debut': job.submitted_at, 'fin': time.time()})
+    store._on_done(job, future)
+    assert (job.status == 'erreur')
+    assert ('export introuvable' in job.as_dict()['erreur'])
+    stats = store.stats()
+    assert (stats['erreurs'] == 1 and stats['en_attente'] == 0 and stats['bytes'] == 0)
+
+
+def test_corpus_parquet_flatten_batch(tmp_path):
+    from controle_coherence.corpus_parquet import get_corpus_schema, flatten_batch, get_key_columns
+    _set_version_dpe_to_valid_dates()
+    engines = {'dpe': EngineDPE(), 'audit': EngineAudit()}
+    corpus_schema = get_corpus_schema(engines)
+    # colonnes typées d'après le xsd, libellé de l'énumérateur à côté de son id
+    assert (corpus_schema['dpe']['mur']['surface_paroi_opaque'] == 'Float64')
+    assert (corpus_schema['dpe']['mur']['enum_type_adjacence_id'] == 'Int64')
+    assert (corpus_schema['dpe']['mur']['type_adjacence'] == 'string')
+
+    mdd_path = engines['dpe'].mdd_path / 'exemples_metier'
+    bad_file = tmp_path / 'bad_content.xml'
+    bad_file.write_bytes(b'bad_content')
+    paths = [mdd_path / VALID_EXPORTED_DPE_CASE[0], mdd_path / VALID_EXPORTED_AUDIT_CASE[0], bad_file]
+    tables, nb_documents, errors = flatten_batch(paths, corpus_schema, engines)
+    assert (nb_documents == 2)
+    assert ([file_name for file_name, error in errors] == [str(bad_file)])
+    for (dispositif, component), df in tables.items():
+        columns = {**get_key_columns(dispositif, component), **corpus_schema[dispositif][component]}
+        assert (list(df.columns) == list(columns))
+        assert ({name: str(dtype) for name, dtype in df.dtypes.items()} ==
+                {name: str(pd.Series(dtype=dtype).dtype) for name, dtype in columns.items()})
+
+    # mêmes composants et libellés que la traduction du xml
+    parser = etree.XMLParser(remove_blank_text=True, recover=True)
+    xml_traduit = traduction_xml_new_element(etree.parse(str(paths[0]), parser), engines['dpe'])
+    murs = list(xml_traduit.find('logement').iterfind('*//mur'))
+    df = tables[('dpe', 'mur')]
+    assert (df['numero_dpe'].unique().tolist() == [xml_traduit.findtext('numero_dpe')])
+    assert (df['rang'].tolist() == list(range(len(murs))))
+    assert (df['type_adjacence'].tolist() == [mur.findtext('donnee_entree/type_adjacence') for mur in murs])
+    generateurs = tables[('audit', 'generateur_chauffage')]
+    assert (generateurs['rang_installation_chauffage'].notna().all())
+    assert (generateurs['logement'].str.match(r'scenario_\d+_etape_\d+').all())
+
+
+def test_corpus_parquet(tmp_path):
+    from controle_coherence.corpus_parquet import flatten_corpus
+    _set_version_dpe_to_valid_dates()
+    mdd_path = EngineDPE().mdd_path / 'exemples_metier'
+    corpus = tmp_path / 'corpus'
+    corpus.mkdir()
+    for xml_name in VALID_EXPORTED_DPE_CASE[:3] + VALID_EXPORTED_AUDIT_CASE[:2]:
+        (corpus / xml_name).write_bytes((mdd_path / xml_name).read_bytes())
+    stats = flatten_corpus([corpus], tmp_path / 'sequentiel', batch_size=2, processes=0)
+    assert (stats['documents'] == 5 and stats['erreurs'] == [])
+    stats_pool = flatten_corpus([corpus], tmp_path / 'pool', batch_size=2, processes=2)
+    assert (stats_pool == stats)
+    for name, nb_rows in stats['lignes'].items():
+        df = pd.read_parquet(tmp_path / 'pool' / name)
+        assert (len(df) == nb_rows)
+        assert (df.equals(pd.read_parquet(tmp_path / 'sequentiel' / name)))